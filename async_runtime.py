@@ -0,0 +1,197 @@
+import asyncio
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import requests
+
+import http_client
+import kline_store
+from candle_buffer import CandleBuffer
+from chandelier_exit import (
+    BINANCE_FUTURE_API_URL,
+    CEConfig,
+    ChandelierExitStrategy,
+    default_request_priority,
+    uses_future_api,
+)
+from logger import logger
+from rate_limit import get_budget, kline_request_weight
+
+# --- Constants ---
+
+BINANCE_SPOT_API_URL = "https://api.binance.com/api/v3/klines"
+
+# Requests in flight at once
+ASYNC_HTTP_POOL_SIZE = http_client.HTTP_POOL_SIZE
+
+# Seconds to wait before restarting a failed strategy, as in `run_strategy`
+RESTART_DELAY_SECONDS = 5
+
+# Seconds between checks that the market data hub process is still alive
+HUB_CHECK_SECONDS = 30
+
+
+class AsyncKlineClient:
+    """One pooled HTTP client for the kline endpoints of every strategy coroutine.
+
+    Requests go through the keep-alive sessions of `http_client`, whose connection pools are shared
+    by all coroutines; the blocking calls run on a bounded thread pool so the event loop never
+    waits on the network.
+    """
+
+    def __init__(self, exchange: str, pool_size: int = ASYNC_HTTP_POOL_SIZE):
+        self.exchange = exchange
+        self.executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix="kline-http")
+        self.weight = {"m1": 0}
+
+    def _get_klines(self, pair: str, time_frame: str, limit: int, priority: Optional[int] = None) -> List:
+        future = uses_future_api(self.exchange, pair)
+        if limit > 2:
+            klines = kline_store.fetch_history(pair, time_frame, limit, future, self._get_klines)
+            if klines:
+                return klines
+        url = BINANCE_FUTURE_API_URL if future else BINANCE_SPOT_API_URL
+        if future:
+            priority = default_request_priority(limit) if priority is None else priority
+            get_budget().acquire(kline_request_weight(limit), priority)
+        try:
+            res = http_client.get(url, params={"symbol": pair, "interval": time_frame, "limit": limit})
+            if future:
+                get_budget().record_response(res.status_code, res.headers)
+            res.raise_for_status()
+            self.weight["m1"] = int(res.headers.get("x-mbx-used-weight-1m", 0))
+            return res.json()
+        except requests.RequestException as e:
+            logger.error(f"Error Fetching Klines for {pair}: {e}")
+            raise
+
+    async def fetch_klines(self, pair: str, time_frame: str, limit: int, priority: Optional[int] = None) -> List:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self._get_klines, pair, time_frame, limit, priority)
+
+    def close(self) -> None:
+        self.executor.shutdown(wait=False)
+
+
+async def fetch_klines(
+    client: AsyncKlineClient, source, pair: str, time_frame: str, limit: int, priority: Optional[int] = None
+) -> List:
+    """Reads klines from the stream/hub source when it can answer, falling back to the pooled REST client.
+
+    `priority` is the weight budget priority of a REST call, by default that of `default_request_priority`.
+    """
+    if source is not None:
+        if limit > 2:
+            # A hub bootstrap blocks on a reply queue, keep it off the event loop
+            klines = await asyncio.to_thread(source.fetch_klines, pair, time_frame, limit)
+        else:
+            klines = source.fetch_klines(pair, time_frame, limit)
+        if klines:
+            return klines
+    return await client.fetch_klines(pair, time_frame, limit, priority)
+
+
+async def run_strategy_async(
+    token: str,
+    time_frame: str,
+    pair: str,
+    version: str,
+    time_sleep: int,
+    mode: str,
+    exchange: str,
+    client: AsyncKlineClient,
+    source=None,
+    charts=None,
+) -> None:
+    """Coroutine counterpart of `run_strategy`: runs one token's strategy and restarts it on failure."""
+    while True:
+        try:
+            logger.info(f"Starting strategy for {token} {time_frame} {pair}")
+            data = CandleBuffer(CEConfig.SIZE.value)
+            strategy = ChandelierExitStrategy(
+                data, token, time_frame, pair, version, time_sleep, mode, exchange, source, charts
+            )
+            strategy.kline_helper.weight = client.weight
+            klines, ema_klines = await asyncio.gather(
+                fetch_klines(client, source, pair, time_frame, strategy.size),
+                fetch_klines(client, source, pair, time_frame, strategy.ema_handler.size),
+            )
+            strategy.bootstrap(klines, ema_klines)
+
+            # --- Main Loop ---
+            while True:
+                latest_klines = await fetch_klines(client, source, pair, time_frame, 2, strategy.poll_priority())
+                if not strategy.update(latest_klines):
+                    break  # Restart the strategy
+                # Sending renders charts and calls the Telegram API, keep it off the event loop
+                await asyncio.to_thread(strategy.check_signals)
+                await asyncio.sleep(max(strategy.scheduler.next_wake(strategy.timestamp) - time.time(), 0.0))
+        except Exception:
+            logger.error(f"[{token}] Unhandled exception in strategy: {traceback.format_exc()}")
+            await asyncio.sleep(RESTART_DELAY_SECONDS)
+        finally:
+            logger.info(f"[{token}] Restarting strategy coroutine...")
+
+
+async def watch_hub(hub) -> None:
+    """Restarts the market data hub process when it dies, as the process runtime does."""
+    while True:
+        await asyncio.sleep(HUB_CHECK_SECONDS)
+        if not hub.is_alive():
+            logger.warning("Market data hub stopped. Restarting...")
+            hub.start()
+
+
+async def run_all(
+    strategies: Sequence[Tuple[str, str, str]],
+    version: str,
+    time_sleep: int,
+    mode: str,
+    exchange: str,
+    sources: Optional[Dict[str, object]] = None,
+    hub=None,
+    charts: Optional[Dict[str, object]] = None,
+) -> None:
+    """Runs every (token, time_frame, pair) strategy as a coroutine of one event loop.
+
+    `sources` maps (token, time_frame) to the stream or hub client of that strategy, `charts` to its
+    chart pool client.
+    """
+    sources, charts = sources or {}, charts or {}
+    client = AsyncKlineClient(exchange)
+    coroutines = [
+        run_strategy_async(
+            token,
+            tf,
+            pair,
+            version,
+            time_sleep,
+            mode,
+            exchange,
+            client,
+            sources.get((token, tf)),
+            charts.get((token, tf)),
+        )
+        for token, tf, pair in strategies
+    ]
+    if hub is not None:
+        coroutines.append(watch_hub(hub))
+    try:
+        await asyncio.gather(*coroutines)
+    finally:
+        client.close()
+
+
+def run(
+    strategies: Sequence[Tuple[str, str, str]],
+    version: str,
+    time_sleep: int,
+    mode: str,
+    exchange: str,
+    sources: Optional[Dict[str, object]] = None,
+    hub=None,
+    charts: Optional[Dict[str, object]] = None,
+) -> None:
+    asyncio.run(run_all(strategies, version, time_sleep, mode, exchange, sources, hub, charts))
@@ -0,0 +1,186 @@
+import argparse
+import asyncio
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import kline_store
+from kline_stream import interval_to_ms
+from logger import logger
+from rate_limit import WeightBudget, install_budget
+
+# --- Constants ---
+
+# Page requests in flight at once
+BACKFILL_CONCURRENCY = 8
+
+# Share of the request weight limit a backfill may use, leaving the rest to running strategies
+BACKFILL_WEIGHT_SHARE = 0.5
+
+# Checkpoint file, rewritten every `CHECKPOINT_EVERY` completed pages
+CHECKPOINT_PATH = "backfill_checkpoint.json"
+CHECKPOINT_EVERY = 20
+
+# (source, pair, time frame) of one series to backfill, source being "future" or "spot"
+Target = Tuple[str, str, str]
+# (source, pair, time frame, page start ms, page end ms) of one page request
+Page = Tuple[str, str, str, int, int]
+
+
+def page_key(page: Page) -> str:
+    source, pair, time_frame, start, _ = page
+    return f"{source}:{pair}:{time_frame}:{start}"
+
+
+def plan_pages(store: kline_store.KlineStore, targets: Sequence[Target], start_ms: int, end_ms: int) -> List[Page]:
+    """Splits the candles of [start_ms, end_ms) missing from the store into pages of one request each."""
+    now_ms = int(time.time() * 1000)
+    pages = []
+    for source, pair, time_frame in targets:
+        step = interval_to_ms(time_frame)
+        # Only closed candles are stored
+        closed_end = min(end_ms, now_ms // step * step)
+        for range_start, range_end in store.missing_ranges(source, pair, time_frame, start_ms, closed_end):
+            for page_start in range(range_start, range_end, kline_store.MAX_KLINES_PER_REQUEST * step):
+                page_end = min(page_start + kline_store.MAX_KLINES_PER_REQUEST * step, range_end)
+                pages.append((source, pair, time_frame, page_start, page_end))
+    return pages
+
+
+class Checkpoint:
+    """Progress of a backfill job, saved as JSON so an interrupted run resumes where it stopped.
+
+    The job itself (targets and range) is saved with the completed and failed pages, so `--resume`
+    needs no other argument. Pages already in the store are skipped on resume in any case, since
+    pages are planned from the store's missing ranges.
+    """
+
+    def __init__(self, path: str = CHECKPOINT_PATH):
+        self.path = path
+        self.job: Dict = {}
+        self.done = set()
+        self.failed = set()
+        if os.path.exists(path):
+            with open(path, "r") as file:
+                state = json.load(file)
+            self.job = state.get("job", {})
+            self.done = set(state.get("done", []))
+            self.failed = set(state.get("failed", []))
+
+    def save(self) -> None:
+        state = {"job": self.job, "done": sorted(self.done), "failed": sorted(self.failed)}
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as file:
+            json.dump(state, file)
+        os.replace(tmp_path, self.path)
+
+
+async def run_pages(
+    store: kline_store.KlineStore, pages: Sequence[Page], checkpoint: Checkpoint, concurrency: int
+) -> Tuple[int, int]:
+    """Fetches the pages over a bounded pool. Returns (pages done, pages failed)."""
+    loop = asyncio.get_running_loop()
+    executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="backfill")
+    semaphore = asyncio.Semaphore(concurrency)
+    fetchers = {source: kline_store.rest_range_fetcher(source == "future") for source in ("future", "spot")}
+    counts = {"done": 0, "failed": 0}
+
+    async def fetch_page(page: Page) -> None:
+        source, pair, time_frame, start, end = page
+        async with semaphore:
+            try:
+                await loop.run_in_executor(executor, store.sync, source, pair, time_frame, start, end, fetchers[source])
+            except Exception as e:
+                logger.error(f"Backfill page failed {pair} {time_frame} {start}: {e}")
+                checkpoint.failed.add(page_key(page))
+                counts["failed"] += 1
+                return
+        checkpoint.done.add(page_key(page))
+        checkpoint.failed.discard(page_key(page))
+        counts["done"] += 1
+        if counts["done"] % CHECKPOINT_EVERY == 0:
+            checkpoint.save()
+            logger.info(f"Backfill progress: {counts['done']}/{len(pages)} pages")
+
+    try:
+        await asyncio.gather(*(fetch_page(page) for page in pages))
+    finally:
+        checkpoint.save()
+        executor.shutdown(wait=False)
+    return counts["done"], counts["failed"]
+
+
+def backfill(
+    targets: Sequence[Target],
+    start_ms: int,
+    end_ms: int,
+    concurrency: int = BACKFILL_CONCURRENCY,
+    checkpoint_path: str = CHECKPOINT_PATH,
+    store: Optional[kline_store.KlineStore] = None,
+) -> Tuple[int, int]:
+    """Downloads the klines of every target over [start_ms, end_ms) into the kline store."""
+    store = store or kline_store.get_store()
+    if store is None:
+        raise RuntimeError("The kline store is disabled, set KLINE_STORE_DIR")
+    targets = [target for target in targets if kline_store.supports(target[2])]
+
+    checkpoint = Checkpoint(checkpoint_path)
+    job = {"targets": [list(target) for target in targets], "start_ms": start_ms, "end_ms": end_ms}
+    if checkpoint.job != job:
+        checkpoint.job, checkpoint.done, checkpoint.failed = job, set(), set()
+
+    pages = [page for page in plan_pages(store, targets, start_ms, end_ms) if page_key(page) not in checkpoint.done]
+    logger.info(f"Backfill: {len(pages)} pages for {len(targets)} series, {concurrency} in flight")
+    started = time.time()
+    done, failed = asyncio.run(run_pages(store, pages, checkpoint, concurrency))
+    logger.info(f"Backfill finished in {time.time() - started:.1f}s: {done} pages done, {failed} failed")
+    return done, failed
+
+
+def date_to_ms(date_str: str) -> int:
+    """Converts a YYYY-MM-DD (UTC) date to epoch milliseconds."""
+    return int(datetime.strptime(date_str, "%Y-%m-%d").replace(tzinfo=timezone.utc).timestamp() * 1000)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backfill historical klines into the local kline store.")
+    parser.add_argument("--tokens", type=str, help="Comma-separated tokens, e.g. 'BTC,ETH'", default="")
+    parser.add_argument("--tokens-file", type=str, help="File with one token per line", default="")
+    parser.add_argument("--timeframe", type=str, help="Comma-separated time frames, e.g. '5m,1h'", default="5m")
+    parser.add_argument("--start", type=str, help="First day (UTC), YYYY-MM-DD")
+    parser.add_argument("--end", type=str, help="Last day (UTC), YYYY-MM-DD; defaults to today", default="")
+    parser.add_argument("--exchange", type=str, help="Exchange: 'future' or 'spot'", default="future")
+    parser.add_argument("--concurrency", type=int, help="Page requests in flight", default=BACKFILL_CONCURRENCY)
+    parser.add_argument("--checkpoint", type=str, help="Checkpoint file", default=CHECKPOINT_PATH)
+    parser.add_argument("--resume", action="store_true", help="Resume the job saved in the checkpoint")
+    args = parser.parse_args()
+
+    install_budget(WeightBudget(safety_factor=BACKFILL_WEIGHT_SHARE))
+
+    if args.resume:
+        saved = Checkpoint(args.checkpoint).job
+        if not saved:
+            parser.error(f"No backfill job saved in {args.checkpoint}")
+        targets = [tuple(target) for target in saved["targets"]]
+        backfill(targets, saved["start_ms"], saved["end_ms"], args.concurrency, args.checkpoint)
+    else:
+        from chandelier_exit import uses_future_api
+
+        if not args.start:
+            parser.error("--start is required unless --resume is given")
+        tokens = [token.strip() for token in args.tokens.split(",") if token.strip()]
+        if args.tokens_file:
+            with open(args.tokens_file, "r") as file:
+                tokens += [line.strip() for line in file if line.strip()]
+        pairs = [f"{token}USDT" for token in tokens]
+        targets = [
+            ("future" if uses_future_api(args.exchange, pair) else "spot", pair, time_frame)
+            for pair in pairs
+            for time_frame in args.timeframe.split(",")
+        ]
+        end_date = args.end or datetime.now(timezone.utc).strftime("%Y-%m-%d")
+        end_ms = date_to_ms(end_date) + int(timedelta(days=1).total_seconds() * 1000)
+        backfill(targets, date_to_ms(args.start), end_ms, args.concurrency, args.checkpoint)
@@ -0,0 +1,252 @@
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+try:
+    from numba import njit
+except ImportError:  # numba is optional, the plain Python kernel is used without it
+    njit = None
+
+# --- Constants ---
+
+# Defaults of test.py
+INITIAL_CAPITAL = 2300
+LEVERAGE = 1
+FEE_RATE = 0.0005
+POSITION_FRACTION = 1.00
+STOP_LOSS = -0.05
+TAKE_PROFIT = 99
+
+# Bounds (percent) of the highest gain / loss buckets reported per closed trade
+BUCKET_BOUNDS = (1, 2, 4)
+
+
+def load_frame(path: str) -> pd.DataFrame:
+    """Reads a `test_fetch_data.py` output, CSV or Parquet."""
+    if path.endswith(".parquet"):
+        return pd.read_parquet(path)
+    return pd.read_csv(path)
+
+
+def _highest_loss_loop(gain, lost, highest_loss):
+    """Tracks `highest_loss_open` over the rows of one trade, as `test.run_trading_strategy` does.
+
+    The loop stores the row's gain, not its loss, whenever a lower loss is seen, and never resets the
+    value between trades. The reported loss buckets depend on it, so it is kept as is.
+    """
+    for r in range(len(gain)):
+        if lost[r] < highest_loss:
+            highest_loss = gain[r]
+    return highest_loss
+
+
+_highest_loss_compiled = njit(cache=True)(_highest_loss_loop) if njit else None
+
+
+def _highest_loss(gain: np.ndarray, lost: np.ndarray, highest_loss: float) -> float:
+    if _highest_loss_compiled is not None:
+        return float(_highest_loss_compiled(gain, lost, highest_loss))
+    return _highest_loss_loop(gain.tolist(), lost.tolist(), highest_loss)
+
+
+def find_trades(
+    data: pd.DataFrame,
+    leverage: float = LEVERAGE,
+    stop_loss: float = STOP_LOSS,
+    take_profit: float = TAKE_PROFIT,
+    entry_mask: Optional[np.ndarray] = None,
+) -> pd.DataFrame:
+    """Finds the closed trades of the strategy of `test.run_trading_strategy`.
+
+    A long opens at the open of row i when the direction flipped from -1 to 1 on row i-1, row i-1
+    has a signal and its real price went up (shorts mirrored). A position is checked on every later
+    row against the previous row's close: it is stopped out (or takes profit) first, otherwise it
+    closes when the direction flips against it. A stop-out blocks re-entry on the same row.
+
+    Entry and flip rows are found with array operations; the loop only runs once per trade, each
+    trade's exit being searched on the slice of closes it spans. `entry_mask` can disable entries
+    on rows (the `check_time` filter).
+    """
+    direction = data["direction"].to_numpy(dtype=np.float64)
+    signal = data["signal"].to_numpy(dtype=np.float64)
+    change = data["real_price_change"].to_numpy(dtype=np.float64)
+    open_p = data["real_price_open"].to_numpy(dtype=np.float64)
+    close = data["real_price_close"].to_numpy(dtype=np.float64)
+    high = data["High"].to_numpy(dtype=np.float64)
+    low = data["Low"].to_numpy(dtype=np.float64)
+    size = len(data)
+
+    # --- Events ---
+    rows = np.arange(size)
+    prev_dir = np.r_[np.nan, direction[:-1]]
+    pre_prev_dir = np.r_[np.nan, np.nan, direction[:-2]]
+    prev_signal = np.r_[np.nan, signal[:-1]]
+    prev_change = np.r_[np.nan, change[:-1]]
+    crossed_up = (pre_prev_dir == -1) & (prev_dir == 1) & (prev_signal != 0) & (rows >= 2)
+    crossed_down = (pre_prev_dir == 1) & (prev_dir == -1) & (prev_signal != 0) & (rows >= 2)
+    long_entry = crossed_up & (prev_change > 0)
+    short_entry = crossed_down & (prev_change < 0)
+    if entry_mask is not None:
+        long_entry &= entry_mask
+        short_entry &= entry_mask
+    entry_rows = np.flatnonzero(long_entry | short_entry)
+    exit_flips = {
+        1: np.flatnonzero((direction == -1) & (prev_dir == 1)),
+        -1: np.flatnonzero((direction == 1) & (prev_dir == -1)),
+    }
+
+    trades: List[Dict] = []
+    highest_loss = 0.0
+    start = 0
+    while True:
+        k = np.searchsorted(entry_rows, start)
+        if k == len(entry_rows):
+            break
+        entry = int(entry_rows[k])
+        side = 1 if long_entry[entry] else -1
+        price = open_p[entry]
+
+        flips = exit_flips[side]
+        f = np.searchsorted(flips, entry + 1)
+        flip = int(flips[f]) if f < len(flips) else size
+
+        # Gains at the previous close of every row the position is checked on
+        last = min(flip, size - 1)
+        gains = side * (close[entry:last] - price) / price * leverage
+        hits = np.flatnonzero((gains <= stop_loss) | (gains >= take_profit))
+        if len(hits):
+            exit_row, stopped = entry + 1 + int(hits[0]), True
+        elif flip < size:
+            exit_row, stopped = flip, False
+        else:
+            break  # Still open at the end of the data
+
+        span = slice(entry + 1, exit_row + 1)
+        if side == 1:
+            row_gain = (high[span] - price) / price * leverage
+            row_lost = (low[span] - price) / price * leverage
+        else:
+            row_gain = (price - low[span]) / price * leverage
+            row_lost = (price - high[span]) / price * leverage
+        highest_loss = _highest_loss(row_gain, row_lost, highest_loss)
+
+        gain_per = float(gains[exit_row - entry - 1])
+        stop_hit = False
+        if stopped:
+            if gain_per >= take_profit:
+                gain_per = take_profit
+            else:
+                gain_per, stop_hit = stop_loss, True
+        trades.append(
+            {
+                "entry_row": entry,
+                "exit_row": exit_row,
+                "side": side,
+                "entry_price": price,
+                "gain_per": gain_per,
+                "stop_loss": stop_hit,
+                "highest_gain": max(float(row_gain.max()), 0.0),
+                "highest_loss": highest_loss,
+            }
+        )
+        # A stop-out ends the row, a flip exit can re-enter on it
+        start = exit_row + 1 if stopped else exit_row
+
+    columns = ["entry_row", "exit_row", "side", "entry_price", "gain_per", "stop_loss", "highest_gain", "highest_loss"]
+    return pd.DataFrame(trades, columns=columns)
+
+
+def _share(count: int, total: int) -> str:
+    return f"{count / total * 100:.2f}% ({count}/{total})" if total else f"0.00% ({count}/{total})"
+
+
+def run_backtest(
+    data: pd.DataFrame,
+    token: str,
+    initial_capital: float = INITIAL_CAPITAL,
+    leverage: float = LEVERAGE,
+    fee_rate: float = FEE_RATE,
+    position_fraction: float = POSITION_FRACTION,
+    stop_loss: float = STOP_LOSS,
+    take_profit: float = TAKE_PROFIT,
+    entry_mask: Optional[np.ndarray] = None,
+) -> Dict:
+    """Backtests one token and returns the same summary as `test.run_trading_strategy`.
+
+    The summary also holds `daily` (date, capital_start, capital_end, gain_loss rows) and `trades`.
+    """
+    trades = find_trades(data, leverage, stop_loss, take_profit, entry_mask)
+    gain_per = trades["gain_per"].to_numpy()
+    closed = len(trades)
+
+    # Capital compounds trade after trade; summed in order to match the row loop to the last bit
+    gains, capitals = [], []
+    capital = initial_capital
+    for value in gain_per.tolist():
+        gain = value * (capital * position_fraction) - fee_rate * (capital * position_fraction)
+        capital += gain
+        gains.append(gain)
+        capitals.append(capital)
+
+    # --- Daily results ---
+    dates = data["Time1"].str[:10].to_numpy()[2:]
+    first_rows = 2 + np.flatnonzero(np.r_[True, dates[1:] != dates[:-1]])
+    day_of_row = np.cumsum(np.r_[True, dates[1:] != dates[:-1]]) - 1
+    exits = trades["exit_row"].to_numpy()
+    closed_before = np.searchsorted(exits, first_rows)
+    capital_by_count = np.r_[initial_capital, capitals]
+    daily_gain = [0.0] * len(first_rows)
+    for exit_row, gain in zip(exits.tolist(), gains):
+        daily_gain[day_of_row[exit_row - 2]] += gain
+    daily = [
+        {
+            "date": dates[row - 2],
+            "capital_start": capital_by_count[count],
+            "capital_end": capital_by_count[count] + gain,
+            "gain_loss": gain,
+        }
+        for row, count, gain in zip(first_rows.tolist(), closed_before.tolist(), daily_gain)
+    ]
+
+    # --- Streaks and buckets ---
+    win = int((gain_per > 0).sum())
+    loss = closed - win
+    runs = np.diff(np.flatnonzero(np.r_[True, gain_per > 0, True])) - 1
+    max_loss_streak = int(runs.max()) if len(runs) else 0
+    highest_gain = trades["highest_gain"].to_numpy() * 100
+    highest_loss = trades["highest_loss"].to_numpy() * 100
+    low_bound, mid_bound, high_bound = BUCKET_BOUNDS
+    gain_1_2 = int(((highest_gain >= low_bound) & (highest_gain < mid_bound)).sum())
+    gain_2_4 = int(((highest_gain >= mid_bound) & (highest_gain < high_bound)).sum())
+    gain_4 = int((highest_gain >= high_bound).sum())
+    loss_1_2 = int(((highest_loss <= -low_bound) & (highest_loss > -mid_bound)).sum())
+    loss_2_4 = int(((highest_loss <= -mid_bound) & (highest_loss > -high_bound)).sum())
+    loss_4 = int((highest_loss <= -high_bound).sum())
+    stop_loss_count = int(trades["stop_loss"].sum())
+    daily_wins = sum(1 for day in daily if day["gain_loss"] > 0)
+
+    return {
+        "token": token,
+        "initial_capital": initial_capital,
+        "final_capital": capital,
+        "percentage_gain": (capital - initial_capital) / initial_capital * 100,
+        "win_rate": win / closed * 100 if closed else 0.0,
+        "total_win": win,
+        "total_loss": loss,
+        "stop_lost_rate": _share(stop_loss_count, closed),
+        "daily_win_rate": f"{_share(daily_wins, len(daily))} days",
+        "max_win": max(float(gain_per.max(initial=0.0)), 0.0) * 100,
+        "max_loss": min(float(gain_per.min(initial=0.0)), 0.0) * 100,
+        "lowest_capital": min([initial_capital, *capitals]),
+        "max_loss_streak": max_loss_streak,
+        "1-2%": _share(gain_1_2, closed),
+        "2-4%": _share(gain_2_4, closed),
+        "more than 2%": _share(gain_4 + gain_2_4, closed),
+        "more_than_4%": _share(gain_4, closed),
+        "-1-2%": _share(loss_1_2, closed),
+        "-2-4%": _share(loss_2_4, closed),
+        "more_than-4%": _share(loss_4, closed),
+        "daily": daily,
+        "trades": trades,
+    }
@@ -0,0 +1,130 @@
+import argparse
+import importlib
+import json
+import multiprocessing
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List, Sequence
+
+from tabulate import tabulate
+
+from lazy_import import is_loaded
+
+# --- Constants ---
+
+# Module a strategy worker runs
+BENCH_MODULE = "chandelier_exit"
+
+# Modules a strategy worker should not load until it renders a chart itself
+HEAVY_MODULES = ("matplotlib", "mplfinance", "PIL", "chart", "zlma", "lib.wrapper")
+
+# Fresh interpreters per import measurement; the median is reported
+BENCH_RUNS = 5
+
+# Workers forked for the per-worker measurement
+BENCH_WORKERS = 4
+
+
+def memory() -> Dict[str, float]:
+    """RSS and USS (pages private to this process) in MB, from /proc on Linux and ru_maxrss elsewhere."""
+    try:
+        values = {}
+        with open("/proc/self/smaps_rollup", "r") as file:
+            for line in file:
+                key, _, rest = line.partition(":")
+                if key in ("Rss", "Private_Clean", "Private_Dirty"):
+                    values[key] = int(rest.split()[0]) / 1024
+        return {"rss_mb": values["Rss"], "uss_mb": values["Private_Clean"] + values["Private_Dirty"]}
+    except (OSError, KeyError):
+        # ru_maxrss is in KB on Linux but in bytes on macOS
+        scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+        return {"rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale, "uss_mb": float("nan")}
+
+
+def probe(module: str, eager: Sequence[str] = ()) -> Dict:
+    """Imports `eager`, then `module` in this process. Returns the import time, memory and heavy modules loaded."""
+    started = time.perf_counter()
+    for name in eager:
+        importlib.import_module(name)
+    importlib.import_module(module)
+    seconds = time.perf_counter() - started
+    return {"import_s": seconds, **memory(), "heavy": [name for name in HEAVY_MODULES if is_loaded(name)]}
+
+
+def import_cost(module: str, eager: Sequence[str] = (), runs: int = BENCH_RUNS) -> Dict:
+    """Medians of `probe` over `runs` fresh interpreters, so no import is served from this process."""
+    command = [sys.executable, os.path.abspath(__file__), "--probe", module, "--eager", ",".join(eager)]
+    cwd = os.path.dirname(os.path.abspath(__file__))
+    results = []
+    for _ in range(runs):
+        output = subprocess.run(command, cwd=cwd, capture_output=True, text=True, check=True).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+    medians = {key: statistics.median(result[key] for result in results) for key in ("import_s", "rss_mb", "uss_mb")}
+    return {**medians, "heavy": results[-1]["heavy"]}
+
+
+def _worker(started: float, render: bool, results: multiprocessing.Queue) -> None:
+    row = {"start_s": time.time() - started, **memory()}
+    if render:
+        loading = time.perf_counter()
+        import chart
+
+        # `chart` may be a lazy module, so touch it to load the chart stack like an inline render
+        chart.get_charts
+        row.update(chart_load_s=time.perf_counter() - loading, uss_after_chart_mb=memory()["uss_mb"])
+    results.put(row)
+
+
+def worker_cost(module: str, workers: int = BENCH_WORKERS, render: bool = False) -> List[Dict]:
+    """Imports `module` like the launcher, then forks `workers` processes and reports what each one costs."""
+    importlib.import_module(module)
+    context = multiprocessing.get_context("fork")
+    results = context.Queue()
+    rows = []
+    for _ in range(workers):
+        process = context.Process(target=_worker, args=(time.time(), render, results))
+        process.start()
+        rows.append(results.get())
+        process.join()
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure strategy worker import time and memory.")
+    parser.add_argument("--module", type=str, help="Module a worker imports", default=BENCH_MODULE)
+    parser.add_argument("--runs", type=int, help="Fresh interpreters per import measurement", default=BENCH_RUNS)
+    parser.add_argument("--workers", type=int, help="Workers to fork from the launcher", default=BENCH_WORKERS)
+    parser.add_argument("--render", action="store_true", help="Also load the chart stack in every worker")
+    parser.add_argument("--probe", type=str, help=argparse.SUPPRESS, default="")
+    parser.add_argument("--eager", type=str, help=argparse.SUPPRESS, default="")
+    args = parser.parse_args()
+
+    if args.probe:
+        print(json.dumps(probe(args.probe, [name for name in args.eager.split(",") if name])))
+        exit(0)
+
+    cases = [
+        ("numpy + requests", "requests", ["numpy"]),
+        (args.module, args.module, []),
+        (f"{args.module} + chart", args.module, ["chart"]),
+    ]
+    rows = []
+    for label, module, eager in cases:
+        cost = import_cost(module, eager, args.runs)
+        heavy = ", ".join(cost["heavy"]) or "-"
+        rows.append((label, f"{cost['import_s'] * 1000:.0f}", f"{cost['rss_mb']:.1f}", f"{cost['uss_mb']:.1f}", heavy))
+    print(tabulate(rows, headers=["import", "time ms", "RSS MB", "USS MB", "heavy modules"], tablefmt="github"))
+    print()
+
+    rows = []
+    for i, row in enumerate(worker_cost(args.module, args.workers, args.render)):
+        chart_columns = (f"{row['chart_load_s'] * 1000:.0f}", f"{row['uss_after_chart_mb']:.1f}") if args.render else ()
+        rows.append((i, f"{row['start_s'] * 1000:.1f}", f"{row['rss_mb']:.1f}", f"{row['uss_mb']:.1f}", *chart_columns))
+    headers = ["worker", "start ms", "RSS MB", "USS MB"]
+    if args.render:
+        headers += ["chart load ms", "USS after chart MB"]
+    print(tabulate(rows, headers=headers, tablefmt="github", disable_numparse=True))
@@ -1,4 +1,4 @@
-import requests
+import http_client
 from tabulate import tabulate
 import json
 import os
@@ -33,7 +33,7 @@ def get_futures_quote_volume(data):
     if not data:
         endpoint = "/fapi/v1/ticker/24hr"
         url = BASE_URL + endpoint
-        response = requests.get(url)
+        response = http_client.get(url)
         data = response.json()
 
     # Filter USDT pairs and sort by quoteVolume
@@ -50,7 +50,7 @@ def get_open_interest(symbol):
     endpoint = f"/fapi/v1/openInterest"
     url = BASE_URL + endpoint
     params = {"symbol": symbol}
-    response = requests.get(url, params=params)
+    response = http_client.get(url, params=params)
 
     open_interest_data = response.json()
     return open_interest_data.get("openInterest")
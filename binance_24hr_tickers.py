@@ -1,6 +1,6 @@
 import os
 import json
-import requests
+import http_client
 import time
 from tabulate import tabulate
 from logger import logger
@@ -101,7 +101,7 @@ def format_oi_vol_table(data):
 
 def get_24h_price_change():
     url = "https://fapi.binance.com/fapi/v1/ticker/24hr"
-    response = requests.get(url)
+    response = http_client.get(url)
     data = response.json()
     return data
 
@@ -110,7 +110,7 @@ def get_24h_price_change():
 def get_open_interest(symbol, OPEN_INTEREST_MAP):
     endpoint = f"https://fapi.binance.com/fapi/v1/openInterest"
     params = {"symbol": symbol}
-    response = requests.get(endpoint, params=params)
+    response = http_client.get(endpoint, params=params)
 
     open_interest_data = response.json()
     oi_value = open_interest_data.get("openInterest")
@@ -242,7 +242,7 @@ def fetch_klines_future(PAIR, TIME_FRAME, limit, weight, end_time=None):
         if end_time:
             URL += f"&endTime={end_time}"
         headers = {"Content-Type": "application/json"}
-        res = requests.get(URL, headers=headers, timeout=10)
+        res = http_client.get(URL, headers=headers)
         weight["m1"] = int(res.headers.get("x-mbx-used-weight-1m", 0))
         return res.json()
     except Exception as e:
@@ -407,7 +407,7 @@ def binance_24hr_tickers():
     print("losers", losers_idx)
     message = f"#DAILY_REPORT {date} {trend}\n\nBinance Future\n\nTop Gainers & Losers Last 24hr {trend1}\n\n<pre language='javascript'>{table}</pre>\n\nTop Volume Trade and Open Interest\n\n<pre language='javascript'>{table_vol_oi}</pre>\n\n Last Week Behavior\n\n<pre language='javascript'>{last_week_changes_table}</pre>"
     URL = "http://localhost:8000/send24hrPriceChange"
-    response = requests.post(
+    response = http_client.post(
         URL,
         json={"message": message, "time_frame": "2h"},
         headers={"Content-Type": "application/json"},
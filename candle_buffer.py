@@ -0,0 +1,186 @@
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Sequence, Union
+
+import numpy as np
+import pandas as pd
+
+# --- Constants ---
+
+# Columns of the candle store, in the same order as `init_kline_data_dict`
+FLOAT_COLUMNS = [
+    "Open",
+    "High",
+    "Low",
+    "Close",
+    "ATR",
+    "LongStop",
+    "ShortStop",
+    "LongStopPrev",
+    "ShortStopPrev",
+    "Direction",
+    "Open_p",
+    "Close_p",
+]
+INT_COLUMNS = ["Time"]
+COLUMN_ORDER = [
+    "Open",
+    "High",
+    "Low",
+    "Close",
+    "Time1",
+    "Time",
+    "ATR",
+    "LongStop",
+    "ShortStop",
+    "LongStopPrev",
+    "ShortStopPrev",
+    "Direction",
+    "Open_p",
+    "Close_p",
+]
+
+TIME1_FORMAT = "%Y-%m-%d %H:%M"
+
+
+class TimeLabels:
+    """Read-only 'Time1' column derived from 'Time' on access, so no strings are stored per candle."""
+
+    def __init__(self, times: np.ndarray):
+        self._times = times
+
+    def __len__(self) -> int:
+        return len(self._times)
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[str, List[str]]:
+        if isinstance(index, slice):
+            return [self._format(t) for t in self._times[index]]
+        return self._format(self._times[index])
+
+    def __iter__(self):
+        return (self._format(t) for t in self._times)
+
+    @staticmethod
+    def _format(timestamp) -> str:
+        return datetime.fromtimestamp(int(timestamp)).strftime(TIME1_FORMAT)
+
+
+class CandleBuffer:
+    """Fixed-capacity, column-oriented candle store backed by NumPy arrays.
+
+    Rows live in arrays of twice the capacity. Appending writes past the last row and, once the
+    end of the arrays is reached, the live rows are moved back to the front, so appends are
+    amortized O(1) while every column stays one contiguous slice. `buffer[column]` returns a
+    writable zero-copy view of the live rows; views are only valid until the next append.
+
+    Missing indicator values are NaN (the dict-of-lists store used None).
+    """
+
+    def __init__(self, capacity: int, extra_columns: Sequence[str] = ()):
+        self.capacity = capacity
+        self._start = 0
+        self._end = 0
+        self._columns: Dict[str, np.ndarray] = {}
+        for key in FLOAT_COLUMNS + list(extra_columns):
+            self._columns[key] = np.full(2 * capacity, np.nan, dtype=np.float64)
+        for key in INT_COLUMNS:
+            self._columns[key] = np.zeros(2 * capacity, dtype=np.int64)
+
+    # --- Mapping interface ---
+
+    def __len__(self) -> int:
+        return self._end - self._start
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._columns or key == "Time1"
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def keys(self) -> List[str]:
+        extra = [key for key in self._columns if key not in COLUMN_ORDER]
+        return COLUMN_ORDER + extra
+
+    def __getitem__(self, key: str) -> Union[np.ndarray, TimeLabels]:
+        if key == "Time1":
+            return TimeLabels(self._columns["Time"][self._start : self._end])
+        return self._columns[key][self._start : self._end]
+
+    def __setitem__(self, key: str, values: Iterable[float]) -> None:
+        """Overwrites a whole column, adding a new float column for unknown keys."""
+        if key == "Time1":
+            raise KeyError("Time1 is derived from Time")
+        if key not in self._columns:
+            self._columns[key] = np.full(2 * self.capacity, np.nan, dtype=np.float64)
+        column = self._columns[key]
+        column[self._start : self._end] = np.asarray(values, dtype=column.dtype)
+
+    # --- Row operations ---
+
+    def append(self, row: Dict[str, Optional[float]]) -> None:
+        """Appends one candle, evicting the oldest when the buffer is full. Unknown keys are ignored."""
+        if self._end == 2 * self.capacity:
+            self._compact()
+        self._write(self._end, row)
+        self._end += 1
+        if len(self) > self.capacity:
+            self._start += 1
+
+    def replace_last(self, row: Dict[str, Optional[float]]) -> None:
+        """Overwrites the last (forming) candle in place."""
+        if not len(self):
+            raise IndexError("replace_last on an empty CandleBuffer")
+        self._write(self._end - 1, row)
+
+    def extend(self, rows: Dict[str, List]) -> None:
+        """Appends every row of a dict-of-lists, as produced by `init_kline_data_dict`."""
+        size = len(rows["Time"])
+        for i in range(size):
+            self.append({key: values[i] for key, values in rows.items()})
+
+    def pop_first(self) -> None:
+        if len(self):
+            self._start += 1
+
+    def pop_last(self) -> None:
+        if len(self):
+            self._end -= 1
+
+    def clear(self) -> None:
+        self._start = self._end = 0
+
+    def row(self, index: int) -> Dict[str, float]:
+        """Returns one candle as a dict, with negative indexes counted from the end."""
+        position = (self._end if index < 0 else self._start) + index
+        if not self._start <= position < self._end:
+            raise IndexError("CandleBuffer index out of range")
+        return {key: column[position].item() for key, column in self._columns.items()}
+
+    def to_frame(self, columns: Optional[Sequence[str]] = None) -> pd.DataFrame:
+        """Copies the live rows into a DataFrame, for CSV export and pandas-based indicators."""
+        columns = columns or self.keys()
+        return pd.DataFrame({key: list(self[key]) if key == "Time1" else self[key].copy() for key in columns})
+
+    # --- Internals ---
+
+    def _write(self, position: int, row: Dict[str, Optional[float]]) -> None:
+        for key, column in self._columns.items():
+            value = row.get(key)
+            if key in INT_COLUMNS:
+                column[position] = int(value) if value is not None else 0
+            else:
+                column[position] = np.nan if value is None else value
+
+    def _compact(self) -> None:
+        size = len(self)
+        for column in self._columns.values():
+            column[:size] = column[self._start : self._end]
+        self._start, self._end = 0, size
+
+
+def append_row(data: Union[Dict[str, List], CandleBuffer], row: Dict[str, Optional[float]]) -> None:
+    """Appends one candle to either a dict-of-lists or a CandleBuffer."""
+    if isinstance(data, CandleBuffer):
+        data.append(row)
+    else:
+        for key in data:
+            data[key].append(row.get(key))
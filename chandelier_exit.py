@@ -2,22 +2,43 @@ import argparse
 import json
 import multiprocessing
 import os
-import random
+import queue
+import threading
 import time
 import traceback
 from datetime import datetime
 from enum import Enum
-from typing import Dict, List, Any, Literal
+from typing import Any, Callable, Dict, List, Literal, Optional, Tuple, Union
 
+import numpy as np
 import pandas as pd
 import requests
 from binance.spot import Spot
 
 # Local library imports (assuming they exist in the specified structure)
-import chart
-from lib.trend import ema_indicator
+import http_client
+import kline_store
+from candle_buffer import CandleBuffer, append_row
+from chart_pool import CHART_WORKERS, ChartClient, ChartPool
+from data_hub import HubClient, MarketDataHub
+from indicators import StreamingChandelierExit, StreamingEMA
+from kline_stream import FUTURE_STREAM_URL, MAX_STREAMS_PER_CONNECTION, SPOT_STREAM_URL, KlineStream
+from lazy_import import lazy_import
 from lib.volatility import AverageTrueRange
 from logger import logger
+from rate_limit import (
+    PRIORITY_BACKGROUND,
+    PRIORITY_ROUTINE,
+    PRIORITY_SIGNAL,
+    WeightBudget,
+    get_budget,
+    install_budget,
+    kline_request_weight,
+)
+from scheduler import CandleScheduler
+
+# Charts pull in matplotlib, mplfinance and PIL; a worker loads them on its first inline render
+chart = lazy_import("chart")
 
 # --- Constants ---
 
@@ -58,6 +79,9 @@ TIME_FRAME_SECONDS = {
     "1h": 60 * 60,
 }
 
+# EMA columns kept by the EMA handler and their spans
+EMA_PERIODS = {"EMA_200": 200, "EMA_35": 34, "EMA_21": 21}
+
 
 # Configuration for Chandelier Exit, grouped in an Enum for clarity
 class CEConfig(Enum):
@@ -70,15 +94,24 @@ class CEConfig(Enum):
 
 # Constants for external service URLs
 TELEGRAM_API_BASE_URL = "http://localhost:8000"
-BINANCE_FUTURE_API_URL = "https://fapi.binance.com/fapi/v1/klines"
+BINANCE_FUTURE_API_URL = os.environ.get("BINANCE_FUTURE_API_URL", "https://fapi.binance.com/fapi/v1/klines")
 
 # Constants for pre-send signal timing
 PRE_SEND_TIMING_FACTOR_DEFAULT = 0.92
 PRE_SEND_TIMING_FACTOR_5M = 0.94
 
+# Timeframes that pre-send signals on the forming candle instead of waiting for the close
+PRE_SEND_TIME_FRAMES = ("5m", "15m", "30m")
+
+# pyplot keeps global state, so charts are rendered one at a time when strategies share a process
+CHART_LOCK = threading.Lock()
+
 
 # --- Data Structure Initialization ---
 
+# Candle data is either the legacy dict-of-lists or a CandleBuffer; both index columns by name
+CandleData = Union[Dict[str, List[Any]], CandleBuffer]
+
 
 def init_kline_data_dict() -> Dict[str, List[Any]]:
     """Creates a standardized dictionary to hold kline and indicator data."""
@@ -107,33 +140,33 @@ def init_kline_data_dict() -> Dict[str, List[Any]]:
 class KlineHelper:
     """A helper class to fetch, process, and manage kline data."""
 
-    def __init__(self, mode: str, exchange: str):
+    def __init__(self, mode: str, exchange: str, source: KlineStream = None):
         self.mode = mode
         self.exchange = exchange
+        self.source = source
         self.weight = {"m1": 0}
 
-    def _append_candle_base(self, data: Dict, kline: List) -> None:
-        """Appends the base data common to both normal and Heikin Ashi candles."""
-        data["Time1"].append(datetime.fromtimestamp(int(kline[0]) / 1000).strftime("%Y-%m-%d %H:%M"))
-        data["Time"].append(int(kline[0]) / 1000)
-        data["ATR"].append(None)
-        data["LongStop"].append(None)
-        data["ShortStop"].append(None)
-        data["LongStopPrev"].append(None)
-        data["ShortStopPrev"].append(None)
-        data["Direction"].append(None)
-        data["Open_p"].append(float(kline[1]))
-        data["Close_p"].append(float(kline[4]))
-
-    def _append_kline(self, data: Dict, kline: List) -> None:
-        """Appends a standard kline candle to the data dictionary."""
-        data["Open"].append(float(kline[1]))
-        data["High"].append(float(kline[2]))
-        data["Low"].append(float(kline[3]))
-        data["Close"].append(float(kline[4]))
-        self._append_candle_base(data, kline)
-
-    def _append_heikin_ashi(self, data: Dict, kline: List, prev_item: Dict = None) -> None:
+    def _candle_base(self, kline: List) -> Dict[str, Any]:
+        """Builds the fields common to both normal and Heikin Ashi candles."""
+        return {
+            "Time1": datetime.fromtimestamp(int(kline[0]) / 1000).strftime("%Y-%m-%d %H:%M"),
+            "Time": int(kline[0]) / 1000,
+            "ATR": None,
+            "LongStop": None,
+            "ShortStop": None,
+            "LongStopPrev": None,
+            "ShortStopPrev": None,
+            "Direction": None,
+            "Open_p": float(kline[1]),
+            "Close_p": float(kline[4]),
+        }
+
+    def _append_kline(self, data: CandleData, kline: List) -> None:
+        """Appends a standard kline candle to the data store."""
+        row = {"Open": float(kline[1]), "High": float(kline[2]), "Low": float(kline[3]), "Close": float(kline[4])}
+        append_row(data, {**row, **self._candle_base(kline)})
+
+    def _append_heikin_ashi(self, data: CandleData, kline: List, prev_item: Dict = None) -> None:
         """Calculates and appends a Heikin Ashi candle."""
         open_p, high_p, low_p, close_p = map(float, kline[1:5])
 
@@ -148,43 +181,52 @@ class KlineHelper:
         ha_high = max(high_p, ha_open, ha_close)
         ha_low = min(low_p, ha_open, ha_close)
 
-        data["Open"].append(ha_open)
-        data["High"].append(ha_high)
-        data["Low"].append(ha_low)
-        data["Close"].append(ha_close)
-        self._append_candle_base(data, kline)
+        row = {"Open": ha_open, "High": ha_high, "Low": ha_low, "Close": ha_close}
+        append_row(data, {**row, **self._candle_base(kline)})
 
-    def populate(self, data: Dict, klines: List, prev_item: Dict = None) -> None:
-        """Populates the data dictionary with klines using the specified mode."""
+    def populate(self, data: CandleData, klines: List, prev_item: Dict = None) -> None:
+        """Populates the data store with klines using the specified mode."""
         for kline in klines:
             if self.mode == "heikin_ashi":
                 self._append_heikin_ashi(data, kline, prev_item)
             else:
                 self._append_kline(data, kline)
 
-    def _pop_tail_data(self, data: Dict) -> None:
-        """Removes the last element from each list in the data dictionary."""
+    def _pop_tail_data(self, data: CandleData) -> None:
+        """Removes the last candle from the data store."""
+        if isinstance(data, CandleBuffer):
+            data.pop_last()
+            return
         for key in data:
             if data[key]:
                 data[key].pop()
 
-    def _pop_top_data(self, data: Dict) -> None:
-        """Removes the first element from each list in the data dictionary."""
+    def _pop_top_data(self, data: CandleData) -> None:
+        """Removes the first candle from the data store."""
+        if isinstance(data, CandleBuffer):
+            data.pop_first()
+            return
         for key in data:
             if data[key]:
                 data[key].pop(0)
 
-    def _append_data(self, data1: Dict, data2: Dict) -> None:
-        """Appends all elements from data2 lists to data1 lists."""
+    def _append_data(self, data1: CandleData, data2: Dict) -> None:
+        """Appends all candles from the data2 lists to data1."""
+        if isinstance(data1, CandleBuffer):
+            data1.extend(data2)
+            return
         for key in data1:
             data1[key].extend(data2[key])
 
-    def _fetch_klines_future(self, pair: str, time_frame: str, limit: int) -> List:
-        """Fetches klines from the Binance Futures API."""
+    def _fetch_klines_future(self, pair: str, time_frame: str, limit: int, priority: int = PRIORITY_ROUTINE) -> List:
+        """Fetches klines from the Binance Futures API within the shared request weight budget."""
+        budget = get_budget()
+        budget.acquire(kline_request_weight(limit), priority)
         try:
             url = f"{BINANCE_FUTURE_API_URL}?symbol={pair}&interval={time_frame}&limit={limit}"
             headers = {"Content-Type": "application/json"}
-            res = requests.get(url, headers=headers, timeout=10)
+            res = http_client.get(url, headers=headers)
+            budget.record_response(res.status_code, res.headers)
             res.raise_for_status()
             self.weight["m1"] = int(res.headers.get("x-mbx-used-weight-1m", 0))
             return res.json()
@@ -192,16 +234,37 @@ class KlineHelper:
             logger.error(f"Error Fetching Future Klines for {pair}: {e}")
             raise
 
-    def fetch_klines(self, binance_spot: Spot, pair: str, time_frame: str, limit: int) -> List:
-        """Fetches klines from the appropriate exchange (Spot or Future)."""
-        use_future_api = self.exchange == "future" or pair in NON_SPOT_PAIRS
-        if use_future_api:
-            return self._fetch_klines_future(pair, time_frame, limit)
+    def fetch_rest_klines(
+        self, binance_spot: Spot, pair: str, time_frame: str, limit: int, priority: Optional[int] = None
+    ) -> List:
+        """Fetches klines from the appropriate exchange (Spot or Future) REST API.
+
+        Histories come from the local kline store, which only fetches the candles it does not have yet.
+        """
+        future = uses_future_api(self.exchange, pair)
+        priority = default_request_priority(limit) if priority is None else priority
+        if limit > 2:
+            latest = lambda p, tf, n: self.fetch_rest_klines(binance_spot, p, tf, n, priority)
+            klines = kline_store.fetch_history(pair, time_frame, limit, future, latest, priority)
+            if klines:
+                return klines
+        if future:
+            return self._fetch_klines_future(pair, time_frame, limit, priority)
         return binance_spot.klines(pair, time_frame, limit=limit)
 
-    def export_csv(self, data: Dict, filename="atr2.csv") -> None:
+    def fetch_klines(
+        self, binance_spot: Spot, pair: str, time_frame: str, limit: int, priority: Optional[int] = None
+    ) -> List:
+        """Fetches klines from the stream source when it can answer, falling back to REST."""
+        if self.source is not None:
+            klines = self.source.fetch_klines(pair, time_frame, limit)
+            if klines:
+                return klines
+        return self.fetch_rest_klines(binance_spot, pair, time_frame, limit, priority)
+
+    def export_csv(self, data: CandleData, filename="atr2.csv") -> None:
         """Exports selected data columns to a CSV file."""
-        df = pd.DataFrame(data)
+        df = data.to_frame() if isinstance(data, CandleBuffer) else pd.DataFrame(data)
         df[["Time1", "Direction", "Open_p", "Close_p"]].to_csv(filename, index=False, float_format="%.15f", sep=" ")
 
 
@@ -221,17 +284,17 @@ class ChandlierExit:
         df["ATR"] = atr_calculator.average_true_range() * self.multiplier
         return df
 
-    def calculate_chandelier_exit(self, data: Dict) -> None:
+    def calculate_chandelier_exit(self, data: CandleData) -> None:
         """Calculates Chandelier Exit values and direction in-place."""
         for i in range(self.size):
-            if all(data[key][i] is not None for key in ["LongStop", "LongStopPrev", "ShortStop", "ShortStopPrev"]):
+            if all(has_value(data[key][i]) for key in ["LongStop", "LongStopPrev", "ShortStop", "ShortStopPrev"]):
                 continue
 
             # --- Calculate Long Stop ---
             price_window = data["Close" if self.use_close else "High"][max(0, i - self.length + 1) : i + 1]
             long_stop = max(price_window) - data["ATR"][i]
 
-            long_stop_prev = data["LongStop"][i - 1] if i > 0 and data["LongStop"][i - 1] is not None else long_stop
+            long_stop_prev = data["LongStop"][i - 1] if i > 0 and has_value(data["LongStop"][i - 1]) else long_stop
 
             if i > 0 and (data["Close"][i - 1] - long_stop_prev) > EPSILON:
                 long_stop = max(long_stop, long_stop_prev)
@@ -243,7 +306,7 @@ class ChandlierExit:
             price_window = data["Close" if self.use_close else "Low"][max(0, i - self.length + 1) : i + 1]
             short_stop = min(price_window) + data["ATR"][i]
 
-            short_stop_prev = data["ShortStop"][i - 1] if i > 0 and data["ShortStop"][i - 1] is not None else short_stop
+            short_stop_prev = data["ShortStop"][i - 1] if i > 0 and has_value(data["ShortStop"][i - 1]) else short_stop
 
             if i > 0 and (data["Close"][i - 1] - short_stop_prev) < -EPSILON:
                 short_stop = min(short_stop, short_stop_prev)
@@ -265,15 +328,17 @@ class ChandlierExit:
 class EMA:
     """Handles fetching data and calculating various EMAs."""
 
-    def __init__(self, pair: str, time_frame: str, mode: str, exchange: str, size: int = 1000):
+    def __init__(
+        self, pair: str, time_frame: str, mode: str, exchange: str, size: int = 1000, source: KlineStream = None
+    ):
         print(f"EMA: {pair} {time_frame} {mode} {exchange} {size}")
         self.pair = pair
         self.time_frame = time_frame
         self.size = size
         self.binance_spot = Spot()
-        self.kline_helper = KlineHelper(mode=mode, exchange=exchange)
-        self.data: Dict[str, List[Any]] = init_kline_data_dict()
-        self.df: pd.DataFrame = pd.DataFrame()
+        self.kline_helper = KlineHelper(mode=mode, exchange=exchange, source=source)
+        self.data = CandleBuffer(size)
+        self.emas = {column: StreamingEMA(span) for column, span in EMA_PERIODS.items()}
         self.timestamp: float = 0.0
         self.ema_200_value: float = None
         self.ema_35_value: float = None
@@ -282,11 +347,15 @@ class EMA:
     def fetch_klines(self) -> None:
         """Fetch initial klines and populate the data structures."""
         logger.info(f"Fetching initial EMA klines for {self.pair}")
-        self.data = init_kline_data_dict()
         klines = self.kline_helper.fetch_klines(self.binance_spot, self.pair, self.time_frame, self.size)
+        self.load_klines(klines)
+
+    def load_klines(self, klines: List) -> None:
+        """Replaces the candles with already fetched klines and resyncs the EMA state."""
+        self.data.clear()
         self.kline_helper.populate(self.data, klines)
-        self.df = pd.DataFrame(self.data)
         self.timestamp = self.data["Time"][-1]
+        self._resync_emas()
 
     def update_klines(self, latest_klines: List) -> None:
         """Updates klines with new data, handling timestamp alignment."""
@@ -297,7 +366,7 @@ class EMA:
         self.kline_helper.populate(new_data, latest_klines)
 
         latest_new_timestamp = new_data["Time"][-1]
-        last_existing_timestamp = self.data["Time"][-1] if self.data["Time"] else 0
+        last_existing_timestamp = self.data["Time"][-1] if len(self.data) else 0
 
         expected_next_timestamp = last_existing_timestamp + TIME_FRAME_SECONDS.get(self.time_frame, 0)
 
@@ -305,34 +374,50 @@ class EMA:
             # Update the last (still forming) candle
             self.kline_helper._pop_tail_data(self.data)
             self.kline_helper.populate(self.data, [latest_klines[-1]])
-        elif latest_new_timestamp == expected_next_timestamp:
-            # A new candle has closed, roll the data forward
-            self.kline_helper._pop_top_data(self.data)
-            # Note: original code pops tail then appends both, this simplified version is equivalent
-            self.kline_helper.populate(self.data, [latest_klines[-1]])
+            self._update_emas(new_candle=False)
+        elif latest_new_timestamp == expected_next_timestamp and new_data["Time"][0] == last_existing_timestamp:
+            # A new candle has opened: replace the last forming values with the closed candle and roll forward
+            self.kline_helper._pop_tail_data(self.data)
+            self.kline_helper.populate(self.data, latest_klines[-2:])
+            self._update_emas(new_candle=True)
         else:
             logger.error(
                 f"Timestamp mismatch for {self.pair}: Last: {last_existing_timestamp}, New: {latest_new_timestamp}. Resyncing."
             )
             self.fetch_klines()
 
-        self.df = pd.DataFrame(self.data)
-        self.timestamp = self.df["Time"].iloc[-1]
-
-    def calculate_all_emas(self) -> None:
-        """Calculate all required EMA values."""
-        self.df["EMA_200"] = ema_indicator(self.df["Close"], 200)
-        self.ema_200_value = self.df["EMA_200"].iloc[-1]
+        self.timestamp = self.data["Time"][-1]
 
-        self.df["EMA_35"] = ema_indicator(self.df["Close"], 34)
-        self.ema_35_value = self.df["EMA_35"].iloc[-1]
+    def _resync_emas(self) -> None:
+        """Rebuilds the EMA state and columns from the closed candles in the buffer."""
+        close = self.data["Close"]
+        for column, ema in self.emas.items():
+            values = np.append(ema.seed(close[:-1]), np.nan)
+            forming = ema.update_forming(close[-1])
+            values[-1] = forming if forming is not None else np.nan
+            self.data[column] = values
+        self.calculate_all_emas()
+
+    def _update_emas(self, new_candle: bool) -> None:
+        """Applies the latest candle to the EMA state in O(1)."""
+        close = self.data["Close"]
+        for column, ema in self.emas.items():
+            if new_candle:
+                closed = ema.close_candle(close[-2])
+                self.data[column][-2] = closed if closed is not None else np.nan
+            forming = ema.update_forming(close[-1])
+            self.data[column][-1] = forming if forming is not None else np.nan
 
-        self.df["EMA_21"] = ema_indicator(self.df["Close"], 21)
-        self.ema_21_value = self.df["EMA_21"].iloc[-1]
+    def calculate_all_emas(self) -> None:
+        """Reads the latest EMA values, including the forming candle, from the streaming state."""
+        values = {column: ema.update_forming(self.data["Close"][-1]) for column, ema in self.emas.items()}
+        self.ema_200_value = values["EMA_200"]
+        self.ema_35_value = values["EMA_35"]
+        self.ema_21_value = values["EMA_21"]
 
     def to_csv(self, filename: str = "ema.csv") -> None:
         """Exports EMA data to a CSV file."""
-        self.df[["Time1", "Close", "EMA_200", "EMA_35"]].to_csv(filename, index=False)
+        self.data.to_frame(["Time1", "Close", "EMA_200", "EMA_35"]).to_csv(filename, index=False)
 
     def check_cross(
         self, time_frame: str, open_p: float, high: float, low: float, close: float, signal: Literal["BUY", "SELL"]
@@ -373,6 +458,60 @@ class EMA:
 # --- Utility Functions ---
 
 
+def has_value(value) -> bool:
+    """Whether an indicator cell is filled (None in dict-of-lists, NaN in a CandleBuffer)."""
+    return value is not None and value == value
+
+
+def write_indicator_row(data: CandleBuffer, index: int, values: Dict[str, float]) -> None:
+    """Writes indicator values (ATR, stops, direction) into one row of the candle store."""
+    for key, value in values.items():
+        data[key][index] = value
+
+
+def default_request_priority(limit: int) -> int:
+    """Bootstraps and other bulk fetches yield to the polling of the latest candles."""
+    return PRIORITY_BACKGROUND if limit > 2 else PRIORITY_ROUTINE
+
+
+def uses_future_api(exchange: str, pair: str) -> bool:
+    """Whether klines for the pair come from the Futures endpoints."""
+    return exchange == "future" or pair in NON_SPOT_PAIRS
+
+
+def create_kline_stream(pair: str, time_frame: str, exchange: str) -> KlineStream:
+    """Starts a kline stream for one pair, using REST only to seed it and repair gaps."""
+    return create_kline_streams([(pair, time_frame)], exchange)[(pair.upper(), time_frame)]
+
+
+def create_kline_streams(
+    subscriptions: List[Tuple[str, str]],
+    exchange: str,
+    rest_fetch: Callable[[str, str, int], List] = None,
+    on_update: Callable[[str, str, List[List], bool], None] = None,
+) -> Dict[Tuple[str, str], KlineStream]:
+    """Starts combined kline streams for many (pair, time_frame) subscriptions, one socket per endpoint and chunk."""
+    if rest_fetch is None:
+        rest_helper = KlineHelper(mode="normal", exchange=exchange)
+        binance_spot = Spot()
+        rest_fetch = lambda p, tf, limit: rest_helper.fetch_rest_klines(binance_spot, p, tf, limit)
+
+    groups: Dict[str, List[Tuple[str, str]]] = {}
+    for pair, time_frame in subscriptions:
+        base_url = FUTURE_STREAM_URL if uses_future_api(exchange, pair) else SPOT_STREAM_URL
+        groups.setdefault(os.environ.get("BINANCE_STREAM_URL", base_url), []).append((pair.upper(), time_frame))
+
+    streams: Dict[Tuple[str, str], KlineStream] = {}
+    for base_url, group in groups.items():
+        for start in range(0, len(group), MAX_STREAMS_PER_CONNECTION):
+            chunk = group[start : start + MAX_STREAMS_PER_CONNECTION]
+            stream = KlineStream(chunk, base_url=base_url, rest_fetch=rest_fetch, on_update=on_update)
+            for key in chunk:
+                streams[key] = stream
+            stream.start()
+    return streams
+
+
 def remove_file(filename) -> None:
     """Safely removes a file if it exists."""
     try:
@@ -412,6 +551,13 @@ def format_price_change(current: float, previous: float) -> str:
     return f"+{percent_change:.2f}%" if percent_change >= 0 else f"{percent_change:.2f}%"
 
 
+def pre_send_factor(time_frame: str) -> Optional[float]:
+    """Returns the candle fraction after which signals are pre-sent, or None when signals wait for the close."""
+    if time_frame not in PRE_SEND_TIME_FRAMES:
+        return None
+    return PRE_SEND_TIMING_FACTOR_5M if time_frame == "5m" else PRE_SEND_TIMING_FACTOR_DEFAULT
+
+
 def should_pre_send_signal(timestamp: float, time_frame: str) -> bool:
     """Checks if the current time is late enough in the candle's duration to pre-send a signal."""
     if time_frame not in TIME_FRAME_SECONDS:
@@ -428,7 +574,7 @@ def send_telegram_api_request(endpoint: str, body: Dict) -> Dict:
     try:
         url = f"{TELEGRAM_API_BASE_URL}/{endpoint}"
         headers = {"Content-Type": "application/json"}
-        response = requests.post(url, headers=headers, data=json.dumps(body), timeout=10)
+        response = http_client.post(url, headers=headers, data=json.dumps(body))
         response.raise_for_status()
         return response.json()
     except requests.RequestException as e:
@@ -448,135 +594,193 @@ def delete_telegram_message(body: Dict) -> bool:
     return res.get("status", False)
 
 
-# --- Core Strategy Logic ---
-
-
-def main(
-    data: Dict, token: str, time_frame: str, pair: str, version: str, time_sleep: int, mode: str, exchange: str
-) -> None:
-    # --- Initialization ---
-    size, length, mult, use_close, sub_size = (
-        CEConfig.SIZE.value,
-        CEConfig.LENGTH.value,
-        CEConfig.MULT.value,
-        CEConfig.USE_CLOSE.value,
-        CEConfig.SUB_SIZE.value,
-    )
-    if time_frame == "5m":
-        mult = 1.80
-
-    if not mode:
-        mode = "heikin_ashi"
-
-    logger.info(f"Starting {pair}: MODE: {mode}, SIZE: {size}, LENGTH: {length}, MULT: {mult}, USE_CLOSE: {use_close}")
+def send_telegram_images(body: Dict) -> List[int]:
+    """Sends chart images as a reply to a sent signal. Returns the ids of the image messages."""
+    res = send_telegram_api_request("sendImages", body)
+    if res.get("status") != "success":
+        return []
+    return res.get("message_id") or []
 
-    kline_helper = KlineHelper(mode=mode, exchange=exchange)
-    binance_spot = Spot()
-    chandelier_exit = ChandlierExit(size=size, length=length, multiplier=mult, use_close=use_close)
 
-    # Fetch initial data and calculate indicators
-    klines = kline_helper.fetch_klines(binance_spot, pair, time_frame, size)
-    kline_helper.populate(data, klines)
-    df_result = chandelier_exit.calculate_atr(pd.DataFrame(data))
-    data["ATR"] = df_result["ATR"].values.tolist()
-    chandelier_exit.calculate_chandelier_exit(data=data)
-
-    # State variables for the main loop
-    timestamp = data["Time"][size - 1]
-    counter = 1
-    has_sent_signal_this_candle = False
-    last_sent_message = {"message_id": None, "Time": None, "Direction": None, "Image": None, "Counter": None}
+# --- Core Strategy Logic ---
 
-    short_token = TOKEN_SHORTCUT.get(token, token)
-    token_for_log = token.ljust(12)
 
-    chandelier_exit_sub = ChandlierExit(size=sub_size, length=length, multiplier=mult, use_close=use_close)
+class ChandelierExitStrategy:
+    """State and per-tick logic of one token's strategy, shared by the process and asyncio runtimes.
+
+    `bootstrap` loads the initial candles, `update` applies the latest two klines (returning False
+    when they no longer line up and the strategy must restart) and `check_signals` sends or
+    deletes Telegram signals. Only `bootstrap` (without klines) and `fetch_latest_klines` do I/O
+    for market data, so a runtime can fetch the klines itself and hand them over.
+
+    With a `charts` client, charts are rendered by the chart pool: signals go out as text at once
+    and their charts follow as a reply when rendered.
+    """
+
+    def __init__(
+        self,
+        data: CandleBuffer,
+        token: str,
+        time_frame: str,
+        pair: str,
+        version: str,
+        time_sleep: int,
+        mode: str,
+        exchange: str,
+        source: KlineStream = None,
+        charts: ChartClient = None,
+    ):
+        # --- Initialization ---
+        size, length, mult, use_close = (
+            CEConfig.SIZE.value,
+            CEConfig.LENGTH.value,
+            CEConfig.MULT.value,
+            CEConfig.USE_CLOSE.value,
+        )
+        if time_frame == "5m":
+            mult = 1.80
 
-    # Trim initial data to a smaller working size
-    candles_to_trim = size - 200
-    for _ in range(candles_to_trim):
-        kline_helper._pop_top_data(data)
+        if not mode:
+            mode = "heikin_ashi"
 
-    size -= candles_to_trim
-    chandelier_exit.size = size
+        logger.info(
+            f"Starting {pair}: MODE: {mode}, SIZE: {size}, LENGTH: {length}, MULT: {mult}, USE_CLOSE: {use_close}"
+        )
 
-    ema_handler = EMA(pair=pair, time_frame=time_frame, mode=mode, exchange=exchange, size=1000)
-    ema_handler.fetch_klines()
-    time.sleep(1)
+        self.data = data
+        self.token = token
+        self.time_frame = time_frame
+        self.pair = pair
+        self.version = version
+        self.mode = mode
+        self.size = size
+        self.mult = mult
+        self.source = source
+        self.charts = charts
 
-    # --- Main Loop ---
-    while True:
-        # Fetch the latest two candles to handle updates and new candle events
-        data_temp_dict = init_kline_data_dict()
-        two_latest_klines = kline_helper.fetch_klines(binance_spot, pair, time_frame, 2)
-        ema_handler.update_klines(two_latest_klines)
+        self.kline_helper = KlineHelper(mode=mode, exchange=exchange, source=source)
+        self.binance_spot = Spot()
+        self.chandelier_exit = StreamingChandelierExit(multiplier=mult, length=length, use_close=use_close)
+        self.ema_handler = EMA(pair=pair, time_frame=time_frame, mode=mode, exchange=exchange, size=1000, source=source)
+        self.scheduler = CandleScheduler(time_frame, cadence=time_sleep, pre_send_factor=pre_send_factor(time_frame))
+
+        # State variables for the main loop
+        self.timestamp = 0.0
+        self.counter = 1
+        self.has_sent_signal_this_candle = False
+        self.last_sent_message = {"message_id": None, "Time": None, "Direction": None, "Image": None, "Counter": None}
+        # Chart replies from the chart pool, applied by the strategy thread on its next tick
+        self.chart_replies: queue.SimpleQueue = queue.SimpleQueue()
+        # Signals whose chart reply is still rendering, mapped to whether the signal was deleted meanwhile
+        self.pending_charts: Dict[Tuple[int, ...], bool] = {}
+
+        self.short_token = TOKEN_SHORTCUT.get(token, token)
+        self.token_for_log = token.ljust(12)
+
+    def bootstrap(self, klines: List = None, ema_klines: List = None) -> None:
+        """Loads the initial candles, fetching them when not given, and warms the indicators up."""
+        data = self.data
+        if klines is None:
+            klines = self.kline_helper.fetch_klines(self.binance_spot, self.pair, self.time_frame, self.size)
+
+        # Warm the indicator up on the closed candles, the last one is still forming
+        self.kline_helper.populate(data, klines)
+        for i in range(len(data) - 1):
+            write_indicator_row(data, i, self.chandelier_exit.close_candle(data.row(i)))
+        write_indicator_row(data, -1, self.chandelier_exit.update_forming(data.row(-1)))
+        self.timestamp = data["Time"][-1]
+
+        if ema_klines is None:
+            self.ema_handler.fetch_klines()
+        else:
+            self.ema_handler.load_klines(ema_klines)
 
-        kline_helper.populate(
-            data_temp_dict, two_latest_klines, prev_item={"Open": data["Open"][-3], "Close": data["Close"][-3]}
+    def poll_priority(self) -> int:
+        """Weight budget priority of the next poll of the latest candles."""
+        # Polls inside the pre-send window decide on a signal and go ahead of routine polls
+        in_pre_send_window = self.time_frame in PRE_SEND_TIME_FRAMES and should_pre_send_signal(
+            self.timestamp, self.time_frame
         )
+        return PRIORITY_SIGNAL if in_pre_send_window else PRIORITY_ROUTINE
 
-        percent_change_log = format_price_change(data_temp_dict["Close_p"][1], data_temp_dict["Close_p"][0])
-        print(
-            f"Time: {counter} M:{mult} W:{kline_helper.weight['m1']} {token_for_log} {percent_change_log} {data_temp_dict['Time1'][1]}"
-        )
+    def fetch_latest_klines(self) -> List:
+        """Fetches the latest two candles to handle updates and new candle events."""
+        return self.kline_helper.fetch_klines(self.binance_spot, self.pair, self.time_frame, 2, self.poll_priority())
+
+    def update(self, two_latest_klines: List) -> bool:
+        """Applies the latest two klines. Returns False when they do not line up and the strategy must restart."""
+        data, kline_helper = self.data, self.kline_helper
+        self.ema_handler.update_klines(two_latest_klines)
+        previous_kline, latest_kline = two_latest_klines[-2:]
 
         # --- Data Update Logic ---
-        is_candle_update = timestamp == data_temp_dict["Time"][1]
-        is_new_candle = timestamp == data_temp_dict["Time"][0]
+        is_candle_update = self.timestamp == int(latest_kline[0]) / 1000
+        is_new_candle = self.timestamp == int(previous_kline[0]) / 1000
 
         if is_candle_update:
             # The current candle is still forming, update its values
-            chandelier_exit.direction = data["Direction"][-3]
             kline_helper._pop_tail_data(data)
-            kline_helper._pop_tail_data(data)
-            kline_helper._append_data(data, data_temp_dict)
+            kline_helper.populate(data, [latest_kline])
         elif is_new_candle:
-            # A new candle has closed
-            counter += 1
-            timestamp = data_temp_dict["Time"][1]
-            has_sent_signal_this_candle = False
-            chandelier_exit.direction = data["Direction"][-2]
-            kline_helper._pop_top_data(data)
+            # A new candle has closed: commit its final values, then start the next one
+            self.counter += 1
+            self.timestamp = int(latest_kline[0]) / 1000
+            self.has_sent_signal_this_candle = False
             kline_helper._pop_tail_data(data)
-            kline_helper._append_data(data, data_temp_dict)
+            kline_helper.populate(data, [previous_kline])
+            write_indicator_row(data, -1, self.chandelier_exit.close_candle(data.row(-1)))
+            kline_helper.populate(data, [latest_kline])
         else:
             logger.info(
-                f"Time not match: {token} ts: {timestamp} 0: {data_temp_dict['Time'][0]} 1: {data_temp_dict['Time'][1]}"
+                f"Time not match: {self.token} ts: {self.timestamp} 0: {previous_kline[0]} 1: {latest_kline[0]}"
             )
-            break  # Restart the process
+            return False
 
-        # Recalculate indicators on the updated data
-        df_temp = chandelier_exit_sub.calculate_atr(pd.DataFrame(data_temp_dict))
-        data["ATR"][-sub_size:] = df_temp["ATR"].values.tolist()
-        chandelier_exit.calculate_chandelier_exit(data)
+        # Only the forming candle needs to be evaluated, closed candles are already final
+        write_indicator_row(data, -1, self.chandelier_exit.update_forming(data.row(-1)))
+
+        percent_change_log = format_price_change(float(latest_kline[4]), float(previous_kline[4]))
+        weight, candle_time = kline_helper.weight["m1"], data["Time1"][-1]
+        print(f"Time: {self.counter} M:{self.mult} W:{weight} {self.token_for_log} {percent_change_log} {candle_time}")
+        return True
+
+    def check_signals(self) -> None:
+        """Sends, pre-sends or deletes signals for the current state of the candles."""
+        data, token, time_frame, short_token = self.data, self.token, self.time_frame, self.short_token
+        timestamp, counter, ema_handler = self.timestamp, self.counter, self.ema_handler
+        self.apply_chart_replies()
 
         # --- Signal Logic ---
         # Index Aliases for Readability
-        LATEST, PREV, PREV_PREV = size - 1, size - 2, size - 3
+        LATEST, PREV, PREV_PREV = -1, -2, -3
 
         direction_flipped_on_latest = data["Direction"][LATEST] != data["Direction"][PREV]
         direction_flipped_on_prev = data["Direction"][PREV] != data["Direction"][PREV_PREV]
 
         # Logic for specific timeframes that allow pre-sending signals
-        can_pre_send_signal = time_frame in ("5m", "15m", "30m")
+        can_pre_send_signal = time_frame in PRE_SEND_TIME_FRAMES
 
         if can_pre_send_signal:
             # Delete an invalidated pre-sent signal if direction flips back
             if (
-                not has_sent_signal_this_candle
-                and last_sent_message["message_id"]
-                and last_sent_message["Direction"] != data["Direction"][LATEST]
-                and last_sent_message["Counter"] == counter - 1
+                not self.has_sent_signal_this_candle
+                and self.last_sent_message["message_id"]
+                and self.last_sent_message["Direction"] != data["Direction"][LATEST]
+                and self.last_sent_message["Counter"] == counter - 1
             ):
 
-                logger.info(f"Deleting invalid message: Token: {token} {last_sent_message}")
+                logger.info(f"Deleting invalid message: Token: {token} {self.last_sent_message}")
                 body_for_delete = {
-                    "time_frame": f"{time_frame}{'_normal' if mode == 'normal' else ''}",
-                    "message_id": last_sent_message["message_id"],
+                    "time_frame": f"{time_frame}{'_normal' if self.mode == 'normal' else ''}",
+                    "message_id": self.last_sent_message["message_id"],
                 }
                 if delete_telegram_message(body_for_delete):
-                    remove_file(last_sent_message["Image"])
-                    last_sent_message = {
+                    remove_file(self.last_sent_message["Image"])
+                    # A chart reply still rendering is deleted once it arrives
+                    deleted_key = tuple(self.last_sent_message["message_id"])
+                    if deleted_key in self.pending_charts:
+                        self.pending_charts[deleted_key] = True
+                    self.last_sent_message = {
                         "message_id": None,
                         "Time": None,
                         "Direction": None,
@@ -587,7 +791,7 @@ def main(
             # Pre-send a signal if a flip occurs on the latest candle
             if (
                 direction_flipped_on_latest
-                and not has_sent_signal_this_candle
+                and not self.has_sent_signal_this_candle
                 and should_pre_send_signal(timestamp, time_frame)
             ):
                 signal = "BUY" if data["Direction"][LATEST] == 1 else "SELL"
@@ -603,47 +807,43 @@ def main(
                     signal,
                 )
                 if not any(ema_cross.values()) and time_frame in ("5m", "15m"):
+                    # Keep checking on the next wake-up, the cross may still happen before the close
                     logger.info(f"Skipping signal for {token} due to no EMA cross.")
-                    continue
-
-                # Prepare and send signal
-                percent_change = format_price_change(data["Close_p"][LATEST], data["Close_p"][PREV])
-                next_candle_time = datetime.fromtimestamp(timestamp + TIME_FRAME_SECONDS[time_frame]).strftime("%H:%M")
-
-                body = {
-                    "signal": signal,
-                    "symbol": f"${short_token}",
-                    "time_frame": time_frame,
-                    "time": next_candle_time,
-                    "price": data["Close"][LATEST],
-                    "change": percent_change,
-                    "ema_cross": ema_cross,
-                }
-                # ... (rest of body modification and sending logic)
-                time.sleep(random.uniform(1.0, 3.0))  # Random sleep to avoid API rate limits
-                image_path = chart.get_charts(
-                    f"{short_token}", PAIR=pair, TIME_FRAME=time_frame, signal=signal, time1=next_candle_time
-                )
-                body["image"] = image_path
-
-                res = send_telegram_message(body)
-                if res and res.get("message_id"):
-                    has_sent_signal_this_candle = True
-                    last_sent_message.update(
-                        {
-                            "message_id": res.get("message_id"),
-                            "Counter": counter,
-                            "Direction": data["Direction"][LATEST],
-                            "Image": image_path,
-                            "Time": next_candle_time,
-                        }
-                    )
-                    logger.info(f"Signal pre-sent: {body} | message_id: {res.get('message_id')}")
                 else:
-                    logger.error(f"Failed to pre-send signal: {body}")
+                    # Prepare and send signal
+                    percent_change = format_price_change(data["Close_p"][LATEST], data["Close_p"][PREV])
+                    next_candle_open = timestamp + TIME_FRAME_SECONDS[time_frame]
+                    next_candle_time = datetime.fromtimestamp(next_candle_open).strftime("%H:%M")
+
+                    body = {
+                        "signal": signal,
+                        "symbol": f"${short_token}",
+                        "time_frame": time_frame,
+                        "time": next_candle_time,
+                        "price": float(data["Close"][LATEST]),
+                        "change": percent_change,
+                        "ema_cross": ema_cross,
+                    }
+                    # ... (rest of body modification and sending logic)
+                    res = self.send_signal(body, next_candle_time)
+                    image_path = body["image"]
+                    if res and res.get("message_id"):
+                        self.has_sent_signal_this_candle = True
+                        self.last_sent_message.update(
+                            {
+                                "message_id": res.get("message_id"),
+                                "Counter": counter,
+                                "Direction": data["Direction"][LATEST],
+                                "Image": image_path,
+                                "Time": next_candle_time,
+                            }
+                        )
+                        logger.info(f"Signal pre-sent: {body} | message_id: {res.get('message_id')}")
+                    else:
+                        logger.error(f"Failed to pre-send signal: {body}")
 
         # Logic for sending signals on candle close (for all other timeframes)
-        elif direction_flipped_on_prev and not has_sent_signal_this_candle:
+        elif direction_flipped_on_prev and not self.has_sent_signal_this_candle:
             signal = "BUY" if data["Direction"][PREV] == 1 else "SELL"
             percent_change = format_price_change(data["Close_p"][PREV], data["Close_p"][PREV_PREV])
 
@@ -657,33 +857,108 @@ def main(
                 "symbol": f"${short_token}",
                 "time_frame": time_frame,
                 "time": data["Time1"][PREV][11:],
-                "price": data["Close"][PREV],
+                "price": float(data["Close"][PREV]),
                 "change": percent_change,
                 "ema_cross": ema_cross,
             }
             # ... (body modification and sending logic)
-            image_path = chart.get_charts(
-                f"{short_token}", PAIR=pair, TIME_FRAME=time_frame, signal=signal, time1=data["Time1"][PREV][11:]
-            )
-            body["image"] = image_path
-
-            res = send_telegram_message(body)
+            res = self.send_signal(body, data["Time1"][PREV][11:])
             if res:
-                has_sent_signal_this_candle = True
+                self.has_sent_signal_this_candle = True
                 logger.info(f"Signal sent: {body}")
             else:
                 logger.error(f"Failed to send signal: {body}")
 
-        time.sleep(time_sleep)
+    def send_signal(self, body: Dict, time1: str) -> Optional[Dict]:
+        """Sends a signal with its charts, rendering them here or, with a chart pool, sending them when ready."""
+        chart_args = {"title": self.short_token, "PAIR": self.pair, "TIME_FRAME": self.time_frame, "time1": time1}
+        if self.charts is None:
+            with CHART_LOCK:
+                body["image"] = chart.get_charts(signal=body["signal"], **chart_args)
+            return send_telegram_message(body)
+
+        body["image"] = []
+        res = send_telegram_message(body)
+        if res and res.get("message_id"):
+            message_ids = list(res["message_id"])
+            self.pending_charts[tuple(message_ids)] = False
+            attach = lambda paths: self._attach_charts(body["time_frame"], message_ids, paths)
+            self.charts.submit(attach, signal=body["signal"], **chart_args)
+        return res
+
+    def _attach_charts(self, time_frame: str, message_ids: List[int], paths: Optional[List[str]]) -> None:
+        """Chart pool callback: replies to the signal with its charts and hands the reply to the strategy thread."""
+        image_ids = []
+        if paths:
+            # Replying to a message that was deleted in the meantime fails, so nothing is left behind
+            image_ids = send_telegram_images({"time_frame": time_frame, "message_id": message_ids, "image": paths})
+        self.chart_replies.put((time_frame, message_ids, image_ids, paths))
+
+    def apply_chart_replies(self) -> None:
+        """Records the chart replies that arrived since the last tick with the signals they belong to."""
+        while True:
+            try:
+                time_frame, message_ids, image_ids, paths = self.chart_replies.get_nowait()
+            except queue.Empty:
+                return
+            if self.pending_charts.pop(tuple(message_ids), False):
+                # The signal was deleted while its charts were sent
+                if image_ids:
+                    delete_telegram_message({"time_frame": time_frame, "message_id": image_ids})
+                remove_file(paths or [])
+            elif image_ids and self.last_sent_message["message_id"] == message_ids:
+                # Deleting an invalidated pre-sent signal also deletes its charts
+                self.last_sent_message.update({"message_id": message_ids + image_ids, "Image": paths})
+
 
+def main(
+    data: CandleBuffer,
+    token: str,
+    time_frame: str,
+    pair: str,
+    version: str,
+    time_sleep: int,
+    mode: str,
+    exchange: str,
+    source: KlineStream = None,
+    charts: ChartClient = None,
+) -> None:
+    strategy = ChandelierExitStrategy(
+        data, token, time_frame, pair, version, time_sleep, mode, exchange, source, charts
+    )
+    strategy.bootstrap()
+    time.sleep(1)
 
-def run_strategy(token: str, time_frame: str, pair: str, version: str, time_sleep: int, mode: str, exchange: str):
+    # --- Main Loop ---
+    while True:
+        if not strategy.update(strategy.fetch_latest_klines()):
+            break  # Restart the process
+        strategy.check_signals()
+
+        # Sleep until the next decision point, waking early if the stream reports a new candle
+        strategy.scheduler.wait(strategy.timestamp, source, pair)
+
+
+def run_strategy(
+    token: str,
+    time_frame: str,
+    pair: str,
+    version: str,
+    time_sleep: int,
+    mode: str,
+    exchange: str,
+    stream: bool = False,
+    hub_client: HubClient = None,
+    chart_client: ChartClient = None,
+):
     """A wrapper function to run the main strategy in a resilient loop."""
+    # The stream outlives strategy restarts so a restart does not reconnect the socket
+    source = hub_client or (create_kline_stream(pair, time_frame, exchange) if stream else None)
     while True:
         try:
             logger.info(f"Starting strategy for {token} {time_frame} {pair}")
-            data = init_kline_data_dict()
-            main(data, token, time_frame, pair, version, time_sleep, mode, exchange)
+            data = CandleBuffer(CEConfig.SIZE.value)
+            main(data, token, time_frame, pair, version, time_sleep, mode, exchange, source, chart_client)
         except Exception:
             logger.error(f"[{token}] Unhandled exception in strategy: {traceback.format_exc()}")
             time.sleep(5)  # Wait before restarting
@@ -693,11 +968,29 @@ def run_strategy(token: str, time_frame: str, pair: str, version: str, time_slee
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Run a Chandelier Exit trading bot strategy.")
-    parser.add_argument("--timeframe", type=str, help="Time frame (e.g., '5m', '1h')", default="5m")
-    parser.add_argument("--sleep", type=int, help="Sleep time in seconds between loops", default=10)
+    parser.add_argument(
+        "--timeframe", type=str, help="Time frame (e.g., '5m', '1h'), or several separated by commas", default="5m"
+    )
+    parser.add_argument(
+        "--sleep", type=int, help="Seconds between checks inside a candle (pre-send time frames only)", default=10
+    )
     parser.add_argument("--mode", type=str, help="Chart mode: 'heikin_ashi' or 'normal'", default="")
     parser.add_argument("--exchange", type=str, help="Exchange: 'future' or 'spot'", default="future")
     parser.add_argument("--version", type=str, help="Strategy version suffix for identification", default="")
+    parser.add_argument("--stream", action="store_true", help="Use kline WebSocket streams instead of REST polling")
+    parser.add_argument("--hub", action="store_true", help="Share one market data hub process across all tokens")
+    parser.add_argument(
+        "--runtime",
+        choices=["process", "async"],
+        default="process",
+        help="'process' runs one OS process per token, 'async' runs every token as a coroutine of one process",
+    )
+    parser.add_argument(
+        "--chart-workers",
+        type=int,
+        help="Chart render worker processes; 0 renders charts inside each strategy before sending",
+        default=CHART_WORKERS,
+    )
     args = parser.parse_args()
 
     # This mapping determines which token list to use based on settings
@@ -718,24 +1011,71 @@ if __name__ == "__main__":
         "4h": "tokens.txt",
     }
 
-    # Construct the key to find the correct token file
-    file_key = f"{args.timeframe}{args.mode}{args.version}"
-    token_file = token_list_files.get(file_key)
+    strategies = []
+    for time_frame in args.timeframe.split(","):
+        # Construct the key to find the correct token file
+        file_key = f"{time_frame}{args.mode}{args.version}"
+        token_file = token_list_files.get(file_key)
 
-    if not token_file or not os.path.exists(token_file):
-        logger.error(f"Could not find a valid token file for key '{file_key}'. Exiting.")
-        exit(1)
+        if not token_file or not os.path.exists(token_file):
+            logger.error(f"Could not find a valid token file for key '{file_key}'. Exiting.")
+            exit(1)
 
-    with open(token_file, "r") as file:
-        tokens = [line.strip() for line in file if line.strip()]
+        with open(token_file, "r") as file:
+            tokens = [line.strip() for line in file if line.strip()]
 
-    strategies = [(token, args.timeframe, f"{token}USDT") for token in tokens]
+        strategies += [(token, time_frame, f"{token}USDT") for token in tokens]
 
     processes = []
 
+    # Every process forked from here on draws from the same request weight budget
+    install_budget(WeightBudget())
+
+    # One hub per host fetches and streams each pair once (resampling larger time frames from the
+    # smallest one) and fans candles out to the workers
+    hub = MarketDataHub([(pair, tf) for _, tf, pair in strategies], exchange=args.exchange) if args.hub else None
+    hub_clients = {(token, tf): hub.client(i) for i, (token, tf, _) in enumerate(strategies)} if hub else {}
+    if hub:
+        hub.start()
+
+    # Signals go out as text at once, their charts are rendered off the strategy loop and follow as a reply
+    chart_pool = ChartPool(args.chart_workers) if args.chart_workers > 0 else None
+    chart_clients = {}
+    if chart_pool:
+        if args.runtime == "async":
+            # The coroutines share the one client of their process
+            shared_client = chart_pool.client(0)
+            chart_clients = {(token, tf): shared_client for token, tf, _ in strategies}
+        else:
+            chart_clients = {(token, tf): chart_pool.client(i) for i, (token, tf, _) in enumerate(strategies)}
+        chart_pool.start()
+
+    if args.runtime == "async":
+        # Every token runs as a coroutine of this process; restarts happen per coroutine
+        import async_runtime
+
+        sources = dict(hub_clients)
+        if args.stream and not hub:
+            streams = create_kline_streams([(pair, tf) for _, tf, pair in strategies], args.exchange)
+            sources = {(token, tf): streams[(pair.upper(), tf)] for token, tf, pair in strategies}
+        async_runtime.run(strategies, args.version, args.sleep, args.mode, args.exchange, sources, hub, chart_clients)
+        exit(0)
+
     def start_process(token, tf, pair):
         process = multiprocessing.Process(
-            target=run_strategy, args=(token, tf, pair, args.version, args.sleep, args.mode, args.exchange)
+            target=run_strategy,
+            args=(
+                token,
+                tf,
+                pair,
+                args.version,
+                args.sleep,
+                args.mode,
+                args.exchange,
+                args.stream,
+                hub_clients.get((token, tf)),
+                chart_clients.get((token, tf)),
+            ),
         )
         process.start()
         return process
@@ -744,12 +1084,18 @@ if __name__ == "__main__":
     active_processes = {}
     for token, time_frame, pair in strategies:
         process = start_process(token, time_frame, pair)
-        active_processes[token] = (process, time_frame, pair)
+        active_processes[(token, time_frame)] = (process, time_frame, pair)
 
     while True:
         time.sleep(30)  # Check on processes periodically
-        for token, (process, tf, pair) in list(active_processes.items()):
+        if hub and not hub.is_alive():
+            logger.warning("Market data hub stopped. Restarting...")
+            hub.start()
+        if chart_pool and not chart_pool.is_alive():
+            logger.warning("Chart workers stopped. Restarting...")
+            chart_pool.start()
+        for (token, _), (process, tf, pair) in list(active_processes.items()):
             if not process.is_alive():
                 logger.warning(f"Process for [{token}] on {tf} stopped. Restarting...")
                 new_process = start_process(token, tf, pair)
-                active_processes[token] = (new_process, tf, pair)
+                active_processes[(token, tf)] = (new_process, tf, pair)
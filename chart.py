@@ -1,18 +1,107 @@
 import pandas as pd
 import mplfinance as mpf
 import matplotlib.pyplot as plt
+from chart_cache import get_panel_cache
+from kline_stream import interval_to_ms
 from logger import logger
 import zlma
 from PIL import Image
 import os
 from datetime import datetime
+from typing import List, Optional
 import numpy as np
 
+# --- Constants ---
 
-def generate_chart(title, PAIR, TIME_FRAME, view, mode, scale=0.7):
+# Encoding of the chart images handed to Telegram and the gallery: png, jpeg or webp
+CHART_IMAGE_FORMAT = os.environ.get("CHART_IMAGE_FORMAT", "png").lower()
+
+# zlib level of png images, 0 (fastest, largest) to 9 (slowest, smallest)
+CHART_COMPRESS_LEVEL = int(os.environ.get("CHART_COMPRESS_LEVEL", 6))
+
+# Quality of jpeg and webp images, 1 to 100
+CHART_IMAGE_QUALITY = int(os.environ.get("CHART_IMAGE_QUALITY", 90))
+
+# File extension of each image format
+IMAGE_EXTENSIONS = {"png": "png", "jpeg": "jpg", "webp": "webp"}
+
+# Resolution the panels are rendered at
+CHART_DPI = 400
+
+# Panel renderer: "mplfinance" builds a figure per panel, "template" reuses one figure per (time frame, scale),
+# "raster" draws the panel straight onto an image (see chart_fast)
+CHART_RENDERER = os.environ.get("CHART_RENDERER", "mplfinance").lower()
+
+
+# --- In-memory images ---
+
+
+def render_figure(fig, dpi: int = CHART_DPI) -> Image.Image:
+    """Draws `fig` on its Agg canvas and crops it like `savefig(bbox_inches="tight")`, without encoding."""
+    fig.set_dpi(dpi)
+    fig.canvas.draw()
+    pixels = np.asarray(fig.canvas.buffer_rgba())
+    height, width = pixels.shape[:2]
+    bbox = fig.get_tightbbox(fig.canvas.get_renderer()).padded(plt.rcParams["savefig.pad_inches"])
+    # The bbox is in inches from the bottom left corner, the buffer rows start at the top;
+    # the crop is sized like the canvas savefig would resize the figure to
+    left, top = round(bbox.x0 * dpi), height - round(bbox.y1 * dpi)
+    right, bottom = left + int(bbox.width * dpi), top + int(bbox.height * dpi)
+    crop = pixels[max(top, 0) : min(bottom, height), max(left, 0) : min(right, width)]
+    return Image.fromarray(crop.copy(), "RGBA")
+
+
+def save_image(image: Image.Image, path_prefix: str) -> str:
+    """Encodes `image` once in `CHART_IMAGE_FORMAT` to `path_prefix` plus the format's extension."""
+    image_format = CHART_IMAGE_FORMAT if CHART_IMAGE_FORMAT in IMAGE_EXTENSIONS else "png"
+    path = f"{path_prefix}.{IMAGE_EXTENSIONS[image_format]}"
+    if image_format == "png":
+        image.save(path, format="PNG", compress_level=CHART_COMPRESS_LEVEL)
+    else:
+        image.convert("RGB").save(path, format=image_format.upper(), quality=CHART_IMAGE_QUALITY)
+    return path
+
+
+def remove_prefixed(directory: str, prefix: str) -> None:
+    """Removes the files of `directory` whose name starts with `prefix`, from one directory listing."""
     try:
-        image_path = f"{title}.png"
-        df = zlma.fetch_zlsma(PAIR, TIME_FRAME, view, mode)
+        entries = list(os.scandir(directory))
+    except OSError:
+        return
+    for entry in entries:
+        if entry.name.startswith(prefix) and entry.is_file():
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+
+
+# --- Rendering ---
+
+
+def generate_chart(title, PAIR, TIME_FRAME, view, mode, scale=0.7, provider=None, cache=None) -> Optional[Image.Image]:
+    try:
+        # `provider(pair, time_frame, limit)` supplies the candles, see zlma.CandleProvider
+        df = zlma.fetch_zlsma(PAIR, TIME_FRAME, view, mode, provider)
+
+        # A cached panel is reused until its candle closes or the forming candle moves too much
+        if cache:
+            series = cache.series(PAIR, TIME_FRAME, mode, view, scale, CHART_RENDERER)
+            closed_open = df["Time"].iloc[-2]
+            forming = df[["High", "Low", "Close"]].iloc[-1].tolist()
+            image = cache.get(series, closed_open, forming)
+            if image is not None:
+                return image
+
+        if CHART_RENDERER in ("template", "raster"):
+            import chart_fast
+
+            renderer = chart_fast.template_panel if CHART_RENDERER == "template" else chart_fast.raster_panel
+            image = renderer(df, TIME_FRAME, scale)
+            if cache:
+                cache.put(series, closed_open, forming, image)
+            return image
+
         df.loc[:, "Time1"] = pd.to_datetime(df["Time1"])  # Ensure Time1 is datetime
 
         # Set index for mplfinance
@@ -127,13 +216,15 @@ def generate_chart(title, PAIR, TIME_FRAME, view, mode, scale=0.7):
         ax.tick_params(axis="x", colors="white")
         ax.tick_params(axis="y", colors="white")
 
-        # Save the chart
-        plt.savefig(image_path, bbox_inches="tight", facecolor="#181a20", dpi=400)
+        # Render the chart to memory, it is encoded once as part of the composite
+        image = render_figure(fig)
         plt.close(fig)
 
-        return image_path
+        if cache:
+            cache.put(series, closed_open, forming, image)
+        return image
     except Exception as e:
-        logger.error(f"Error generating chart: {e}")
+        logger.error(f"Error generating chart {title}: {e}")
         return None
 
 
@@ -164,35 +255,17 @@ def concatenate_images_list(images, direction="horizontal"):
     return new_image
 
 
-def concatenate_images_2d(image_paths_2d, output_path):
+def concatenate_images_2d(images_2d: List[List[Image.Image]]) -> Image.Image:
     """Concatenate images from a 2D array: horizontally within rows, then vertically across rows."""
-    try:
-        # Step 1: Process each row by concatenating images horizontally
-        row_images = []
-        for row in image_paths_2d:
-            if not row:  # Skip empty rows
-                continue
-            # Open all images in the current row
-            images = [Image.open(path) for path in row]
-            if not images:  # Skip if no valid images in row
-                continue
-            # Concatenate images in this row horizontally
-            row_image = concatenate_images_list(images, direction="horizontal")
-            row_images.append(row_image)
-
-        # Check if there are any row images to concatenate
-        if not row_images:
-            raise ValueError("No images to concatenate")
-
-        # Step 2: Concatenate all row images vertically
-        final_image = concatenate_images_list(row_images, direction="vertical")
-
-        # Save the final image to the specified output path
-        final_image.save(output_path)
-        print(f"Images successfully concatenated and saved as {output_path}")
+    # Step 1: Process each row by concatenating images horizontally, skipping empty rows
+    row_images = [concatenate_images_list(row, direction="horizontal") for row in images_2d if row]
 
-    except Exception as e:
-        print(f"An error occurred: {str(e)}")
+    # Check if there are any row images to concatenate
+    if not row_images:
+        raise ValueError("No images to concatenate")
+
+    # Step 2: Concatenate all row images vertically
+    return concatenate_images_list(row_images, direction="vertical")
 
 
 PARI_MAP = {
@@ -217,44 +290,40 @@ PARI_MAP = {
 }
 
 
-def get_charts(title, PAIR, TIME_FRAME, signal, time1):
+def get_charts(title, PAIR, TIME_FRAME, signal, time1, provider=None):
     try:
         items = PARI_MAP[TIME_FRAME]
-        image_paths = []
+        images = []
         for sublist in items:
-            row_paths = []
+            row_images = []
             for item in sublist:
                 tf = item["tf"]
                 view = item["view"]
                 mode = item["mode"]
                 scale = item["scale"]
                 chart_title = f"{TIME_FRAME}_{title}_{tf}"
-                image_path = generate_chart(chart_title, PAIR, tf, view, mode, scale)
-                if image_path:
-                    row_paths.append(image_path)
-            image_paths.append(row_paths)
-
-        if image_paths:
+                # Only panels of a higher time frame than the signal's are cached
+                cache = get_panel_cache() if interval_to_ms(tf) > interval_to_ms(TIME_FRAME) else None
+                image = generate_chart(chart_title, PAIR, tf, view, mode, scale, provider, cache)
+                if image is not None:
+                    row_images.append(image)
+            images.append(row_images)
+
+        if images:
             create_time_ns = datetime.now().timestamp()
 
-            if TIME_FRAME == "5m" and len(image_paths) >= 2:
-                prefix_temp = f"static_temp/{TIME_FRAME}_{title}_"
-                os.system(f"rm {prefix_temp}*")  # Clean up previous files
-                output_path_temp = f"{prefix_temp}{signal}_{time1}_{create_time_ns}.png"
-                output_path_temp2 = f"{prefix_temp}{signal}_{time1}_{create_time_ns}_2.png"
-                concatenate_images_2d([[image_paths[0][0]]], output_path_temp)
-                concatenate_images_2d([[image_paths[1][0]]], output_path_temp2)
-
-            prefix = f"static/{TIME_FRAME}_{title}_"
-            os.system(f"rm {prefix}*")
-            output_path = f"{prefix}{signal}_{time1}_{create_time_ns}.png"
-            concatenate_images_2d(image_paths, output_path)
-
-            for path in image_paths:
-                for img_path in path:
-                    if os.path.exists(img_path):
-                        print(f"Removing temporary image: {img_path}")
-                        os.remove(img_path)
+            # Panels stay in memory, each output below is encoded once
+            if TIME_FRAME == "5m" and len(images) >= 2:
+                prefix_temp = f"{TIME_FRAME}_{title}_"
+                remove_prefixed("static_temp", prefix_temp)  # Clean up previous files
+                path_temp = f"static_temp/{prefix_temp}{signal}_{time1}_{create_time_ns}"
+                output_path_temp = save_image(concatenate_images_2d([[images[0][0]]]), path_temp)
+                output_path_temp2 = save_image(concatenate_images_2d([[images[1][0]]]), f"{path_temp}_2")
+
+            prefix = f"{TIME_FRAME}_{title}_"
+            remove_prefixed("static", prefix)
+            output_path = save_image(concatenate_images_2d(images), f"static/{prefix}{signal}_{time1}_{create_time_ns}")
+            logger.info(f"Images successfully concatenated and saved as {output_path}")
 
             if TIME_FRAME == "5m":
                 return [output_path_temp, output_path_temp2]
@@ -263,4 +332,4 @@ def get_charts(title, PAIR, TIME_FRAME, signal, time1):
         return None
     except Exception as e:
         logger.error(f"Error getting charts: {e}, traceback: {e.__traceback__}")
-        return None
\ No newline at end of file
+        return None
@@ -0,0 +1,109 @@
+import json
+import os
+from typing import Optional, Sequence
+
+from PIL import Image
+
+from logger import logger
+
+# --- Constants ---
+
+# Directory of the cached panels; set it to an empty string to disable the cache
+CHART_CACHE_DIR = os.environ.get("CHART_CACHE_DIR", "chart_cache")
+
+# Disk budget of the cache, least recently used panels are evicted beyond it
+CHART_CACHE_MAX_BYTES = int(os.environ.get("CHART_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+
+# Relative move of the forming candle's high, low or close after which a cached panel is rendered again
+CHART_CACHE_TOLERANCE = 0.002
+
+# zlib level of the cached panels, low since they are decoded again on every hit
+CHART_CACHE_COMPRESS_LEVEL = 1
+
+
+class PanelCache:
+    """Rendered chart panels on disk, keyed by (pair, time frame, mode, view, scale, renderer, last closed candle).
+
+    A higher time frame panel looks the same for every lower time frame signal until its candle
+    closes, so it is reused while the forming candle stays within `tolerance` of the one it was
+    rendered with. A panel for a newer closed candle replaces the older ones of its series; the
+    rest is bounded by `max_bytes` with least-recently-used eviction (hits refresh the file mtime).
+
+    Each entry is `<key>.png` with its forming candle in `<key>.json`.
+    """
+
+    def __init__(
+        self,
+        root: str = CHART_CACHE_DIR,
+        max_bytes: int = CHART_CACHE_MAX_BYTES,
+        tolerance: float = CHART_CACHE_TOLERANCE,
+    ):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.tolerance = tolerance
+        os.makedirs(root, exist_ok=True)
+
+    @staticmethod
+    def series(pair: str, time_frame: str, mode: str, view: int, scale: float, renderer: str = "") -> str:
+        return f"{pair.upper()}_{time_frame}_{mode}_{view}_{scale}_{renderer}_"
+
+    def _path(self, series: str, closed_open: float, ext: str) -> str:
+        return os.path.join(self.root, f"{series}{int(closed_open)}.{ext}")
+
+    def get(self, series: str, closed_open: float, forming: Sequence[float]) -> Optional[Image.Image]:
+        """Returns the cached panel when it is still valid for the `forming` (high, low, close)."""
+        png_path = self._path(series, closed_open, "png")
+        try:
+            with open(self._path(series, closed_open, "json"), "r") as file:
+                cached = json.load(file)["forming"]
+            if any(abs(now - then) > abs(then) * self.tolerance for now, then in zip(forming, cached)):
+                return None
+            with Image.open(png_path) as image:
+                image.load()
+            os.utime(png_path)
+        except (OSError, ValueError, KeyError):
+            return None
+        return image
+
+    def put(self, series: str, closed_open: float, forming: Sequence[float], image: Image.Image) -> None:
+        """Stores a rendered panel, dropping the panels of older candles of its series."""
+        try:
+            for entry in os.scandir(self.root):
+                stale = entry.name.startswith(series) and not entry.name.startswith(f"{series}{int(closed_open)}.")
+                if stale and not entry.name.endswith(".tmp"):
+                    os.remove(entry.path)
+            png_path = self._path(series, closed_open, "png")
+            tmp_path = f"{png_path}.{os.getpid()}.tmp"
+            image.save(tmp_path, format="PNG", compress_level=CHART_CACHE_COMPRESS_LEVEL)
+            os.replace(tmp_path, png_path)
+            json_path = self._path(series, closed_open, "json")
+            with open(f"{json_path}.{os.getpid()}.tmp", "w") as file:
+                json.dump({"forming": [float(value) for value in forming]}, file)
+            os.replace(f"{json_path}.{os.getpid()}.tmp", json_path)
+            self._evict()
+        except OSError as e:
+            logger.warning(f"Could not cache chart panel {series}: {e}")
+
+    def _evict(self) -> None:
+        entries = [entry for entry in os.scandir(self.root) if entry.name.endswith(".png")]
+        total = sum(entry.stat().st_size for entry in entries)
+        for entry in sorted(entries, key=lambda entry: entry.stat().st_mtime):
+            if total <= self.max_bytes:
+                break
+            total -= entry.stat().st_size
+            for path in (entry.path, entry.path[: -len("png")] + "json"):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+
+_cache: Optional[PanelCache] = None
+
+
+def get_panel_cache() -> Optional[PanelCache]:
+    """Returns the panel cache under `CHART_CACHE_DIR`, or None when the cache is disabled."""
+    global _cache
+    if _cache is None and CHART_CACHE_DIR:
+        _cache = PanelCache(CHART_CACHE_DIR)
+    return _cache
@@ -0,0 +1,245 @@
+import os
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from matplotlib import get_data_path
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.collections import LineCollection, PolyCollection
+from matplotlib.figure import Figure
+from matplotlib.ticker import FuncFormatter, MaxNLocator
+from PIL import Image, ImageDraw, ImageFont
+
+from chart import CHART_DPI, render_figure
+
+# --- Constants ---
+
+# Colors of the panels, as drawn by chart.generate_chart
+BACKGROUND = "#181a20"
+GREEN = "#11aa91"
+RED = "#fc3852"
+TEXT = "white"
+
+# Grey wick of the higher time frames: (0.7216, 0.7216, 0.7216, 0.78) blended over the background
+WICK = "#959597"
+
+# Time frames whose wicks take the color of their candle
+COLORED_WICK_TIME_FRAMES = ("5m", "15m")
+
+# Panel width in inches; the height is `scale` times the width
+PANEL_WIDTH = 13
+
+# Body width of a candle in candle spacings, and its line width in points (mplfinance's for ~50 candles)
+CANDLE_WIDTH = 0.5
+CANDLE_LINEWIDTH = 0.75
+
+# Lines over the candles: (column, width in points, color); EMAs without a color are red below the EMA 34
+LINES = (
+    ("EMA_15", 0.7, None),
+    ("EMA_21", 0.7, None),
+    ("EMA_34", 0.8, None),
+    ("ZLSMA_34", 1.0, "white"),
+    ("ZLSMA_50", 1.0, "yellow"),
+)
+
+# Autoscale margin of both axes, matplotlib's axes.xmargin/ymargin
+AXIS_MARGIN = 0.05
+
+# Font size of the tick labels in points, and the length of the tick marks
+FONT_SIZE = 10
+TICK_LENGTH = 3.5
+
+# Margins of the raster panel around the plot area, in inches: left, top, right, bottom
+RASTER_MARGINS = (0.75, 0.1, 0.1, 0.4)
+
+# Ticks per axis of the raster panel
+RASTER_Y_TICKS = 7
+RASTER_X_TICKS = 8
+
+
+# --- Panel data ---
+
+
+def panel_data(df: pd.DataFrame) -> Dict:
+    """Candles, candle colors, limits and lines of a `zlma.fetch_zlsma` frame as plain arrays."""
+    ohlc = df[["Open", "High", "Low", "Close"]].to_numpy(dtype=float)
+    close = ohlc[:, 3]
+    # First candle is green; the others depend on the previous close
+    up = np.r_[True, close[1:] > close[:-1]]
+
+    below = (df["EMA_15"] < df["EMA_34"]).to_numpy()
+    lines = []
+    for column, width, color in LINES:
+        values = df[column].to_numpy(dtype=float)
+        if color:
+            lines.append((values, color, width))
+        else:
+            lines.append((np.where(below, values, np.nan), RED, width))
+            lines.append((np.where(~below, values, np.nan), GREEN, width))
+
+    n = len(ohlc)
+    finite = [values[np.isfinite(values)] for values, _, _ in lines]
+    low = min([np.nanmin(ohlc[:, 2])] + [values.min() for values in finite if len(values)])
+    high = max([np.nanmax(ohlc[:, 1])] + [values.max() for values in finite if len(values)])
+    x0, x1 = -CANDLE_WIDTH / 2, n - 1 + CANDLE_WIDTH / 2
+    # A flat series still gets a price range to scale
+    y_margin = (high - low) * AXIS_MARGIN or abs(high) * AXIS_MARGIN or 1
+    return {
+        "ohlc": ohlc,
+        "up": up,
+        "lines": lines,
+        "times": pd.to_datetime(df["Time1"]).dt.strftime("%H:%M").tolist(),
+        "xlim": (x0 - (x1 - x0) * AXIS_MARGIN, x1 + (x1 - x0) * AXIS_MARGIN),
+        "ylim": (low - y_margin, high + y_margin),
+    }
+
+
+def line_runs(values: np.ndarray) -> List[Tuple[int, int]]:
+    """[start, end) index ranges of the consecutive finite values of a line."""
+    finite = np.r_[False, np.isfinite(values), False]
+    edges = np.flatnonzero(finite[1:] != finite[:-1])
+    return list(zip(edges[::2], edges[1::2]))
+
+
+# --- Template renderer ---
+
+
+class PanelTemplate:
+    """A matplotlib figure for one (time frame, scale) whose data artists are replaced for every panel.
+
+    The figure, axes styling, Agg canvas and renderer are built once; a panel only swaps the
+    wick and body collections, the line data, the limits and the time labels, then redraws.
+    """
+
+    def __init__(self, time_frame: str, scale: float, dpi: int = CHART_DPI):
+        self.time_frame = time_frame
+        self.dpi = dpi
+        self.fig = Figure(figsize=(PANEL_WIDTH, scale * PANEL_WIDTH), dpi=dpi, facecolor=BACKGROUND)
+        FigureCanvasAgg(self.fig)
+        ax = self.ax = self.fig.add_subplot()
+        ax.set_facecolor(BACKGROUND)
+        for spine in ax.spines.values():
+            spine.set_visible(False)
+        ax.tick_params(axis="x", colors=TEXT)
+        ax.tick_params(axis="y", colors=TEXT)
+        ax.set_ylabel("Price")
+
+        self.times: List[str] = []
+        ax.xaxis.set_major_locator(MaxNLocator(integer=True, steps=[1, 2, 2.5, 5, 10]))
+        ax.xaxis.set_major_formatter(FuncFormatter(self._time_label))
+
+        self.wicks = ax.add_collection(LineCollection([], linewidths=CANDLE_LINEWIDTH), autolim=False)
+        self.bodies = ax.add_collection(PolyCollection([], linewidths=CANDLE_LINEWIDTH), autolim=False)
+        self.lines = []
+
+    def _time_label(self, x: float, pos: Optional[int]) -> str:
+        i = int(round(x))
+        return self.times[i] if 0 <= i < len(self.times) and abs(x - i) < 1e-6 else ""
+
+    def render(self, df: pd.DataFrame) -> Image.Image:
+        data = panel_data(df)
+        ohlc, n = data["ohlc"], len(data["ohlc"])
+        x = np.arange(n, dtype=float)
+        colors = np.where(data["up"], GREEN, RED)
+
+        self.wicks.set_segments(np.stack([np.c_[x, ohlc[:, 2]], np.c_[x, ohlc[:, 1]]], axis=1))
+        self.wicks.set_colors(colors if self.time_frame in COLORED_WICK_TIME_FRAMES else WICK)
+        left, right = x - CANDLE_WIDTH / 2, x + CANDLE_WIDTH / 2
+        bottom, top = np.minimum(ohlc[:, 0], ohlc[:, 3]), np.maximum(ohlc[:, 0], ohlc[:, 3])
+        corners = [np.c_[left, bottom], np.c_[left, top], np.c_[right, top], np.c_[right, bottom]]
+        self.bodies.set_verts(np.stack(corners, axis=1))
+        self.bodies.set_facecolors(colors)
+        self.bodies.set_edgecolors(colors)
+
+        # The EMA split yields the same number of lines for every panel, so they are created once
+        while len(self.lines) < len(data["lines"]):
+            self.lines.append(self.ax.plot([], [])[0])
+        for line, (values, color, width) in zip(self.lines, data["lines"]):
+            line.set_data(x, values)
+            line.set_color(color)
+            line.set_linewidth(width)
+
+        self.times = data["times"]
+        self.ax.set_xlim(*data["xlim"])
+        self.ax.set_ylim(*data["ylim"])
+        return render_figure(self.fig, self.dpi)
+
+
+_templates: Dict[Tuple[str, float], PanelTemplate] = {}
+
+
+def template_panel(df: pd.DataFrame, time_frame: str, scale: float) -> Image.Image:
+    """Renders a panel on the reusable figure of its (time frame, scale)."""
+    key = (time_frame, scale)
+    if key not in _templates:
+        _templates[key] = PanelTemplate(time_frame, scale)
+    return _templates[key].render(df)
+
+
+# --- Raster renderer ---
+
+
+_fonts: Dict[int, ImageFont.FreeTypeFont] = {}
+
+
+def _font(size: int) -> ImageFont.FreeTypeFont:
+    # DejaVu Sans ships with matplotlib, so the labels match the other renderers
+    if size not in _fonts:
+        _fonts[size] = ImageFont.truetype(os.path.join(get_data_path(), "fonts", "ttf", "DejaVuSans.ttf"), size)
+    return _fonts[size]
+
+
+def _tick_label(value: float, step: float) -> str:
+    return f"{value:.{max(0, -int(np.floor(np.log10(step))))}f}"
+
+
+def raster_panel(df: pd.DataFrame, time_frame: str, scale: float, dpi: int = CHART_DPI) -> Image.Image:
+    """Draws a panel straight onto an image with PIL, for the candle and line layout of `PARI_MAP`.
+
+    Same content and colors as the matplotlib panels, without antialiasing or a figure: the
+    plot area is laid out with fixed margins and every primitive is a single PIL call.
+    """
+    data = panel_data(df)
+    ohlc, n = data["ohlc"], len(data["ohlc"])
+    points = lambda size: max(1, round(size * dpi / 72))
+    width, height = round(PANEL_WIDTH * dpi), round(scale * PANEL_WIDTH * dpi)
+    left, top, right, bottom = (round(margin * dpi) for margin in RASTER_MARGINS)
+    plot_width, plot_height = width - left - right, height - top - bottom
+    (xmin, xmax), (ymin, ymax) = data["xlim"], data["ylim"]
+    to_x = lambda x: left + (np.asarray(x) - xmin) / (xmax - xmin) * plot_width
+    to_y = lambda y: top + (ymax - np.asarray(y)) / (ymax - ymin) * plot_height
+
+    image = Image.new("RGB", (width, height), BACKGROUND)
+    draw = ImageDraw.Draw(image)
+    font, tick = _font(points(FONT_SIZE)), points(TICK_LENGTH)
+
+    # Axes: tick marks and labels on the left and bottom edges of the plot area
+    y_ticks = MaxNLocator(RASTER_Y_TICKS, steps=[1, 2, 2.5, 5, 10]).tick_values(ymin, ymax)
+    step = y_ticks[1] - y_ticks[0] if len(y_ticks) > 1 else 1
+    for value in y_ticks[(y_ticks >= ymin) & (y_ticks <= ymax)]:
+        y = to_y(value)
+        draw.line([(left - tick, y), (left, y)], fill=TEXT, width=points(0.8))
+        draw.text((left - 2 * tick, y), _tick_label(value, step), fill=TEXT, font=font, anchor="rm")
+    x_ticks = MaxNLocator(RASTER_X_TICKS, integer=True, steps=[1, 2, 2.5, 5, 10]).tick_values(0, n - 1)
+    for value in x_ticks[(x_ticks >= 0) & (x_ticks < n)]:
+        x = to_x(value)
+        draw.line([(x, top + plot_height), (x, top + plot_height + tick)], fill=TEXT, width=points(0.8))
+        draw.text((x, top + plot_height + 2 * tick), data["times"][int(value)], fill=TEXT, font=font, anchor="mt")
+
+    # Candles: wick, then the body, at least one pixel high
+    xs, half = to_x(np.arange(n)), CANDLE_WIDTH / 2 / (xmax - xmin) * plot_width
+    highs, lows = to_y(ohlc[:, 1]), to_y(ohlc[:, 2])
+    tops, bottoms = to_y(np.maximum(ohlc[:, 0], ohlc[:, 3])), to_y(np.minimum(ohlc[:, 0], ohlc[:, 3]))
+    colored_wick = time_frame in COLORED_WICK_TIME_FRAMES
+    for i in range(n):
+        color = GREEN if data["up"][i] else RED
+        wick = [(xs[i], highs[i]), (xs[i], lows[i])]
+        draw.line(wick, fill=color if colored_wick else WICK, width=points(CANDLE_LINEWIDTH))
+        draw.rectangle([xs[i] - half, tops[i], xs[i] + half, max(bottoms[i], tops[i] + 1)], fill=color)
+
+    # Lines, one polyline per run of values
+    for values, color, line_width in data["lines"]:
+        ys = to_y(values)
+        for start, end in line_runs(values):
+            draw.line(list(zip(xs[start:end], ys[start:end])), fill=color, width=points(line_width), joint="curve")
+    return image
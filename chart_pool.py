@@ -0,0 +1,116 @@
+import itertools
+import multiprocessing
+import os
+import threading
+import traceback
+from typing import Callable, Dict, List, Optional
+
+from logger import logger
+
+# --- Constants ---
+
+# Render worker processes per host; each renders one chart set at a time
+CHART_WORKERS = 2
+
+# Chart paths of one job, None when rendering failed
+ChartCallback = Callable[[Optional[List[str]]], None]
+
+
+class ChartPool:
+    """Chart render worker processes shared by every strategy of the host.
+
+    Rendering a chart set fetches klines for every chart and saves matplotlib figures at dpi=400,
+    which takes seconds. Strategies submit render jobs through a `ChartClient` and keep running;
+    the image paths come back on the client's reply queue. Only the workers load matplotlib and
+    mplfinance: each imports the chart stack when it starts, before its first job arrives.
+    """
+
+    def __init__(self, workers: int = CHART_WORKERS):
+        self.workers = workers
+        self.job_queue = multiprocessing.Queue()
+        self.reply_queues: Dict[int, multiprocessing.Queue] = {}
+        self.processes: List[Optional[multiprocessing.Process]] = [None] * workers
+
+    def client(self, client_id: int) -> "ChartClient":
+        """Creates the client handed to one strategy worker. Must be called before the workers fork."""
+        reply_queue = self.reply_queues.setdefault(client_id, multiprocessing.Queue())
+        return ChartClient(self.job_queue, client_id, reply_queue)
+
+    def start(self) -> "ChartPool":
+        """Starts the workers that are not running, so it also restarts the ones that died."""
+        for i, process in enumerate(self.processes):
+            if process is None or not process.is_alive():
+                process = multiprocessing.Process(target=self.run, name=f"chart-worker-{i}", daemon=True)
+                process.start()
+                self.processes[i] = process
+        return self
+
+    def is_alive(self) -> bool:
+        return all(process is not None and process.is_alive() for process in self.processes)
+
+    def stop(self) -> None:
+        for _ in self.processes:
+            self.job_queue.put(None)
+        for process in self.processes:
+            if process is not None:
+                process.join(timeout=10)
+
+    # --- Worker process ---
+
+    def run(self) -> None:
+        """Entry point of a worker process: renders jobs until it gets None."""
+        import chart
+
+        # `chart` may be a lazy module (see lazy_import), so load it before the first job
+        chart.get_charts
+        while True:
+            job = self.job_queue.get()
+            if job is None:
+                return
+            client_id, job_id, chart_args = job
+            try:
+                paths = chart.get_charts(**chart_args)
+            except Exception:
+                logger.error(f"Chart render failed for {chart_args}: {traceback.format_exc()}")
+                paths = None
+            self.reply_queues[client_id].put((job_id, paths))
+
+
+class ChartClient:
+    """Submits render jobs to a `ChartPool` from one strategy worker.
+
+    Callbacks run on a listener thread of the worker once their charts are rendered.
+    """
+
+    def __init__(self, job_queue: multiprocessing.Queue, client_id: int, reply_queue: multiprocessing.Queue):
+        self.job_queue = job_queue
+        self.client_id = client_id
+        self.reply_queue = reply_queue
+        self._callbacks: Dict[str, ChartCallback] = {}
+        self._counter = itertools.count(1)
+        self._lock = threading.Lock()
+        self._listener: Optional[threading.Thread] = None
+
+    def submit(self, callback: ChartCallback, **chart_args) -> str:
+        """Queues a `chart.get_charts(**chart_args)` job. Returns its id."""
+        # Ids carry the pid so replies meant for a restarted worker's predecessor are dropped
+        job_id = f"{os.getpid()}:{next(self._counter)}"
+        with self._lock:
+            self._callbacks[job_id] = callback
+            if self._listener is None or not self._listener.is_alive():
+                self._listener = threading.Thread(target=self._listen, name="chart-replies", daemon=True)
+                self._listener.start()
+        self.job_queue.put((self.client_id, job_id, chart_args))
+        return job_id
+
+    def _listen(self) -> None:
+        while True:
+            job_id, paths = self.reply_queue.get()
+            with self._lock:
+                callback = self._callbacks.pop(job_id, None)
+            if callback is None:
+                continue
+            try:
+                callback(paths)
+            except Exception:
+                logger.error(f"Chart callback failed: {traceback.format_exc()}")
@@ -0,0 +1,258 @@
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from binance.spot import Spot
+
+from kline_stream import STREAM_STALE_SECONDS, KlineStream, interval_to_ms
+from logger import logger
+from resample import KlineResampler, can_resample
+
+# --- Constants ---
+
+# Number of candles kept per (pair, time_frame); covers the 1000-candle EMA bootstrap
+HUB_HISTORY_SIZE = 1000
+
+# Fields of a kline kept in shared memory: open time, open, high, low, close, volume
+KLINE_FIELDS = 6
+
+# Seconds a worker waits for a bootstrap reply before falling back to its own REST call
+HUB_REPLY_TIMEOUT = 30.0
+
+# Threads serving bootstrap requests, so one slow REST fetch does not hold up the requests behind it
+HUB_SERVE_WORKERS = 8
+
+
+class MarketDataHub:
+    """One process per host that fetches and streams each (pair, time_frame) once for all strategy workers.
+
+    Only the smallest time frame of each pair is streamed; larger time frames that are a multiple
+    of it are resampled from that stream (`resample.KlineResampler`).
+
+    The latest two klines of every subscription live in shared memory, so per-tick reads by the
+    workers never leave the host. Bootstrap requests (more than two candles) go through a request
+    queue and are served from a rolling history that is fetched from REST once and then kept up
+    to date by the stream. Requests are served by a thread pool; requests for a (pair, time_frame)
+    that arrive while it is being served are answered together once that fetch is done.
+    """
+
+    def __init__(self, subscriptions: Sequence[Tuple[str, str]], exchange: str, history_size: int = HUB_HISTORY_SIZE):
+        self.subscriptions = list(dict.fromkeys((pair.upper(), time_frame) for pair, time_frame in subscriptions))
+        self.index = {key: i for i, key in enumerate(self.subscriptions)}
+        self.exchange = exchange
+        self.history_size = history_size
+        self.latest = multiprocessing.Array("d", len(self.subscriptions) * 2 * KLINE_FIELDS)
+        self.updated_at = multiprocessing.Array("d", len(self.subscriptions))
+        self.new_candles = multiprocessing.Array("q", len(self.subscriptions))
+        self.condition = multiprocessing.Condition()
+        self.request_queue = multiprocessing.Queue()
+        self.reply_queues: Dict[int, multiprocessing.Queue] = {}
+        self.process: Optional[multiprocessing.Process] = None
+
+    def client(self, worker_id: int) -> "HubClient":
+        """Creates the client handed to one strategy worker. Must be called before the workers fork."""
+        reply_queue = self.reply_queues.setdefault(worker_id, multiprocessing.Queue())
+        return HubClient(self, worker_id, reply_queue)
+
+    def start(self) -> multiprocessing.Process:
+        self.process = multiprocessing.Process(target=self.run, name="market-data-hub", daemon=True)
+        self.process.start()
+        return self.process
+
+    def is_alive(self) -> bool:
+        return self.process is not None and self.process.is_alive()
+
+    # --- Hub process ---
+
+    def run(self) -> None:
+        """Entry point of the hub process."""
+        self._lock = threading.Lock()
+        self._history: Dict[Tuple[str, str], List[List]] = {}
+        # Requests per (pair, time_frame) waiting for the task serving it, so concurrent bootstraps share one fetch
+        self._waiting: Dict[Tuple[str, str], List[Tuple]] = {}
+        self._binance_spot = Spot()
+
+        from chandelier_exit import KlineHelper, create_kline_streams
+
+        self._rest_helper = KlineHelper(mode="normal", exchange=self.exchange)
+
+        # Each pair streams only its smallest time frame, the larger ones are resampled from it
+        base_time_frames: Dict[str, str] = {}
+        for pair, time_frame in self.subscriptions:
+            base = base_time_frames.get(pair)
+            if base is None or interval_to_ms(time_frame) < interval_to_ms(base):
+                base_time_frames[pair] = time_frame
+        self._resamplers: Dict[Tuple[str, str], KlineResampler] = {}
+        for pair, base in base_time_frames.items():
+            derived = [tf for p, tf in self.subscriptions if p == pair and can_resample(base, tf)]
+            if derived:
+                self._resamplers[(pair, base)] = KlineResampler(
+                    pair, base, derived, rest_fetch=self._fetch_rest, on_update=self._on_update
+                )
+        streamed = [(pair, tf) for pair, tf in self.subscriptions if not can_resample(base_time_frames[pair], tf)]
+
+        self._streams: Dict[Tuple[str, str], KlineStream] = create_kline_streams(
+            streamed, self.exchange, rest_fetch=self._fetch_rest, on_update=self._on_stream_update
+        )
+        for (pair, _), resampler in self._resamplers.items():
+            for time_frame in resampler.time_frames:
+                self._streams[(pair, time_frame)] = resampler
+
+        logger.info(f"Market data hub started: {len(self.subscriptions)} subscriptions, {len(streamed)} streamed")
+        executor = ThreadPoolExecutor(max_workers=HUB_SERVE_WORKERS, thread_name_prefix="hub-serve")
+        while True:
+            request = self.request_queue.get()
+            key = (request[2], request[3])
+            with self._lock:
+                serving = key in self._waiting
+                self._waiting.setdefault(key, []).append(request)
+            if not serving:
+                executor.submit(self._serve_requests, *key)
+
+    def _serve_requests(self, pair: str, time_frame: str) -> None:
+        """Answers the requests waiting for (pair, time_frame), one history read or fetch per batch."""
+        key = (pair, time_frame)
+        while True:
+            with self._lock:
+                requests = self._waiting[key]
+                if not requests:
+                    del self._waiting[key]
+                    return
+                self._waiting[key] = []
+            limit = max(request[4] for request in requests)
+            try:
+                klines = self._serve_history(pair, time_frame, limit)
+            except Exception as e:
+                logger.error(f"Hub failed to serve {pair} {time_frame} {limit}: {e}")
+                klines = None
+            for worker_id, request_id, _, _, request_limit in requests:
+                self.reply_queues[worker_id].put((request_id, klines[-request_limit:] if klines else None))
+
+    def _fetch_rest(self, pair: str, time_frame: str, limit: int) -> List:
+        return self._rest_helper.fetch_rest_klines(self._binance_spot, pair, time_frame, limit)
+
+    def _on_stream_update(self, pair: str, time_frame: str, klines: List[List], new_candle: bool) -> None:
+        self._on_update(pair, time_frame, klines, new_candle)
+        resampler = self._resamplers.get((pair, time_frame))
+        if resampler is not None:
+            resampler.update(pair, time_frame, klines, new_candle)
+
+    def _on_update(self, pair: str, time_frame: str, klines: List[List], new_candle: bool) -> None:
+        key = (pair, time_frame)
+        with self._lock:
+            history = self._history.get(key)
+            if history is not None and not merge_klines(history, klines, time_frame):
+                logger.warning(f"Hub history gap for {pair} {time_frame}, refetching on next bootstrap")
+                del self._history[key]
+            elif history is not None and len(history) > self.history_size:
+                del history[: len(history) - self.history_size]
+
+        i = self.index[key]
+        offset = i * 2 * KLINE_FIELDS
+        with self.latest.get_lock():
+            for j, kline in enumerate(klines[-2:]):
+                start = offset + j * KLINE_FIELDS
+                self.latest[start : start + KLINE_FIELDS] = [float(kline[k]) for k in range(KLINE_FIELDS)]
+            self.updated_at[i] = time.time() if len(klines) >= 2 else 0.0
+        if new_candle:
+            with self.condition:
+                self.new_candles[i] += 1
+                self.condition.notify_all()
+
+    def _serve_history(self, pair: str, time_frame: str, limit: int) -> List[List]:
+        key = (pair, time_frame)
+        stream = self._streams.get(key)
+        with self._lock:
+            history = self._history.get(key)
+            fresh = stream is not None and stream.fetch_klines(pair, time_frame, 1) is not None
+            if history is not None and len(history) >= limit and fresh:
+                return [list(k) for k in history[-limit:]]
+
+        klines = self._fetch_rest(pair, time_frame, max(limit, self.history_size))
+        history = [list(k) for k in klines]
+        if stream is not None:
+            latest = stream.fetch_klines(pair, time_frame, 2)
+            if latest:
+                merge_klines(history, latest, time_frame)
+        with self._lock:
+            self._history[key] = history
+        return [list(k) for k in history[-limit:]]
+
+
+def merge_klines(history: List[List], klines: List[List], time_frame: str) -> bool:
+    """Merges newer klines into a history list in place. Returns False when they leave a gap."""
+    interval = interval_to_ms(time_frame)
+    for kline in klines:
+        if not history or kline[0] == history[-1][0] + interval:
+            history.append(list(kline))
+        elif kline[0] == history[-1][0]:
+            history[-1] = list(kline)
+        elif kline[0] > history[-1][0]:
+            return False
+    return True
+
+
+class HubClient:
+    """Per-worker view of the hub; a drop-in `source` for `KlineHelper` and `EMA`."""
+
+    def __init__(self, hub: MarketDataHub, worker_id: int, reply_queue: multiprocessing.Queue):
+        self.index = hub.index
+        self.latest = hub.latest
+        self.updated_at = hub.updated_at
+        self.new_candles = hub.new_candles
+        self.condition = hub.condition
+        self.request_queue = hub.request_queue
+        self.reply_queue = reply_queue
+        self.worker_id = worker_id
+        self.stale_after = STREAM_STALE_SECONDS
+        self._request_id = 0
+        # Threads of one worker share its reply queue, so only one bootstrap request is outstanding at a time
+        self._request_lock = threading.Lock()
+
+    def fetch_klines(self, pair: str, time_frame: str, limit: int) -> Optional[List]:
+        """Reads the latest klines from shared memory, or asks the hub for a longer history."""
+        key = (pair.upper(), time_frame)
+        if key not in self.index:
+            return None
+        if limit > 2:
+            return self._request_history(pair.upper(), time_frame, limit)
+
+        i = self.index[key]
+        offset = i * 2 * KLINE_FIELDS
+        with self.latest.get_lock():
+            if time.time() - self.updated_at[i] > self.stale_after:
+                return None
+            values = self.latest[offset : offset + 2 * KLINE_FIELDS]
+        klines = [values[j : j + KLINE_FIELDS] for j in range(0, 2 * KLINE_FIELDS, KLINE_FIELDS)]
+        for kline in klines:
+            kline[0] = int(kline[0])
+        return klines[-limit:]
+
+    def _request_history(self, pair: str, time_frame: str, limit: int) -> Optional[List]:
+        with self._request_lock:
+            self._request_id += 1
+            request_id = self._request_id
+            self.request_queue.put((self.worker_id, request_id, pair, time_frame, limit))
+            deadline = time.time() + HUB_REPLY_TIMEOUT
+            try:
+                while True:
+                    reply_id, klines = self.reply_queue.get(timeout=max(deadline - time.time(), 0))
+                    if reply_id == request_id:
+                        return klines
+                    # A late reply to a request that already timed out
+            except Exception:
+                logger.error(f"Hub did not answer bootstrap for {pair} {time_frame} within {HUB_REPLY_TIMEOUT}s")
+                return None
+
+    def wait_for_update(self, pair: str, time_frame: str, timeout: float) -> bool:
+        """Blocks until a new candle opens for the subscription or `timeout` elapses."""
+        key = (pair.upper(), time_frame)
+        if key not in self.index:
+            time.sleep(timeout)
+            return False
+        i = self.index[key]
+        with self.condition:
+            seen = self.new_candles[i]
+            return self.condition.wait_for(lambda: self.new_candles[i] != seen, timeout=timeout)
@@ -0,0 +1,282 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+import requests
+from urllib3.exceptions import MaxRetryError
+
+from logger import logger
+
+# --- Constants ---
+
+# Telegram limits: about one message per second in a chat, 20 per minute in a group, 30 per second per bot
+CHAT_RATE = 1.0
+GROUP_RATE = 20 / 60
+GROUP_BURST = 3
+BOT_RATE = 30.0
+
+# Calls of a job before it gives up, and the first back-off after a network error (doubled per attempt)
+MAX_ATTEMPTS = 5
+RETRY_BACKOFF_SECONDS = 1.0
+
+# Back-off when Telegram answers 429 without `retry_after`
+DEFAULT_RETRY_AFTER_SECONDS = 5
+
+# Threads calling the Telegram API; a chat never has more than one call in flight
+DELIVERY_WORKERS = 8
+
+# Seconds a delivered job stays joinable by its key, so a client retrying after a timeout gets its result
+KEY_RETENTION_SECONDS = 120
+
+# Result of a job that could not be delivered
+FAILED = {"status": "failed", "message_id": False}
+
+
+class RetryAfter(Exception):
+    """Telegram rate limited the call; it may be repeated after `seconds`."""
+
+    def __init__(self, seconds: float):
+        super().__init__(f"retry after {seconds}s")
+        self.seconds = seconds
+
+
+def never_sent(error: requests.RequestException) -> bool:
+    """True when the request failed before it reached Telegram, so repeating it cannot post twice.
+
+    A read timeout or a connection dropped while waiting for the answer may follow a message that
+    was posted. Connection failures reach requests as a `MaxRetryError` once http_client's retries
+    are used up.
+    """
+    return isinstance(error, requests.ConnectTimeout) or (
+        isinstance(error, requests.ConnectionError) and bool(error.args) and isinstance(error.args[0], MaxRetryError)
+    )
+
+
+class TokenBucket:
+    """Messages a chat or a bot may send: refills at `rate` per second up to `capacity`."""
+
+    def __init__(self, rate: float, capacity: float = 1.0):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self.blocked_until = 0.0
+
+    def wait(self, now: float, cost: float = 1.0) -> float:
+        """Seconds until a call costing `cost` messages may be made."""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        if cost == 0 or self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self, cost: float) -> None:
+        # A media group costs one message per photo and may overdraw the bucket; the refill pays it back
+        self.tokens -= cost
+
+    def block(self, seconds: float, now: float) -> None:
+        self.blocked_until = max(self.blocked_until, now + seconds)
+        self.tokens = min(self.tokens, 0.0)
+
+
+class DeliveryJob:
+    """One Telegram call for a chat, repeated on rate limits and network errors up to `MAX_ATTEMPTS`."""
+
+    def __init__(self, chat_id: str, token: str, send: Callable[[], Any], cost: float, key: Optional[str]):
+        self.chat_id = chat_id
+        self.token = token
+        self.send = send
+        self.cost = cost
+        self.key = key
+        self.future: Future = Future()
+        self.attempts = 0
+        self.not_before = 0.0
+        self.finished_at: Optional[float] = None
+        self.result: Any = None
+        # Message ids of a deletion, extended while the job waits
+        self.delete_ids: Optional[List[int]] = None
+
+
+class ChatLane:
+    """Jobs of one chat, sent in order and one at a time."""
+
+    def __init__(self, chat_id: str):
+        self.jobs: Deque[DeliveryJob] = deque()
+        self.busy = False
+        # Group and channel ids are negative
+        is_group = str(chat_id).startswith("-")
+        self.bucket = TokenBucket(GROUP_RATE, GROUP_BURST) if is_group else TokenBucket(CHAT_RATE)
+
+
+class DeliveryQueue:
+    """Sends Telegram calls from a queue instead of the request handlers.
+
+    Every chat has a FIFO lane and a token bucket for Telegram's per-chat limit, every bot token a
+    bucket for the global one. A 429 blocks the chat for its `retry_after` and the call is repeated.
+    Network errors repeat deletions and calls that never reached Telegram, with exponential back-off;
+    a send that may have posted is not repeated. Bursts coalesce: a job submitted with the key of a
+    job that is still waiting, in flight or delivered within `KEY_RETENTION_SECONDS` shares its
+    result, and deletions waiting in the same chat are merged into one call.
+
+    Jobs return the result of their `send` callable, or `FAILED` once their attempts are used up.
+    """
+
+    def __init__(self, workers: int = DELIVERY_WORKERS, max_attempts: int = MAX_ATTEMPTS):
+        self.max_attempts = max_attempts
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="telegram")
+        self.cond = threading.Condition()
+        self.lanes: Dict[str, ChatLane] = {}
+        self.bots: Dict[str, TokenBucket] = {}
+        self.keys: Dict[str, DeliveryJob] = {}
+        self.in_flight = 0
+        self.stopping = False
+        self._dispatcher: Optional[threading.Thread] = None
+
+    def submit(
+        self, chat_id: str, token: str, send: Callable[[], Any], cost: float = 1, key: Optional[str] = None
+    ) -> Future:
+        """Queues `send()` for `chat_id`. `cost` is the number of messages it posts (0 for deletions)."""
+        with self.cond:
+            self._expire_keys(time.monotonic())
+            if key is not None and key in self.keys:
+                logger.info(f"Coalesced delivery {key}")
+                return self.keys[key].future
+            job = DeliveryJob(str(chat_id), token, send, cost, key)
+            if key is not None:
+                self.keys[key] = job
+            self._enqueue(job)
+            return job.future
+
+    def delete(
+        self, chat_id: str, token: str, message_ids: List[int], delete_many: Callable[[List[int]], Any]
+    ) -> Future:
+        """Queues the deletion of `message_ids` with `delete_many(ids)`, merged with deletions still waiting."""
+        with self.cond:
+            # A deleted message must not be handed out again as the result of a coalesced send
+            for key, job in list(self.keys.items()):
+                sent = job.result["message_id"] if job.finished_at is not None else None
+                if sent and set(sent) & set(message_ids):
+                    del self.keys[key]
+            lane = self.lanes.get(str(chat_id))
+            waiting = next((job for job in lane.jobs if job.delete_ids is not None), None) if lane else None
+            if waiting is not None:
+                waiting.delete_ids.extend(message_ids)
+                return waiting.future
+            job = DeliveryJob(str(chat_id), token, lambda: delete_many(list(job.delete_ids)), 0, None)
+            job.delete_ids = list(message_ids)
+            self._enqueue(job)
+            return job.future
+
+    def pending(self) -> int:
+        """Jobs waiting or in flight."""
+        with self.cond:
+            return self._pending()
+
+    def stop(self, timeout: float = 10) -> None:
+        """Sends what is queued for up to `timeout` seconds, then stops."""
+        deadline = time.monotonic() + timeout
+        with self.cond:
+            self.stopping = True
+            self.cond.notify_all()
+            while self._pending() and time.monotonic() < deadline:
+                self.cond.wait(deadline - time.monotonic())
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    # --- Dispatching ---
+
+    def _pending(self) -> int:
+        return sum(len(lane.jobs) for lane in self.lanes.values()) + self.in_flight
+
+    def _enqueue(self, job: DeliveryJob) -> None:
+        lane = self.lanes.get(job.chat_id)
+        if lane is None:
+            lane = self.lanes[job.chat_id] = ChatLane(job.chat_id)
+        lane.jobs.append(job)
+        if self._dispatcher is None or not self._dispatcher.is_alive():
+            self._dispatcher = threading.Thread(target=self._dispatch, name="telegram-dispatch", daemon=True)
+            self._dispatcher.start()
+        self.cond.notify_all()
+
+    def _expire_keys(self, now: float) -> None:
+        for key, job in list(self.keys.items()):
+            if job.finished_at is not None and now - job.finished_at > KEY_RETENTION_SECONDS:
+                del self.keys[key]
+
+    def _dispatch(self) -> None:
+        with self.cond:
+            while not (self.stopping and not self._pending()):
+                now = time.monotonic()
+                next_wait = None
+                for lane in self.lanes.values():
+                    if lane.busy or not lane.jobs:
+                        continue
+                    job = lane.jobs[0]
+                    if job.future.cancelled():
+                        lane.jobs.popleft()
+                        continue
+                    bot = self.bots.setdefault(job.token, TokenBucket(BOT_RATE, BOT_RATE))
+                    wait = max(job.not_before - now, lane.bucket.wait(now, job.cost), bot.wait(now))
+                    if wait > 0:
+                        next_wait = wait if next_wait is None else min(next_wait, wait)
+                        continue
+                    lane.jobs.popleft()
+                    lane.busy = True
+                    lane.bucket.take(job.cost)
+                    bot.take(1)
+                    self.in_flight += 1
+                    self.executor.submit(self._run, lane, job)
+                self.cond.wait(next_wait)
+
+    def _run(self, lane: ChatLane, job: DeliveryJob) -> None:
+        job.attempts += 1
+        result, retry_in, rate_limited = FAILED, None, False
+        try:
+            result = job.send()
+        except RetryAfter as e:
+            retry_in, rate_limited = e.seconds, True
+            logger.warning(f"Telegram rate limited chat {job.chat_id}, retrying in {e.seconds}s")
+        except requests.RequestException as e:
+            # Deletions are idempotent; anything else is only repeated when it never reached Telegram
+            if job.delete_ids is not None or never_sent(e):
+                retry_in = RETRY_BACKOFF_SECONDS * 2 ** (job.attempts - 1)
+                logger.warning(f"Telegram call for chat {job.chat_id} failed ({e}), retrying in {retry_in:.0f}s")
+            else:
+                logger.error(f"Telegram call for chat {job.chat_id} failed ({e}), not repeated as it may have posted")
+        except Exception as e:
+            logger.error(f"Telegram call for chat {job.chat_id} failed: {e}")
+
+        now = time.monotonic()
+        with self.cond:
+            lane.busy = False
+            self.in_flight -= 1
+            if rate_limited:
+                lane.bucket.block(retry_in, now)
+            if retry_in is not None and job.attempts < self.max_attempts:
+                job.not_before = now + retry_in
+                lane.jobs.appendleft(job)
+                self.cond.notify_all()
+                return
+            if retry_in is not None:
+                logger.error(f"Giving up on Telegram call for chat {job.chat_id} after {job.attempts} attempts")
+            job.finished_at, job.result = now, result
+            # Only delivered messages are handed to later submits of the same key
+            if job.key is not None and not (isinstance(result, dict) and result.get("message_id")):
+                self.keys.pop(job.key, None)
+            self.cond.notify_all()
+        if not job.future.done():
+            job.future.set_result(result)
+
+
+_queue: Optional[DeliveryQueue] = None
+
+
+def get_delivery_queue() -> DeliveryQueue:
+    """Returns the delivery queue of this process, creating it on first use."""
+    global _queue
+    if _queue is None:
+        _queue = DeliveryQueue()
+    return _queue
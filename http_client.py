@@ -0,0 +1,78 @@
+import os
+import threading
+from typing import Dict, Tuple
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# --- Constants ---
+
+# Connections kept alive per host; threads beyond this wait for a free connection instead of opening new ones
+HTTP_POOL_SIZE = 32
+
+# (connect, read) timeouts in seconds. Telegram uploads charts, so it gets a longer read timeout.
+DEFAULT_TIMEOUT = (3.05, 10)
+UPLOAD_TIMEOUT = (3.05, 30)
+
+# Retries of failed connections and of idempotent requests answered with a server error.
+# 429/418 are left to the caller: the shared weight budget handles Binance rate limits.
+RETRY_TOTAL = 2
+RETRY_BACKOFF_FACTOR = 0.2
+RETRY_STATUS_CODES = (500, 502, 503, 504)
+
+
+def _build_session() -> requests.Session:
+    retry = Retry(
+        total=RETRY_TOTAL,
+        backoff_factor=RETRY_BACKOFF_FACTOR,
+        status_forcelist=RETRY_STATUS_CODES,
+        allowed_methods=Retry.DEFAULT_ALLOWED_METHODS,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=HTTP_POOL_SIZE, max_retries=retry)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+# --- Session pool ---
+
+_sessions: Dict[Tuple[int, str], requests.Session] = {}
+_lock = threading.Lock()
+
+
+def session_for(url: str) -> requests.Session:
+    """Returns the keep-alive session of the host of `url`, one per host and process.
+
+    Sessions are keyed by process id as well, since pooled sockets must not be shared with
+    processes forked after they were opened.
+    """
+    parts = urlsplit(url)
+    key = (os.getpid(), f"{parts.scheme}://{parts.netloc}")
+    session = _sessions.get(key)
+    if session is None:
+        with _lock:
+            session = _sessions.get(key)
+            if session is None:
+                session = _sessions[key] = _build_session()
+    return session
+
+
+def get(url: str, timeout=DEFAULT_TIMEOUT, **kwargs) -> requests.Response:
+    """`requests.get` over the pooled session of the host."""
+    return session_for(url).get(url, timeout=timeout, **kwargs)
+
+
+def post(url: str, timeout=DEFAULT_TIMEOUT, **kwargs) -> requests.Response:
+    """`requests.post` over the pooled session of the host. POSTs are only retried when the connection failed."""
+    return session_for(url).post(url, timeout=timeout, **kwargs)
+
+
+def close_all() -> None:
+    """Closes the sessions of this process."""
+    with _lock:
+        for key in [key for key in _sessions if key[0] == os.getpid()]:
+            _sessions.pop(key).close()
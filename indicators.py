@@ -0,0 +1,317 @@
+from collections import deque
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+try:
+    from numba import njit
+except ImportError:  # numba is optional, the pure NumPy kernel is used without it
+    njit = None
+
+# --- Constants ---
+
+# A small value to handle floating point comparisons (same as chandelier_exit.EPSILON)
+EPSILON = 1e-9
+
+# Without numba, the batch stop recurrence is vectorized across symbols from this many symbols on
+VECTORIZE_MIN_SYMBOLS = 8
+
+
+class StreamingChandelierExit:
+    """Chandelier Exit that advances one candle at a time.
+
+    Only the state of the last closed candle is kept: the ATR (Wilder smoothing, as in
+    `lib.volatility.AverageTrueRange`), the long/short stops, the direction and the last `length`
+    prices of the stop windows. `update_forming` evaluates the still-forming candle against that
+    state without changing it, `close_candle` evaluates a closed candle and commits it, so every
+    tick costs O(length) (O(1) for the default `CEConfig.LENGTH` of 1).
+
+    Feeding every candle of a series through `close_candle` gives the same ATR, LongStop,
+    ShortStop, LongStopPrev, ShortStopPrev and Direction values as `calculate_atr` followed by
+    `ChandlierExit.calculate_chandelier_exit` on the whole series.
+    """
+
+    def __init__(self, multiplier: float, length: int, use_close: bool, direction: int = 1):
+        self.multiplier = multiplier
+        self.length = length
+        self.use_close = use_close
+        self.direction = direction
+        self.atr: Optional[float] = None
+        self.long_stop: Optional[float] = None
+        self.short_stop: Optional[float] = None
+        self.last_close: Optional[float] = None
+        self._count = 0
+        self._tr_sum = 0.0
+        self._highs = deque(maxlen=max(length - 1, 1))
+        self._lows = deque(maxlen=max(length - 1, 1))
+
+    def _evaluate(self, candle: Dict[str, float]) -> Dict[str, float]:
+        high, low, close = candle["High"], candle["Low"], candle["Close"]
+
+        # --- True Range / ATR ---
+        true_range = high - low
+        if self.last_close is not None:
+            true_range = max(true_range, abs(high - self.last_close), abs(low - self.last_close))
+
+        count = self._count + 1
+        if count < self.length:
+            atr = 0.0  # AverageTrueRange leaves the warm-up rows at zero
+        elif count == self.length:
+            atr = (self._tr_sum + true_range) / self.length
+        else:
+            atr = (self.atr * (self.length - 1) + true_range) / float(self.length)
+        atr_mult = atr * self.multiplier
+
+        # --- Calculate Long Stop ---
+        highs = list(self._highs)[-(self.length - 1) :] if self.length > 1 else []
+        long_stop = max(highs + [close if self.use_close else high]) - atr_mult
+        long_stop_prev = self.long_stop if self.long_stop is not None else long_stop
+        if self.last_close is not None and (self.last_close - long_stop_prev) > EPSILON:
+            long_stop = max(long_stop, long_stop_prev)
+
+        # --- Calculate Short Stop ---
+        lows = list(self._lows)[-(self.length - 1) :] if self.length > 1 else []
+        short_stop = min(lows + [close if self.use_close else low]) + atr_mult
+        short_stop_prev = self.short_stop if self.short_stop is not None else short_stop
+        if self.last_close is not None and (self.last_close - short_stop_prev) < -EPSILON:
+            short_stop = min(short_stop, short_stop_prev)
+
+        # --- Determine Direction ---
+        direction = self.direction
+        if (close - short_stop_prev) > EPSILON:
+            direction = 1
+        elif (close - long_stop_prev) < -EPSILON:
+            direction = -1
+
+        return {
+            "ATR": atr_mult,
+            "LongStop": long_stop,
+            "ShortStop": short_stop,
+            "LongStopPrev": long_stop_prev,
+            "ShortStopPrev": short_stop_prev,
+            "Direction": direction,
+            "_atr": atr,
+            "_true_range": true_range,
+        }
+
+    def update_forming(self, candle: Dict[str, float]) -> Dict[str, float]:
+        """Evaluates the forming candle without committing it."""
+        values = self._evaluate(candle)
+        del values["_atr"], values["_true_range"]
+        return values
+
+    def close_candle(self, candle: Dict[str, float]) -> Dict[str, float]:
+        """Evaluates a closed candle and makes it the new reference state."""
+        values = self._evaluate(candle)
+        self._count += 1
+        if self._count <= self.length:
+            self._tr_sum += values.pop("_true_range")
+        else:
+            values.pop("_true_range")
+        self.atr = values.pop("_atr")
+        self.long_stop = values["LongStop"]
+        self.short_stop = values["ShortStop"]
+        self.direction = values["Direction"]
+        self.last_close = candle["Close"]
+        self._highs.append(candle["Close"] if self.use_close else candle["High"])
+        self._lows.append(candle["Close"] if self.use_close else candle["Low"])
+        return values
+
+
+# --- Batch Chandelier Exit ---
+
+
+def true_range(high: np.ndarray, low: np.ndarray, close: np.ndarray) -> np.ndarray:
+    """True range along the last axis; the first bar has no previous close and uses high - low."""
+    prev_close = np.empty_like(close)
+    prev_close[..., 0] = np.nan
+    prev_close[..., 1:] = close[..., :-1]
+    with np.errstate(invalid="ignore"):
+        return np.fmax(high - low, np.fmax(np.abs(high - prev_close), np.abs(low - prev_close)))
+
+
+def wilder_atr(true_ranges: np.ndarray, length: int) -> np.ndarray:
+    """ATR along the last axis with the same seeding and smoothing as `lib.volatility.AverageTrueRange`."""
+    atr = np.zeros_like(true_ranges)
+    if true_ranges.shape[-1] < length:
+        return atr
+    if length == 1:
+        return true_ranges.copy()
+    # Wilder smoothing is an EWM with alpha = 1 / length seeded by the mean of the first window
+    seeded = true_ranges[..., length - 1 :].copy()
+    seeded[..., 0] = true_ranges[..., :length].mean(axis=-1)
+    smoothed = pd.DataFrame(seeded.reshape(-1, seeded.shape[-1]).T).ewm(alpha=1.0 / length, adjust=False).mean()
+    atr[..., length - 1 :] = smoothed.to_numpy().T.reshape(seeded.shape)
+    return atr
+
+
+def rolling_extreme(values: np.ndarray, length: int, func) -> np.ndarray:
+    """Max/min over the last `length` bars (fewer at the start of the series) along the last axis."""
+    if length == 1:
+        return values.copy()
+    fill = -np.inf if func is np.max else np.inf
+    padded = np.concatenate([np.full(values.shape[:-1] + (length - 1,), fill), values], axis=-1)
+    return func(sliding_window_view(padded, length, axis=-1), axis=-1)
+
+
+def _stops_numpy(raw_long, raw_short, close, direction):
+    """Stop/direction recurrence, one bar at a time and vectorized across symbols."""
+    long_stop, short_stop = raw_long.copy(), raw_short.copy()
+    long_prev, short_prev = raw_long.copy(), raw_short.copy()
+    directions = np.empty_like(close)
+    current = np.full(close.shape[0], float(direction))
+    for i in range(close.shape[1]):
+        if i > 0:
+            long_prev[:, i] = long_stop[:, i - 1]
+            short_prev[:, i] = short_stop[:, i - 1]
+            ratchet = (close[:, i - 1] - long_prev[:, i]) > EPSILON
+            long_stop[:, i] = np.where(ratchet, np.maximum(raw_long[:, i], long_prev[:, i]), raw_long[:, i])
+            ratchet = (close[:, i - 1] - short_prev[:, i]) < -EPSILON
+            short_stop[:, i] = np.where(ratchet, np.minimum(raw_short[:, i], short_prev[:, i]), raw_short[:, i])
+        up = (close[:, i] - short_prev[:, i]) > EPSILON
+        down = ~up & ((close[:, i] - long_prev[:, i]) < -EPSILON)
+        current = np.where(up, 1.0, np.where(down, -1.0, current))
+        directions[:, i] = current
+    return long_stop, short_stop, long_prev, short_prev, directions
+
+
+def _stops_loop(raw_long, raw_short, close, direction, long_stop, short_stop, long_prev, short_prev, directions):
+    """Stop/direction recurrence of one symbol, filling the output sequences in place.
+
+    Works on NumPy arrays (compiled by numba when it is installed) and on plain lists, which the
+    interpreter indexes much faster than NumPy scalars.
+    """
+    current = float(direction)
+    for i in range(len(close)):
+        long_stop[i], short_stop[i] = raw_long[i], raw_short[i]
+        long_prev[i], short_prev[i] = raw_long[i], raw_short[i]
+        if i > 0:
+            long_prev[i] = long_stop[i - 1]
+            short_prev[i] = short_stop[i - 1]
+            if close[i - 1] - long_prev[i] > EPSILON:
+                long_stop[i] = max(raw_long[i], long_prev[i])
+            if close[i - 1] - short_prev[i] < -EPSILON:
+                short_stop[i] = min(raw_short[i], short_prev[i])
+        if close[i] - short_prev[i] > EPSILON:
+            current = 1.0
+        elif close[i] - long_prev[i] < -EPSILON:
+            current = -1.0
+        directions[i] = current
+
+
+_stops_loop_compiled = njit(cache=True)(_stops_loop) if njit else None
+
+
+def _stops(raw_long, raw_short, close, direction):
+    """Runs the stop recurrence with the fastest kernel available for the input shape."""
+    symbols = close.shape[0]
+    if _stops_loop_compiled is None and symbols >= VECTORIZE_MIN_SYMBOLS:
+        return _stops_numpy(raw_long, raw_short, close, direction)
+
+    outputs = [np.empty_like(close) for _ in range(5)]
+    for s in range(symbols):
+        if _stops_loop_compiled is not None:
+            _stops_loop_compiled(raw_long[s], raw_short[s], close[s], direction, *(out[s] for out in outputs))
+        else:
+            lists = [[0.0] * close.shape[1] for _ in range(5)]
+            _stops_loop(raw_long[s].tolist(), raw_short[s].tolist(), close[s].tolist(), direction, *lists)
+            for out, values in zip(outputs, lists):
+                out[s] = values
+    return tuple(outputs)
+
+
+def batch_chandelier_exit(
+    high, low, close, multiplier: float, length: int, use_close: bool, direction: int = 1
+) -> Dict[str, np.ndarray]:
+    """Computes ATR, stops and direction for whole histories in one call.
+
+    Inputs are 1-D arrays of one symbol or 2-D `(symbols x bars)` arrays of aligned histories.
+    Returns arrays of the same shape with the same values as `calculate_atr` followed by
+    `ChandlierExit.calculate_chandelier_exit` (ATR already multiplied).
+    """
+    high, low, close = (np.asarray(values, dtype=np.float64) for values in (high, low, close))
+    squeeze = close.ndim == 1
+    if squeeze:
+        high, low, close = high[None, :], low[None, :], close[None, :]
+
+    atr = wilder_atr(true_range(high, low, close), length) * multiplier
+    raw_long = rolling_extreme(close if use_close else high, length, np.max) - atr
+    raw_short = rolling_extreme(close if use_close else low, length, np.min) + atr
+    long_stop, short_stop, long_prev, short_prev, directions = _stops(raw_long, raw_short, close, direction)
+
+    result = {
+        "ATR": atr,
+        "LongStop": long_stop,
+        "ShortStop": short_stop,
+        "LongStopPrev": long_prev,
+        "ShortStopPrev": short_prev,
+        "Direction": directions,
+    }
+    return {key: values[0] for key, values in result.items()} if squeeze else result
+
+
+def heikin_ashi(open_p, high, low, close) -> Dict[str, np.ndarray]:
+    """Heikin Ashi candles of a whole history, as `test_fetch_data.KlineHelper` builds them candle by candle.
+
+    The first candle is kept as is; every later one opens at the middle of the previous Heikin Ashi
+    body. That recurrence runs on plain lists, the rest is vectorized. `chandelier_exit.KlineHelper`
+    differs on the first candle, which it closes at the OHLC average, so its series is not identical.
+    """
+    open_p, high, low, close = (np.asarray(values, dtype=np.float64) for values in (open_p, high, low, close))
+    ha_close = (open_p + high + low + close) / 4
+    ha_close[:1] = close[:1]
+    closes = ha_close.tolist()
+    opens = [0.0] * len(closes)
+    if opens:
+        opens[0] = float(open_p[0])
+    for i in range(1, len(opens)):
+        opens[i] = (opens[i - 1] + closes[i - 1]) / 2
+    ha_open = np.array(opens)
+    return {
+        "Open": ha_open,
+        "High": np.maximum.reduce([high, ha_open, ha_close]),
+        "Low": np.minimum.reduce([low, ha_open, ha_close]),
+        "Close": ha_close,
+    }
+
+
+# --- Streaming EMA ---
+
+
+class StreamingEMA:
+    """EMA with the semantics of `lib.trend.ema_indicator` (`ewm(span, adjust=False)`), updated one price at a time.
+
+    `value` is the EMA up to the last closed candle. `update_forming` applies the forming candle
+    on top of it without committing and `close_candle` commits, both in O(1). Values are None
+    until `span` candles have been seen, as with `min_periods=span`.
+    """
+
+    def __init__(self, span: int):
+        self.span = span
+        self.alpha = 2.0 / (span + 1)
+        self.value: Optional[float] = None
+        self.count = 0
+
+    def _next(self, price: float) -> float:
+        return price if self.value is None else (1 - self.alpha) * self.value + self.alpha * price
+
+    def update_forming(self, price: float) -> Optional[float]:
+        """Returns the EMA including the forming candle without committing it."""
+        value = self._next(price)
+        return value if self.count + 1 >= self.span else None
+
+    def close_candle(self, price: float) -> Optional[float]:
+        """Commits a closed candle and returns the new EMA."""
+        self.value = self._next(price)
+        self.count += 1
+        return self.value if self.count >= self.span else None
+
+    def seed(self, closes: np.ndarray) -> np.ndarray:
+        """Restarts from a series of closed candles and returns the EMA of every one of them."""
+        values = pd.Series(closes, dtype=np.float64).ewm(span=self.span, adjust=False).mean().to_numpy()
+        self.value = float(values[-1]) if len(values) else None
+        self.count = len(values)
+        values[: self.span - 1] = np.nan
+        return values
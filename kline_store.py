@@ -0,0 +1,272 @@
+import os
+import threading
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+
+import http_client
+from kline_stream import interval_to_ms
+from logger import logger
+from rate_limit import PRIORITY_BACKGROUND, get_budget, kline_request_weight
+
+# --- Constants ---
+
+BINANCE_FUTURE_API_URL = os.environ.get("BINANCE_FUTURE_API_URL", "https://fapi.binance.com/fapi/v1/klines")
+BINANCE_SPOT_API_URL = "https://api.binance.com/api/v3/klines"
+
+# Root directory of the store; set it to an empty string to disable the store
+KLINE_STORE_DIR = os.environ.get("KLINE_STORE_DIR", "kline_store")
+
+# Partition length: one file per symbol, interval and UTC day
+DAY_MS = 24 * 60 * 60 * 1000
+
+# Most klines Binance returns for one request
+MAX_KLINES_PER_REQUEST = 1000
+
+# Slot states. Slots of candles the exchange does not have (before listing, outages) are marked
+# missing once fetched, so they are not requested again.
+STATE_EMPTY = 0
+STATE_FILLED = 1
+STATE_MISSING = 2
+
+# One row per candle, with the fields of the REST `/klines` format
+KLINE_DTYPE = np.dtype(
+    [
+        ("open_time", "i8"),
+        ("open", "f8"),
+        ("high", "f8"),
+        ("low", "f8"),
+        ("close", "f8"),
+        ("volume", "f8"),
+        ("close_time", "i8"),
+        ("quote_volume", "f8"),
+        ("trades", "i8"),
+        ("taker_base_volume", "f8"),
+        ("taker_quote_volume", "f8"),
+        ("state", "u1"),
+    ]
+)
+
+RangeFetch = Callable[[str, str, int, int, int], List]
+
+
+def supports(time_frame: str) -> bool:
+    """Whether candles of `time_frame` fit the daily partitions (every interval up to 1d)."""
+    try:
+        return DAY_MS % interval_to_ms(time_frame) == 0
+    except ValueError:
+        return False
+
+
+def to_klines(rows: np.ndarray) -> List[List]:
+    """Converts store rows back to the REST `/klines` format."""
+    return [list(row[:11]) + ["0"] for row in rows.tolist()]
+
+
+def rest_range_fetcher(future: bool, priority: int = PRIORITY_BACKGROUND) -> RangeFetch:
+    """Returns a `fetch(symbol, interval, start_ms, end_ms, limit)` for the Futures or Spot REST API."""
+    url = BINANCE_FUTURE_API_URL if future else BINANCE_SPOT_API_URL
+
+    def fetch(symbol: str, time_frame: str, start_ms: int, end_ms: int, limit: int) -> List:
+        params = {"symbol": symbol, "interval": time_frame, "startTime": start_ms, "endTime": end_ms, "limit": limit}
+        # Spot has its own limits and is not counted in the Futures budget
+        if future:
+            get_budget().acquire(kline_request_weight(limit), priority)
+        res = http_client.get(url, params=params)
+        if future:
+            get_budget().record_response(res.status_code, res.headers)
+        res.raise_for_status()
+        return res.json()
+
+    return fetch
+
+
+class KlineStore:
+    """On-disk kline store, one memory-mapped `.npy` file per source, symbol, interval and UTC day.
+
+    Each file holds one fixed slot per candle of the day, so candles are written in place as they
+    are synced and range reads only map the days they cover. Only closed candles are stored; the
+    forming candle always comes from the exchange.
+
+    Layout: `<root>/<source>/<SYMBOL>/<interval>/<YYYY-MM-DD>.npy`, `source` being `future` or `spot`.
+    """
+
+    def __init__(self, root: str = KLINE_STORE_DIR):
+        self.root = root
+        self._lock = threading.Lock()
+
+    def _path(self, source: str, symbol: str, time_frame: str, day_start: int) -> str:
+        day = np.datetime64(day_start, "ms").astype("datetime64[D]")
+        return os.path.join(self.root, source, symbol.upper(), time_frame, f"{day}.npy")
+
+    def _days(self, start_ms: int, end_ms: int) -> range:
+        return range(start_ms // DAY_MS * DAY_MS, end_ms, DAY_MS)
+
+    def _open(self, path: str, slots: int, create: bool) -> Optional[np.memmap]:
+        if os.path.exists(path):
+            return np.load(path, mmap_mode="r+" if create else "r")
+        if not create:
+            return None
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Create under a temporary name so readers never see a partial file
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        rows = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=KLINE_DTYPE, shape=(slots,))
+        rows.flush()
+        del rows
+        try:
+            # Unlike a rename, a link fails when another process created the day first, so every
+            # process maps the same file and no writes go to an unlinked one
+            os.link(tmp_path, path)
+        except FileExistsError:
+            pass
+        finally:
+            os.remove(tmp_path)
+        return np.load(path, mmap_mode="r+")
+
+    def _slices(self, time_frame: str, start_ms: int, end_ms: int):
+        """Yields (day_start, first_slot, last_slot) for the candles opened in [start_ms, end_ms)."""
+        step = interval_to_ms(time_frame)
+        for day_start in self._days(start_ms, end_ms):
+            first = max(start_ms - day_start, 0) // step
+            last = -(-(min(end_ms, day_start + DAY_MS) - day_start) // step)
+            if last > first:
+                yield day_start, first, last
+
+    # --- Writing ---
+
+    def write(self, source: str, symbol: str, time_frame: str, klines: List[List], closed_before: int) -> int:
+        """Stores the klines opened before `closed_before` (ms). Returns the number of candles written."""
+        step = interval_to_ms(time_frame)
+        slots = DAY_MS // step
+        by_day = {}
+        for kline in klines:
+            open_time = int(kline[0])
+            if open_time < closed_before:
+                by_day.setdefault(open_time // DAY_MS * DAY_MS, []).append(kline)
+
+        with self._lock:
+            for day_start, day_klines in by_day.items():
+                rows = self._open(self._path(source, symbol, time_frame, day_start), slots, create=True)
+                for kline in day_klines:
+                    rows[(int(kline[0]) - day_start) // step] = tuple(
+                        [int(kline[0]), *map(float, kline[1:6]), int(kline[6]), float(kline[7]), int(kline[8])]
+                        + [float(kline[9]), float(kline[10]), STATE_FILLED]
+                    )
+                rows.flush()
+        return sum(len(day_klines) for day_klines in by_day.values())
+
+    def _mark_missing(self, source: str, symbol: str, time_frame: str, start_ms: int, end_ms: int) -> None:
+        slots = DAY_MS // interval_to_ms(time_frame)
+        with self._lock:
+            for day_start, first, last in self._slices(time_frame, start_ms, end_ms):
+                rows = self._open(self._path(source, symbol, time_frame, day_start), slots, create=True)
+                state = rows["state"][first:last]
+                state[state == STATE_EMPTY] = STATE_MISSING
+                rows.flush()
+
+    # --- Reading ---
+
+    def read(self, source: str, symbol: str, time_frame: str, start_ms: int, end_ms: int) -> np.ndarray:
+        """Returns the stored candles opened in [start_ms, end_ms), oldest first."""
+        parts = []
+        for day_start, first, last in self._slices(time_frame, start_ms, end_ms):
+            rows = self._open(self._path(source, symbol, time_frame, day_start), 0, create=False)
+            if rows is not None:
+                day = rows[first:last]
+                parts.append(np.array(day[day["state"] == STATE_FILLED]))
+        return np.concatenate(parts) if parts else np.empty(0, dtype=KLINE_DTYPE)
+
+    def last(self, source: str, symbol: str, time_frame: str, n: int, closed_before: int) -> np.ndarray:
+        """Returns the stored candles among the last `n` slots before `closed_before` (ms). Never calls the network."""
+        step = interval_to_ms(time_frame)
+        end = closed_before // step * step
+        return self.read(source, symbol, time_frame, end - n * step, end)
+
+    def missing_ranges(self, source: str, symbol: str, time_frame: str, start_ms: int, end_ms: int) -> List[Tuple]:
+        """Returns the [start, end) open time ranges of candles in [start_ms, end_ms) that were never synced."""
+        step = interval_to_ms(time_frame)
+        ranges = []
+        for day_start, first, last in self._slices(time_frame, start_ms, end_ms):
+            rows = self._open(self._path(source, symbol, time_frame, day_start), 0, create=False)
+            if rows is None:
+                empty = np.arange(first, last)
+            else:
+                empty = first + np.flatnonzero(rows["state"][first:last] == STATE_EMPTY)
+            for slot in empty:
+                open_time = day_start + int(slot) * step
+                if ranges and ranges[-1][1] == open_time:
+                    ranges[-1][1] = open_time + step
+                else:
+                    ranges.append([open_time, open_time + step])
+        return [tuple(r) for r in ranges]
+
+    # --- Syncing ---
+
+    def sync(self, source: str, symbol: str, time_frame: str, start_ms: int, end_ms: int, fetch: RangeFetch) -> int:
+        """Fetches the candles of [start_ms, end_ms) that are not stored yet. `end_ms` must not exceed the
+        open time of the forming candle. Returns the number of candles fetched."""
+        step = interval_to_ms(time_frame)
+        fetched = 0
+        for range_start, range_end in self.missing_ranges(source, symbol, time_frame, start_ms, end_ms):
+            for chunk_start in range(range_start, range_end, MAX_KLINES_PER_REQUEST * step):
+                chunk_end = min(chunk_start + MAX_KLINES_PER_REQUEST * step, range_end)
+                limit = (chunk_end - chunk_start) // step
+                klines = fetch(symbol, time_frame, chunk_start, chunk_end - 1, limit)
+                fetched += self.write(source, symbol, time_frame, klines, chunk_end)
+                self._mark_missing(source, symbol, time_frame, chunk_start, chunk_end)
+        if fetched:
+            logger.info(f"Kline store synced {fetched} {symbol} {time_frame} candles")
+        return fetched
+
+    def history(
+        self,
+        source: str,
+        symbol: str,
+        time_frame: str,
+        limit: int,
+        fetch: RangeFetch,
+        fetch_latest: Callable[[str, str, int], List],
+    ) -> List[List]:
+        """Returns the latest `limit` klines like a REST `/klines` call, forming candle included.
+
+        Only the latest two klines and the closed candles missing from the store are fetched.
+        """
+        latest = fetch_latest(symbol, time_frame, 2)
+        forming_open = int(latest[-1][0])
+        start = forming_open - (limit - 1) * interval_to_ms(time_frame)
+        self.write(source, symbol, time_frame, latest, forming_open)
+        self.sync(source, symbol, time_frame, start, forming_open, fetch)
+        return to_klines(self.read(source, symbol, time_frame, start, forming_open)) + [list(latest[-1])]
+
+
+# --- Process-wide store ---
+
+_store: Optional[KlineStore] = None
+
+
+def get_store() -> Optional[KlineStore]:
+    """Returns the store under `KLINE_STORE_DIR`, or None when the store is disabled."""
+    global _store
+    if _store is None and KLINE_STORE_DIR:
+        _store = KlineStore(KLINE_STORE_DIR)
+    return _store
+
+
+def fetch_history(
+    symbol: str,
+    time_frame: str,
+    limit: int,
+    future: bool,
+    fetch_latest: Callable[[str, str, int], List],
+    priority: int = PRIORITY_BACKGROUND,
+) -> Optional[List[List]]:
+    """Latest `limit` klines served from the store, or None when the store cannot serve them."""
+    store = get_store()
+    if store is None or not supports(time_frame):
+        return None
+    fetch = rest_range_fetcher(future, priority)
+    try:
+        return store.history("future" if future else "spot", symbol, time_frame, limit, fetch, fetch_latest)
+    except Exception as e:
+        logger.warning(f"Kline store failed for {symbol} {time_frame}, using REST: {e}")
+        return None
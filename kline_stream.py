@@ -0,0 +1,291 @@
+import asyncio
+import json
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import websocket
+
+from logger import logger
+
+# --- Constants ---
+
+FUTURE_STREAM_URL = "wss://fstream.binance.com/stream"
+SPOT_STREAM_URL = "wss://stream.binance.com:9443/stream"
+
+# Seconds without a frame before the cached klines are considered stale
+STREAM_STALE_SECONDS = 30.0
+
+# Binance accepts at most 200 streams on a single combined connection
+MAX_STREAMS_PER_CONNECTION = 200
+
+# Seconds to wait before reconnecting after the socket drops
+RECONNECT_DELAY_SECONDS = 5.0
+
+INTERVAL_UNIT_MS = {
+    "m": 60 * 1000,
+    "h": 60 * 60 * 1000,
+    "d": 24 * 60 * 60 * 1000,
+    "w": 7 * 24 * 60 * 60 * 1000,
+}
+
+
+def interval_to_ms(time_frame: str) -> int:
+    """Converts a Binance interval string (e.g. '5m', '4h') to milliseconds."""
+    unit = time_frame[-1]
+    if unit not in INTERVAL_UNIT_MS:
+        raise ValueError(f"Unsupported time frame unit: {time_frame}")
+    return int(time_frame[:-1]) * INTERVAL_UNIT_MS[unit]
+
+
+def stream_name(pair: str, time_frame: str) -> str:
+    """Returns the combined stream name for a kline subscription."""
+    return f"{pair.lower()}@kline_{time_frame}"
+
+
+def kline_from_stream_payload(payload: Dict) -> List:
+    """Converts the 'k' object of a kline stream event to the REST kline list format."""
+    return [
+        int(payload["t"]),
+        payload["o"],
+        payload["h"],
+        payload["l"],
+        payload["c"],
+        payload["v"],
+        int(payload["T"]),
+        payload.get("q", "0"),
+        int(payload.get("n", 0)),
+        payload.get("V", "0"),
+        payload.get("Q", "0"),
+        payload.get("B", "0"),
+    ]
+
+
+class KlineStream:
+    """Keeps the latest two klines of each (pair, time_frame) up to date from a combined kline stream.
+
+    The cached klines have the same shape as the REST `/klines` response so they can be fed to
+    `KlineHelper.populate` unchanged. REST is only used through `rest_fetch` to seed a subscription
+    after (re)connecting and to repair gaps when a candle is missed.
+    """
+
+    def __init__(
+        self,
+        subscriptions: Sequence[Tuple[str, str]],
+        base_url: str = FUTURE_STREAM_URL,
+        rest_fetch: Optional[Callable[[str, str, int], List]] = None,
+        stale_after: float = STREAM_STALE_SECONDS,
+        record_path: Optional[str] = None,
+        on_update: Optional[Callable[[str, str, List[List], bool], None]] = None,
+    ):
+        self.subscriptions = [(pair.upper(), time_frame) for pair, time_frame in subscriptions]
+        self.base_url = base_url
+        self.rest_fetch = rest_fetch
+        self.stale_after = stale_after
+        self.record_path = record_path
+        self.on_update = on_update
+        self._klines: Dict[Tuple[str, str], List[List]] = {}
+        self._updated_at: Dict[Tuple[str, str], float] = {}
+        self._new_candles: Dict[Tuple[str, str], int] = {}
+        self._cond = threading.Condition()
+        self._ws: Optional[websocket.WebSocketApp] = None
+        self._thread: Optional[threading.Thread] = None
+        self._running = False
+
+    @property
+    def url(self) -> str:
+        streams = "/".join(stream_name(pair, time_frame) for pair, time_frame in self.subscriptions)
+        return f"{self.base_url}?streams={streams}"
+
+    # --- Lifecycle ---
+
+    def start(self) -> "KlineStream":
+        """Starts the socket in a background daemon thread."""
+        if self._thread and self._thread.is_alive():
+            return self
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="kline-stream", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._running = False
+        if self._ws:
+            self._ws.close()
+        if self._thread:
+            self._thread.join(timeout=5)
+
+    def _run(self) -> None:
+        while self._running:
+            self._ws = websocket.WebSocketApp(
+                self.url,
+                on_open=self._on_open,
+                on_message=lambda ws, message: self.handle_message(message),
+                on_error=lambda ws, error: logger.error(f"Kline stream error: {error}"),
+            )
+            self._ws.run_forever(ping_interval=180, ping_timeout=10)
+            if self._running:
+                logger.warning(f"Kline stream disconnected, reconnecting in {RECONNECT_DELAY_SECONDS}s")
+                time.sleep(RECONNECT_DELAY_SECONDS)
+
+    def _on_open(self, ws) -> None:
+        logger.info(f"Kline stream connected: {len(self.subscriptions)} subscriptions")
+        for pair, time_frame in self.subscriptions:
+            self.repair(pair, time_frame)
+
+    # --- Frame handling ---
+
+    def handle_message(self, message: str) -> None:
+        """Applies one combined-stream frame to the kline cache."""
+        if self.record_path:
+            with open(self.record_path, "a") as file:
+                file.write(message.strip() + "\n")
+        try:
+            event = json.loads(message)
+            event = event.get("data", event)
+            if event.get("e") != "kline":
+                return
+            payload = event["k"]
+            self.apply_kline(payload["s"], payload["i"], kline_from_stream_payload(payload))
+        except (ValueError, KeyError) as e:
+            logger.error(f"Invalid kline stream frame: {e}")
+
+    def apply_kline(self, pair: str, time_frame: str, kline: List) -> None:
+        """Replaces the forming kline or rolls forward to a new one, repairing gaps via REST."""
+        key = (pair.upper(), time_frame)
+        needs_repair = False
+        new_candle = False
+        with self._cond:
+            klines = self._klines.get(key)
+            if klines and klines[-1][0] == kline[0]:
+                klines[-1] = kline
+            elif klines and kline[0] == klines[-1][0] + interval_to_ms(time_frame):
+                self._klines[key] = [klines[-1], kline]
+                self._new_candles[key] = self._new_candles.get(key, 0) + 1
+                new_candle = True
+            elif klines and kline[0] < klines[-1][0]:
+                return  # Late frame for a candle we already rolled past
+            else:
+                # First frame or a missed candle: keep the frame, fetch the previous candle from REST
+                self._klines[key] = [kline]
+                self._new_candles[key] = self._new_candles.get(key, 0) + 1
+                needs_repair = True
+            self._updated_at[key] = time.time()
+            latest = [list(k) for k in self._klines[key]]
+            self._cond.notify_all()
+
+        if needs_repair:
+            self.repair(*key)
+        elif self.on_update:
+            self.on_update(key[0], key[1], latest, new_candle)
+
+    def repair(self, pair: str, time_frame: str) -> None:
+        """Re-seeds the last two klines of a subscription from REST."""
+        if not self.rest_fetch:
+            return
+        try:
+            klines = self.rest_fetch(pair, time_frame, 2)
+        except Exception as e:
+            logger.error(f"Kline stream repair failed for {pair} {time_frame}: {e}")
+            return
+        if not klines:
+            return
+        key = (pair.upper(), time_frame)
+        with self._cond:
+            # Frames received while REST was in flight are fresher, so they win on the same open time
+            merged = {int(k[0]): list(k) for k in klines}
+            for kline in self._klines.get(key, []):
+                merged[kline[0]] = kline
+            latest = [merged[open_time] for open_time in sorted(merged)[-2:]]
+            if len(latest) == 2 and latest[1][0] - latest[0][0] != interval_to_ms(time_frame):
+                latest = latest[-1:]
+            self._klines[key] = latest
+            self._updated_at[key] = time.time()
+            latest = [list(k) for k in latest]
+            self._cond.notify_all()
+
+        if self.on_update:
+            self.on_update(key[0], key[1], latest, True)
+
+    # --- Consumer API ---
+
+    def fetch_klines(self, pair: str, time_frame: str, limit: int) -> Optional[List]:
+        """Returns the latest `limit` klines (at most 2), or None when the cache cannot answer."""
+        if limit > 2:
+            return None
+        key = (pair.upper(), time_frame)
+        with self._cond:
+            klines = self._klines.get(key)
+            if not klines or len(klines) < limit:
+                return None
+            if time.time() - self._updated_at.get(key, 0) > self.stale_after:
+                return None
+            return [list(k) for k in klines[-limit:]]
+
+    def wait_for_update(self, pair: str, time_frame: str, timeout: float) -> bool:
+        """Blocks until a new candle opens for the subscription or `timeout` elapses."""
+        key = (pair.upper(), time_frame)
+        with self._cond:
+            seen = self._new_candles.get(key, 0)
+            return self._cond.wait_for(lambda: self._new_candles.get(key, 0) != seen, timeout=timeout)
+
+
+# --- Local stand-in for tests ---
+
+
+def load_frames(path: str) -> List[str]:
+    """Loads frames recorded with `KlineStream(record_path=...)`, one JSON message per line."""
+    with open(path, "r") as file:
+        return [line.strip() for line in file if line.strip()]
+
+
+class ReplayServer:
+    """A local WebSocket server that replays recorded kline frames to every client that connects.
+
+    Point a `KlineStream` at `server.url` instead of the Binance endpoint to run the stream path
+    without network access.
+    """
+
+    def __init__(self, frames: Sequence[str], host: str = "127.0.0.1", port: int = 0, interval: float = 0.0):
+        self.frames = list(frames)
+        self.host = host
+        self.port = port
+        self.interval = interval
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._server = None
+        self._ready = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        return f"ws://{self.host}:{self.port}/stream"
+
+    async def _handler(self, ws, path=None) -> None:
+        for frame in self.frames:
+            await ws.send(frame)
+            if self.interval:
+                await asyncio.sleep(self.interval)
+        await ws.wait_closed()
+
+    def _run(self) -> None:
+        import websockets
+
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._server = self._loop.run_until_complete(websockets.serve(self._handler, self.host, self.port))
+        self.port = self._server.sockets[0].getsockname()[1]
+        self._ready.set()
+        self._loop.run_forever()
+
+    def start(self) -> "ReplayServer":
+        self._thread = threading.Thread(target=self._run, name="kline-replay", daemon=True)
+        self._thread.start()
+        self._ready.wait(timeout=5)
+        return self
+
+    def stop(self) -> None:
+        if self._loop and self._server:
+            self._server.close()
+            self._loop.call_soon_threadsafe(self._loop.stop)
+        if self._thread:
+            self._thread.join(timeout=5)
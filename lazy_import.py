@@ -0,0 +1,29 @@
+import importlib.util
+import sys
+from types import ModuleType
+
+
+def lazy_import(name: str) -> ModuleType:
+    """Returns module `name` without executing it; it is loaded on its first attribute access.
+
+    Meant for heavy modules only some code paths need, e.g. `chart` (matplotlib, mplfinance,
+    PIL), which a strategy worker only uses when it renders a signal chart itself. The module
+    is registered in `sys.modules`, so a later plain `import` returns the same lazy module.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ModuleNotFoundError(f"No module named {name!r}", name=name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+
+def is_loaded(name: str) -> bool:
+    """True when module `name` is imported and, if it was imported lazily, actually executed."""
+    module = sys.modules.get(name)
+    return module is not None and not isinstance(module, importlib.util._LazyModule)
@@ -5,14 +5,7 @@ Close, High, Low, Volume). It is built on Pandas and Numpy.
 .. moduleauthor:: Dario Lopez Padial (Bukosabino)
 
 """
-from ta.wrapper import (
-    add_all_ta_features,
-    add_momentum_ta,
-    add_others_ta,
-    add_trend_ta,
-    add_volatility_ta,
-    add_volume_ta,
-)
+import importlib
 
 __all__ = [
     "add_all_ta_features",
@@ -22,3 +15,10 @@ __all__ = [
     "add_volatility_ta",
     "add_volume_ta",
 ]
+
+
+def __getattr__(name):
+    # The wrapper imports every indicator module, so it is only loaded when one of its functions is used
+    if name in __all__:
+        return getattr(importlib.import_module(".wrapper", __name__), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -8,7 +8,7 @@
 import numpy as np
 import pandas as pd
 
-from ta.utils import IndicatorMixin, _ema
+from .utils import IndicatorMixin, _ema
 
 
 class RSIIndicator(IndicatorMixin):
@@ -8,7 +8,7 @@
 import numpy as np
 import pandas as pd
 
-from ta.utils import IndicatorMixin, _ema, _get_min_max, _sma
+from .utils import IndicatorMixin, _ema, _get_min_max, _sma
 
 
 class AroonIndicator(IndicatorMixin):
@@ -8,7 +8,7 @@
 import numpy as np
 import pandas as pd
 
-from ta.utils import IndicatorMixin
+from .utils import IndicatorMixin
 
 
 class AverageTrueRange(IndicatorMixin):
@@ -11,7 +11,7 @@ import typing as tp
 import numpy as np
 import pandas as pd
 
-from ta.utils import IndicatorMixin, _ema
+from .utils import IndicatorMixin, _ema
 
 
 class AccDistIndexIndicator(IndicatorMixin):
@@ -1,8 +1,8 @@
-import json
+import asyncio
 import os
-import threading
-from pathlib import Path
-from typing import List
+from concurrent.futures import Future
+from contextlib import asynccontextmanager
+from typing import Dict, List
 
 from fastapi import FastAPI, Request
 from fastapi.responses import HTMLResponse
@@ -10,8 +10,19 @@ from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 
 from binance_24hr_tickers import binance_24hr_tickers
+from delivery import get_delivery_queue
 from logger import logger
-from telegram_bot import MessageType1, MessageType2, MessageType3, construct_message, del_message, send_telegram_message
+from state_store import get_state_store
+from telegram_bot import (
+    MessageType1,
+    MessageType2,
+    MessageType3,
+    MessageType4,
+    construct_message,
+    del_messages,
+    send_telegram_images,
+    send_telegram_message,
+)
 
 CHAT_ID_1M = os.environ.get("CHAT_ID_1M")
 TOKEN_1M = os.environ.get("TOKEN_1M")
@@ -56,108 +67,100 @@ BOT = {
     "4h": {"chat_id": CHAT_ID_2H, "token": TOKEN_2H},
 }
 
-app = FastAPI()
+# Longest wait for a queued call's result, below the read timeout of the callers (http_client.DEFAULT_TIMEOUT)
+DELIVERY_WAIT_SECONDS = 8
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    # Send what is still queued before the server exits
+    get_delivery_queue().stop()
+    get_state_store().close()
+
+
+app = FastAPI(lifespan=lifespan)
 
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
 templates = Jinja2Templates(directory="templates")
 
 
-STATE_FILE = Path("signal_state.json")
-state_lock = threading.Lock()
-
-def read_state_from_file() -> dict:
-    if not STATE_FILE.exists():
-        return {}
+async def deliver(future: Future, wait: bool) -> Dict:
+    """Result of a queued Telegram call; only an acknowledgement when not waiting or when it takes too long."""
+    if not wait:
+        return {"status": "accepted", "message_id": False}
     try:
-        with open(STATE_FILE, "r") as f:
-            content = f.read()
-            if not content:
-                return {}
-            return json.loads(content)
-    except (json.JSONDecodeError, IOError) as e:
-        logger.error(f"Could not read or parse state file {STATE_FILE}: {e}. Treating as empty state.")
-        return {}
+        # Shielded, so a timeout leaves the call queued
+        return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), DELIVERY_WAIT_SECONDS)
+    except asyncio.TimeoutError:
+        return {"status": "queued", "message_id": False}
 
 
-def write_state_to_file(state: dict):
-    try:
-        with open(STATE_FILE, "w") as f:
-            json.dump(state, f, indent=2)
-    except IOError as e:
-        logger.error(f"Could not write to state file {STATE_FILE}: {e}")
+def signal_key(body: MessageType1) -> str:
+    return f"{body.symbol}-{body.time_frame.value}-{body.time}-{body.signal}"
 
 
 @app.post("/v2/sendMessage")
-def post_send_message_v2(body: MessageType1):
+async def post_send_message_v2(body: MessageType1, wait: bool = True):
     unique_key = f"{body.symbol}-{body.time_frame}-{body.time}"
     symbol_key = body.symbol.strip("$")
 
-    with state_lock:
-        current_state = read_state_from_file()
-        last_sent_key = current_state.get(symbol_key)
-
-        if last_sent_key == unique_key:
-            logger.warning(f"Duplicate signal blocked. Key: '{unique_key}' for Symbol: {symbol_key}")
-            return {
-                "status": "Already processed",
-                "key": unique_key,
-                "message_id": False,
-            }
-
-        logger.info(f"New signal received. Processing key: '{unique_key}'")
-        try:
-            signal = construct_message(body)
-            chat_id = BOT[body.time_frame]["chat_id"]
-            token = BOT[body.time_frame]["token"]
-
-            response = send_telegram_message(
-                signal,
-                token=token,
-                chat_id=chat_id,
-                message=body,
-            )
-
-            if response and response.get("message_id"):
-                current_state[symbol_key] = unique_key
-                write_state_to_file(current_state)
-                logger.info(f"Message sent for '{symbol_key}'. State file updated with key: '{unique_key}'.")
-                return response
-            else:
-                logger.error(f"Telegram send failed for key: '{unique_key}'. State NOT updated, allowing retry.")
-                return {
-                    "status": "failed",
-                    "message_id": False,
-                }
-
-        except Exception as e:
-            logger.error(f"Error processing key '{unique_key}': {e}. State not updated.")
-            return {
-                "status": "failed",
-                "message_id": False,
-            }
+    store = get_state_store()
+    if not store.reserve(symbol_key, unique_key):
+        logger.warning(f"Duplicate signal blocked. Key: '{unique_key}' for Symbol: {symbol_key}")
+        return {
+            "status": "Already processed",
+            "key": unique_key,
+            "message_id": False,
+        }
+
+    def record_state(future: Future):
+        response = future.result()
+        sent = bool(response and response.get("message_id"))
+        store.release(symbol_key, unique_key, sent)
+        if sent:
+            logger.info(f"Message sent for '{symbol_key}'. State updated with key: '{unique_key}'.")
+        else:
+            logger.error(f"Telegram send failed for key: '{unique_key}'. State NOT updated, allowing retry.")
+
+    logger.info(f"New signal received. Processing key: '{unique_key}'")
+    try:
+        key = signal_key(body)
+        signal = construct_message(body)
+        chat_id = BOT[body.time_frame]["chat_id"]
+        token = BOT[body.time_frame]["token"]
+        send = lambda: send_telegram_message(signal, token=token, chat_id=chat_id, message=body)
+        future = get_delivery_queue().submit(chat_id, token, send, cost=max(1, len(body.image)), key=key)
+    except Exception as e:
+        store.release(symbol_key, unique_key, sent=False)
+        logger.error(f"Error processing key '{unique_key}': {e}. State not updated.")
+        return {
+            "status": "failed",
+            "message_id": False,
+        }
+    future.add_done_callback(record_state)
+    return await deliver(future, wait)
 
 
 @app.post("/sendMessage")
-def post_send_message(body: MessageType1):
+async def post_send_message(body: MessageType1, wait: bool = True):
     logger.info(f"Received message: {body}")
+    key = signal_key(body)
     signal = construct_message(body)
     chat_id = BOT[body.time_frame]["chat_id"]
     token = BOT[body.time_frame]["token"]
-    return send_telegram_message(
-        signal,
-        token=token,
-        chat_id=chat_id,
-        message=body,
-    )
+    send = lambda: send_telegram_message(signal, token=token, chat_id=chat_id, message=body)
+    return await deliver(get_delivery_queue().submit(chat_id, token, send, cost=max(1, len(body.image)), key=key), wait)
 
 
 @app.post("/send24hrPriceChange")
-def post_send_24h_price_change(body: MessageType2):
+async def post_send_24h_price_change(body: MessageType2, wait: bool = False):
     logger.info(f"Received request to send 24h price change: {body}")
     chat_id = BOT[body.time_frame]["chat_id"]
     token = BOT[body.time_frame]["token"]
-    return send_telegram_message(body.message, token=token, chat_id=chat_id, message=body)
+    send = lambda: send_telegram_message(body.message, token=token, chat_id=chat_id, message=body)
+    return await deliver(get_delivery_queue().submit(chat_id, token, send), wait)
 
 
 @app.post("/trigger-send24hrPriceChange")
@@ -167,14 +170,23 @@ def trigger_send_24h_price_change():
     logger.info(f"message: Triggered 24h price change V2")
 
 
+@app.post("/sendImages")
+async def post_send_images(body: MessageType4, wait: bool = True):
+    logger.info(f"Received images for message: {body}")
+    chat_id = BOT[body.time_frame]["chat_id"]
+    token = BOT[body.time_frame]["token"]
+    send = lambda: send_telegram_images(token=token, chat_id=chat_id, message=body)
+    key = f"images-{body.time_frame.value}-{body.message_id}"
+    return await deliver(get_delivery_queue().submit(chat_id, token, send, cost=len(body.image), key=key), wait)
+
+
 @app.post("/deleteMessage")
-def delete_message(body: MessageType3):
+async def delete_message(body: MessageType3, wait: bool = False):
     logger.info(f"Received request to delete message: {body}")
     chat_id = BOT[body.time_frame]["chat_id"]
     token = BOT[body.time_frame]["token"]
-    for id in body.message_id:
-        logger.info(f"Deleting message with ID: {id}")
-        del_message(token=token, chat_id=chat_id, message_id=id)
+    delete_many = lambda message_ids: del_messages(token=token, chat_id=chat_id, message_ids=message_ids)
+    return await deliver(get_delivery_queue().delete(chat_id, token, body.message_id, delete_many), wait)
 
 
 def get_images_by_timeframe(time_frame: str) -> List[dict]:
@@ -187,13 +199,14 @@ def get_images_by_timeframe(time_frame: str) -> List[dict]:
 
     # List all files in static directory
     for filename in os.listdir(static_dir):
-        if filename.startswith(f"{time_frame}_") and filename.endswith(".png"):
+        # Charts are encoded as png, jpg or webp, see chart.CHART_IMAGE_FORMAT
+        if filename.startswith(f"{time_frame}_") and filename.endswith((".png", ".jpg", ".webp")):
             # Split filename to extract components
             parts = filename.split("_")
             if len(parts) == 5:  # Ensure correct format
                 tf, title, signal, time1, create_time = parts
                 try:
-                    create_time_ns = float(create_time.replace(".png", ""))
+                    create_time_ns = float(os.path.splitext(create_time)[0])
                     images.append(
                         {
                             "filename": filename,
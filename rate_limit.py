@@ -0,0 +1,122 @@
+import multiprocessing
+import time
+from typing import Mapping, Optional
+
+from logger import logger
+
+# --- Constants ---
+
+# Request weight Binance Futures allows per IP and minute, and the share of it we allow ourselves
+WEIGHT_LIMIT_1M = 2400
+WEIGHT_SAFETY_FACTOR = 0.8
+
+# Priorities, most urgent first. Lower priorities leave part of the budget to the higher ones.
+PRIORITY_SIGNAL = 0  # Work on a pending signal (pre-send checks, chart data)
+PRIORITY_ROUTINE = 1  # Regular polling of the latest candles
+PRIORITY_BACKGROUND = 2  # Bootstraps and other bulk fetches
+RESERVE_FRACTION = {PRIORITY_SIGNAL: 0.0, PRIORITY_ROUTINE: 0.2, PRIORITY_BACKGROUND: 0.4}
+
+# Back-off when Binance answers 429 (rate limited) or 418 (IP banned) without a Retry-After header
+DEFAULT_RETRY_AFTER_SECONDS = {429: 60, 418: 120}
+
+# Longest single sleep while waiting for budget, so shared state changes are picked up quickly
+MAX_WAIT_STEP_SECONDS = 1.0
+
+
+def kline_request_weight(limit: int) -> int:
+    """Request weight of a Futures `/klines` call for the given limit."""
+    if limit < 100:
+        return 1
+    if limit < 500:
+        return 2
+    if limit <= 1000:
+        return 5
+    return 10
+
+
+class WeightBudget:
+    """Token bucket of request weight shared by every strategy process of a host.
+
+    The bucket holds one minute of weight and refills continuously. Requests of lower priority
+    may only draw it down to their reserve, so pre-send checks still get through while routine
+    polls and bootstraps wait. Responses keep the bucket in line with the `x-mbx-used-weight-1m`
+    header and a 429/418 blocks every process until `Retry-After` has passed.
+
+    The state lives in shared memory: create the budget before forking the workers.
+    """
+
+    def __init__(self, limit: int = WEIGHT_LIMIT_1M, safety_factor: float = WEIGHT_SAFETY_FACTOR):
+        self.capacity = limit * safety_factor
+        self.rate = self.capacity / 60.0
+        self.lock = multiprocessing.Lock()
+        self.tokens = multiprocessing.RawValue("d", self.capacity)
+        self.updated_at = multiprocessing.RawValue("d", time.time())
+        self.blocked_until = multiprocessing.RawValue("d", 0.0)
+
+    def _refill(self, now: float) -> None:
+        elapsed = max(now - self.updated_at.value, 0.0)
+        self.tokens.value = min(self.capacity, self.tokens.value + elapsed * self.rate)
+        self.updated_at.value = now
+
+    def try_acquire(self, weight: int, priority: int = PRIORITY_ROUTINE) -> float:
+        """Takes `weight` from the bucket. Returns 0 on success, otherwise the seconds to wait before retrying."""
+        now = time.time()
+        with self.lock:
+            if now < self.blocked_until.value:
+                return self.blocked_until.value - now
+            self._refill(now)
+            available = self.tokens.value - self.capacity * RESERVE_FRACTION[priority]
+            if available >= weight:
+                self.tokens.value -= weight
+                return 0.0
+            return (weight - available) / self.rate
+
+    def acquire(self, weight: int, priority: int = PRIORITY_ROUTINE, timeout: Optional[float] = None) -> bool:
+        """Blocks until `weight` is available for `priority`. Returns False if `timeout` expires first."""
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            wait = self.try_acquire(weight, priority)
+            if wait == 0:
+                return True
+            if deadline is not None and time.time() + wait > deadline:
+                return False
+            time.sleep(min(wait, MAX_WAIT_STEP_SECONDS))
+
+    def record_response(self, status_code: int, headers: Mapping[str, str]) -> None:
+        """Syncs the bucket with the weight Binance reports and backs off on 429/418."""
+        now = time.time()
+        with self.lock:
+            used = headers.get("x-mbx-used-weight-1m")
+            if used is not None:
+                self._refill(now)
+                self.tokens.value = min(self.tokens.value, self.capacity - int(used))
+            if status_code in DEFAULT_RETRY_AFTER_SECONDS:
+                retry_after = float(headers.get("Retry-After", DEFAULT_RETRY_AFTER_SECONDS[status_code]))
+                self.blocked_until.value = max(self.blocked_until.value, now + retry_after)
+                logger.warning(f"Binance answered {status_code}, pausing requests for {retry_after:.0f}s")
+
+    @property
+    def used_weight(self) -> float:
+        with self.lock:
+            self._refill(time.time())
+            return self.capacity - self.tokens.value
+
+
+# --- Process-wide budget ---
+
+_budget: Optional[WeightBudget] = None
+
+
+def install_budget(budget: WeightBudget) -> WeightBudget:
+    """Makes `budget` the one used by this process and the processes it forks afterwards."""
+    global _budget
+    _budget = budget
+    return budget
+
+
+def get_budget() -> WeightBudget:
+    """Returns the installed budget, creating a process-local one if none was installed."""
+    global _budget
+    if _budget is None:
+        _budget = WeightBudget()
+    return _budget
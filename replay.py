@@ -0,0 +1,487 @@
+import argparse
+import contextlib
+import heapq
+import json
+import logging
+import math
+import os
+import time
+from bisect import bisect_right
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from tabulate import tabulate
+
+import chandelier_exit
+import kline_store
+import scheduler
+from candle_buffer import CandleBuffer
+from chandelier_exit import PRE_SEND_TIME_FRAMES, CEConfig, ChandelierExitStrategy, uses_future_api
+from kline_stream import (
+    FUTURE_STREAM_URL,
+    MAX_STREAMS_PER_CONNECTION,
+    SPOT_STREAM_URL,
+    KlineStream,
+    interval_to_ms,
+    kline_from_stream_payload,
+    load_frames,
+)
+from logger import logger
+from sim_exchange import sim_klines
+
+# --- Constants ---
+
+# Closed candles served from before the first recorded candle (the EMA handler loads 1000)
+REPLAY_HISTORY_LIMIT = 1000
+
+# Seconds one loop iteration takes at least (the kline fetch), so a loop never spins on one instant
+REPLAY_TICK_SECONDS = 0.05
+
+# Seconds `main` sleeps after bootstrapping and `run_strategy` waits after an exception
+BOOTSTRAP_DELAY_SECONDS = 1.0
+RESTART_DELAY_SECONDS = 5.0
+
+# Default `--sleep` of chandelier_exit.py
+REPLAY_CADENCE = 10
+
+# Seconds between the snapshots of a synthetic market
+SYNTHETIC_STEP_SECONDS = 2.0
+
+# (pair, time frame) of one replayed strategy
+Key = Tuple[str, str]
+# fetch(pair, time_frame, end_ms, limit): closed klines opened before end_ms, oldest first
+HistoryFetch = Callable[[str, str, int, int], List]
+
+
+# --- Fakes ---
+
+
+class FakeClock:
+    """Stands in for the `time` module of the live code: `time()` reads the simulated clock and `sleep()`
+    advances it. Anything else comes from the real module."""
+
+    def __init__(self, now: float):
+        self.now = now
+
+    def time(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.now += max(seconds, 0.0)
+
+    def __getattr__(self, name):
+        return getattr(time, name)
+
+
+class FakeTelegram:
+    """Answers the Telegram bot API calls of `chandelier_exit` and logs every message at the simulated time."""
+
+    def __init__(self, clock: FakeClock):
+        self.clock = clock
+        self.messages: Dict[int, Dict] = {}
+        # Runner whose iteration is being run, set by the replay loop
+        self.runner: Optional["Runner"] = None
+
+    def request(self, endpoint: str, body: Dict) -> Dict:
+        if endpoint == "sendMessage":
+            runner = self.runner
+            message_id = len(self.messages) + 1
+            message = {
+                "pair": runner.pair,
+                "time_frame": runner.time_frame,
+                "candle": runner.strategy.timestamp,
+                "signal": body["signal"],
+                "pre_sent": runner.time_frame in PRE_SEND_TIME_FRAMES,
+                "sent_at": self.clock.now,
+                "deleted_at": None,
+                # Pre-sent signals are confirmed or not once their candle closes
+                "confirmed": None if runner.time_frame in PRE_SEND_TIME_FRAMES else True,
+            }
+            self.messages[message_id] = message
+            runner.sent.append(message)
+            return {"status": "success", "message_id": message_id}
+        if endpoint == "deleteMessage":
+            self.messages[body["message_id"]]["deleted_at"] = self.clock.now
+            return {"status": True}
+        return {"status": "error", "message": f"Unknown endpoint {endpoint}"}
+
+
+@contextlib.contextmanager
+def patched_runtime(clock: FakeClock, telegram: FakeTelegram):
+    """Swaps the clock, the Telegram API and chart rendering of the live code for the fakes."""
+    saved = (chandelier_exit.time, scheduler.time, chandelier_exit.send_telegram_api_request, chandelier_exit.chart)
+    chart = type("ReplayChart", (), {"get_charts": staticmethod(lambda *args, **kwargs: "")})
+    chandelier_exit.time = scheduler.time = clock
+    chandelier_exit.send_telegram_api_request = telegram.request
+    chandelier_exit.chart = chart
+    try:
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            yield
+    finally:
+        chandelier_exit.time, scheduler.time, chandelier_exit.send_telegram_api_request, chandelier_exit.chart = saved
+
+
+# --- Markets ---
+
+
+class RecordedMarket:
+    """Kline snapshots of recorded stream frames (`KlineStream(record_path=...)`), timed by their event time.
+
+    Candles closed before the recording starts come from `history_fetch`.
+    """
+
+    def __init__(self, frames: Sequence[str], history_fetch: HistoryFetch):
+        updates: Dict[Key, List[Tuple[float, List]]] = {}
+        for frame in frames:
+            event = json.loads(frame)
+            event = event.get("data", event)
+            if event.get("e") != "kline":
+                continue
+            payload = event["k"]
+            key = (payload["s"].upper(), payload["i"])
+            updates.setdefault(key, []).append((event["E"] / 1000, kline_from_stream_payload(payload)))
+
+        self._times: Dict[Key, List[float]] = {}
+        self._klines: Dict[Key, List[List]] = {}
+        # Closed candles, oldest first, and the time each became final (the first frame of the next candle)
+        self._closed: Dict[Key, List[List]] = {}
+        self._closed_at: Dict[Key, List[float]] = {}
+        for key, key_updates in updates.items():
+            key_updates.sort(key=lambda update: update[0])
+            times, klines, closed, closed_at = [], [], [], []
+            for event_time, kline in key_updates:
+                if klines and kline[0] < klines[-1][0]:
+                    continue  # Late frame for a candle already rolled past
+                if klines and kline[0] != klines[-1][0]:
+                    closed.append(klines[-1])
+                    closed_at.append(event_time)
+                times.append(event_time)
+                klines.append(kline)
+            history = history_fetch(key[0], key[1], klines[0][0], REPLAY_HISTORY_LIMIT)
+            self._times[key], self._klines[key] = times, klines
+            self._closed[key] = history + closed
+            self._closed_at[key] = [-math.inf] * len(history) + closed_at
+
+    @property
+    def keys(self) -> List[Key]:
+        return list(self._times)
+
+    @property
+    def start(self) -> float:
+        """First instant every key has a snapshot."""
+        return max(times[0] for times in self._times.values())
+
+    @property
+    def end(self) -> float:
+        return max(times[-1] for times in self._times.values())
+
+    def history(self, key: Key, now: float, limit: int) -> Optional[List]:
+        """The latest `limit` klines at `now`, forming candle included, like a REST `/klines` call."""
+        i = bisect_right(self._times[key], now) - 1
+        if i < 0:
+            return None
+        known = bisect_right(self._closed_at[key], now)
+        return self._closed[key][max(known - limit + 1, 0) : known] + [self._klines[key][i]]
+
+    def next_update(self, key: Key, after: float) -> Optional[float]:
+        times = self._times[key]
+        i = bisect_right(times, after)
+        return times[i] if i < len(times) else None
+
+    def next_candle(self, key: Key, after: float) -> Optional[float]:
+        closed_at = self._closed_at[key]
+        i = bisect_right(closed_at, after)
+        return closed_at[i] if i < len(closed_at) else None
+
+
+class SyntheticMarket:
+    """Snapshots of the simulated exchange (`sim_exchange.sim_klines`) every `step` seconds over [start, end]."""
+
+    def __init__(self, keys: Sequence[Key], start: float, end: float, step: float = SYNTHETIC_STEP_SECONDS):
+        self.keys = list(keys)
+        self.start = math.ceil(start / step) * step
+        self.end = end
+        self.step = step
+
+    def history(self, key: Key, now: float, limit: int) -> Optional[List]:
+        snapshot = math.floor(now / self.step) * self.step
+        return sim_klines(key[0], key[1], limit, int(snapshot * 1000))
+
+    def next_update(self, key: Key, after: float) -> Optional[float]:
+        snapshot = (math.floor(after / self.step) + 1) * self.step
+        return snapshot if snapshot <= self.end else None
+
+    def next_candle(self, key: Key, after: float) -> Optional[float]:
+        candle_seconds = interval_to_ms(key[1]) / 1000
+        candle_open = (math.floor(after / candle_seconds) + 1) * candle_seconds
+        snapshot = math.ceil(candle_open / self.step) * self.step
+        return snapshot if snapshot <= self.end else None
+
+
+def store_history(exchange: str) -> HistoryFetch:
+    """Returns a `HistoryFetch` reading the kline store, syncing the candles it does not have yet."""
+    store = kline_store.get_store()
+    if store is None:
+        raise RuntimeError("The kline store is disabled, set KLINE_STORE_DIR")
+
+    def fetch(pair: str, time_frame: str, end_ms: int, limit: int) -> List:
+        future = uses_future_api(exchange, pair)
+        source = "future" if future else "spot"
+        start_ms = end_ms - limit * interval_to_ms(time_frame)
+        store.sync(source, pair, time_frame, start_ms, end_ms, kline_store.rest_range_fetcher(future))
+        return kline_store.to_klines(store.read(source, pair, time_frame, start_ms, end_ms))
+
+    return fetch
+
+
+class ReplaySource:
+    """Kline source of the replayed strategies (the `KlineStream` contract), reading the market at the
+    simulated time. It never answers None, so the strategies never fall back to the REST API."""
+
+    def __init__(self, market, clock: FakeClock):
+        self.market = market
+        self.clock = clock
+
+    def fetch_klines(self, pair: str, time_frame: str, limit: int) -> List:
+        klines = self.market.history((pair.upper(), time_frame), self.clock.now, limit)
+        if not klines or len(klines) < min(limit, 2):
+            raise RuntimeError(f"No replay klines for {pair} {time_frame} at {self.clock.now}")
+        return klines
+
+
+# --- Replay ---
+
+
+class Runner:
+    """One token's live loop (`chandelier_exit.main`), stepped by the replay instead of sleeping.
+
+    `wake` picks when the next iteration runs: "poll" sleeps until the scheduler's next wake-up
+    like the REST loop, "stream" also wakes as soon as a new candle opens like a stream source, and
+    "oracle" also runs on every snapshot the moment it arrives, the best any loop could do.
+    """
+
+    def __init__(self, key: Key, market, source: ReplaySource, cadence: int, mode: str, wake: str):
+        self.key = key
+        self.pair, self.time_frame = key
+        self.token = self.pair[:-4] if self.pair.endswith("USDT") else self.pair
+        self.market = market
+        self.source = source
+        self.cadence = cadence
+        self.mode = mode
+        self.wake = wake
+        self.strategy: Optional[ChandelierExitStrategy] = None
+        self.sent: List[Dict] = []
+        self.ticks = 0
+        self.restarts = 0
+        self.errors = 0
+
+    def start(self, now: float) -> float:
+        """Bootstraps a new strategy, as every (re)start of `run_strategy` does. Returns the first wake-up."""
+        self.strategy = ChandelierExitStrategy(
+            CandleBuffer(CEConfig.SIZE.value),
+            self.token,
+            self.time_frame,
+            self.pair,
+            "",
+            self.cadence,
+            self.mode,
+            "future",
+            self.source,
+        )
+        self.strategy.bootstrap()
+        return now + BOOTSTRAP_DELAY_SECONDS
+
+    def step(self, now: float) -> float:
+        """Runs one iteration of the main loop at `now`. Returns the time of the next one."""
+        if self.strategy is None:
+            return self.start(now)
+        strategy = self.strategy
+        counter = strategy.counter
+        self.ticks += 1
+        try:
+            if not strategy.update(strategy.fetch_latest_klines()):
+                self.restarts += 1
+                return self.start(now)
+            if strategy.counter != counter:
+                self._confirm_pre_sent()
+            strategy.check_signals()
+        except Exception as e:
+            logger.error(f"Replay {self.pair} {self.time_frame} failed at {now}: {e}")
+            self.errors += 1
+            self.strategy = None
+            return now + RESTART_DELAY_SECONDS
+        return self.next_wake(now)
+
+    def next_wake(self, now: float) -> float:
+        wake = max(self.strategy.scheduler.next_wake(self.strategy.timestamp, now), now + REPLAY_TICK_SECONDS)
+        if self.wake == "oracle":
+            # The scheduler's instants still count: the pre-send threshold is a time, not a snapshot
+            update = self.market.next_update(self.key, now)
+            return wake if update is None else min(wake, update)
+        if self.wake == "stream":
+            new_candle = self.market.next_candle(self.key, now)
+            if new_candle is not None:
+                wake = min(wake, max(new_candle, now + REPLAY_TICK_SECONDS))
+        return wake
+
+    def _confirm_pre_sent(self) -> None:
+        """Marks the signals pre-sent on the candle that just closed as confirmed by its final direction or not."""
+        data = self.strategy.data
+        closed_open, closed_direction = data["Time"][-2], data["Direction"][-2]
+        for message in self.sent:
+            if message["confirmed"] is None and message["candle"] == closed_open:
+                message["confirmed"] = closed_direction == (1 if message["signal"] == "BUY" else -1)
+
+
+def replay(
+    market,
+    keys: Optional[Sequence[Key]] = None,
+    cadence: int = REPLAY_CADENCE,
+    mode: str = "",
+    wake: str = "poll",
+    start: Optional[float] = None,
+    end: Optional[float] = None,
+) -> Dict:
+    """Runs the live loop of every key over the market on a simulated clock, as fast as the CPU allows.
+
+    Returns the runners, the Telegram messages and the wall and simulated durations.
+    """
+    start = market.start if start is None else start
+    end = market.end if end is None else end
+    clock = FakeClock(start)
+    telegram = FakeTelegram(clock)
+    source = ReplaySource(market, clock)
+    runners = [Runner(key, market, source, cadence, mode, wake) for key in (keys or market.keys)]
+
+    started = time.time()
+    with patched_runtime(clock, telegram):
+        queue = []
+        for i, runner in enumerate(runners):
+            telegram.runner = runner
+            heapq.heappush(queue, (runner.start(start), i))
+        while queue:
+            wake_at, i = heapq.heappop(queue)
+            if wake_at > end:
+                break
+            clock.now = wake_at
+            telegram.runner = runners[i]
+            heapq.heappush(queue, (runners[i].step(wake_at), i))
+
+    return {
+        "runners": runners,
+        "messages": list(telegram.messages.values()),
+        "wall_seconds": time.time() - started,
+        "simulated_seconds": end - start,
+    }
+
+
+def signal_key(message: Dict) -> Tuple:
+    return message["pair"], message["time_frame"], message["candle"], message["signal"]
+
+
+def summarize(result: Dict, oracle: Optional[Dict] = None) -> Dict:
+    """Throughput, false pre-send rate and, against an oracle replay of the same market, signal latency."""
+    runners, messages = result["runners"], result["messages"]
+    ticks = sum(runner.ticks for runner in runners)
+    pre_sent = [message for message in messages if message["pre_sent"]]
+    decided = [message for message in pre_sent if message["confirmed"] is not None]
+    false_pre_sent = sum(1 for message in decided if not message["confirmed"])
+    summary = {
+        "strategies": len(runners),
+        "ticks": ticks,
+        "wall_seconds": result["wall_seconds"],
+        "ticks_per_second": ticks / result["wall_seconds"] if result["wall_seconds"] else 0.0,
+        "speedup": result["simulated_seconds"] / result["wall_seconds"] if result["wall_seconds"] else 0.0,
+        "signals": len(messages),
+        "pre_sent": len(pre_sent),
+        "deleted": sum(1 for message in pre_sent if message["deleted_at"] is not None),
+        "false_pre_sent": false_pre_sent,
+        "false_pre_send_rate": false_pre_sent / len(decided) * 100 if decided else 0.0,
+        "restarts": sum(runner.restarts for runner in runners),
+        "errors": sum(runner.errors for runner in runners),
+    }
+    if oracle is not None:
+        ideal = {signal_key(message): message["sent_at"] for message in oracle["messages"]}
+        sent = {signal_key(message): message["sent_at"] for message in messages}
+        latencies = np.array([sent_at - ideal[key] for key, sent_at in sent.items() if key in ideal])
+        if len(latencies):
+            summary.update(
+                latency_mean=float(latencies.mean()),
+                latency_p50=float(np.percentile(latencies, 50)),
+                latency_p95=float(np.percentile(latencies, 95)),
+                latency_max=float(latencies.max()),
+            )
+        summary.update(missed=len(ideal.keys() - sent.keys()), extra=len(sent.keys() - ideal.keys()))
+    return summary
+
+
+# --- Recording ---
+
+
+def record(subscriptions: Sequence[Key], path: str, seconds: float, exchange: str) -> None:
+    """Records the kline stream frames of the subscriptions to `path` for `seconds`."""
+    streams = []
+    for future in (True, False):
+        group = [(pair, tf) for pair, tf in subscriptions if uses_future_api(exchange, pair) == future]
+        base_url = FUTURE_STREAM_URL if future else SPOT_STREAM_URL
+        for start in range(0, len(group), MAX_STREAMS_PER_CONNECTION):
+            chunk = group[start : start + MAX_STREAMS_PER_CONNECTION]
+            streams.append(KlineStream(chunk, base_url=base_url, record_path=path).start())
+    logger.info(f"Recording {len(subscriptions)} subscriptions to {path} for {seconds:.0f}s")
+    try:
+        time.sleep(seconds)
+    finally:
+        for stream in streams:
+            stream.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay kline snapshots through the live strategy loop.")
+    parser.add_argument("--frames", type=str, help="Recorded stream frames to replay", default="")
+    parser.add_argument("--record", type=str, help="Record stream frames to this file instead", default="")
+    parser.add_argument("--minutes", type=float, help="Minutes to record or to simulate", default=60)
+    parser.add_argument("--tokens", type=str, help="Comma-separated tokens, e.g. 'BTC,ETH'", default="")
+    parser.add_argument("--tokens-file", type=str, help="File with one token per line", default="")
+    parser.add_argument("--synthetic", type=int, help="Simulate this many tokens instead of a recording", default=0)
+    parser.add_argument("--timeframe", type=str, help="Comma-separated time frames", default="5m")
+    parser.add_argument("--exchange", type=str, help="Exchange: 'future' or 'spot'", default="future")
+    parser.add_argument("--mode", type=str, help="Chart mode: 'heikin_ashi' or 'normal'", default="")
+    parser.add_argument("--sleep", type=int, help="Seconds between checks inside a candle", default=REPLAY_CADENCE)
+    parser.add_argument("--stream", action="store_true", help="Wake on new candles like a stream source")
+    parser.add_argument("--no-oracle", action="store_true", help="Skip the oracle replay and the latency")
+    parser.add_argument("--output", type=str, help="CSV file for every sent message", default="")
+    parser.add_argument("--verbose", action="store_true", help="Keep the strategy logs")
+    args = parser.parse_args()
+
+    tokens = [token.strip() for token in args.tokens.split(",") if token.strip()]
+    if args.tokens_file:
+        with open(args.tokens_file, "r") as file:
+            tokens += [line.strip() for line in file if line.strip()]
+    time_frames = args.timeframe.split(",")
+
+    if args.record:
+        subscriptions = [(f"{token}USDT", tf) for token in tokens for tf in time_frames]
+        record(subscriptions, args.record, args.minutes * 60, args.exchange)
+        exit(0)
+
+    if args.synthetic:
+        tokens = tokens or [f"SIM{i:03d}" for i in range(args.synthetic)]
+        keys = [(f"{token}USDT", tf) for token in tokens[: args.synthetic] for tf in time_frames]
+        now = time.time()
+        market = SyntheticMarket(keys, now - args.minutes * 60, now)
+    elif args.frames:
+        market = RecordedMarket(load_frames(args.frames), store_history(args.exchange))
+        keys = [(f"{token}USDT", tf) for token in tokens for tf in time_frames] or market.keys
+    else:
+        parser.error("Give --frames, --synthetic or --record")
+
+    if not args.verbose:
+        logger.setLevel(logging.WARNING)
+    result = replay(market, keys, args.sleep, args.mode, "stream" if args.stream else "poll")
+    oracle = None if args.no_oracle else replay(market, keys, args.sleep, args.mode, "oracle")
+    summary = summarize(result, oracle)
+    if args.output:
+        pd.DataFrame(result["messages"]).to_csv(args.output, index=False)
+    rows = [(metric, f"{value:.2f}" if isinstance(value, float) else value) for metric, value in summary.items()]
+    print(tabulate(rows, headers=["metric", "value"], tablefmt="github", disable_numparse=True))
@@ -0,0 +1,170 @@
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Sequence
+
+from kline_stream import STREAM_STALE_SECONDS, interval_to_ms
+from logger import logger
+
+# --- Constants ---
+
+# Largest number of base candles aggregated into one derived candle (one REST call seeds a bucket)
+MAX_RESAMPLE_RATIO = 1000
+
+# Binance weekly candles open on Monday 00:00 UTC, four days after the epoch (a Thursday)
+WEEK_OFFSET_MS = 4 * 24 * 60 * 60 * 1000
+
+
+def bucket_open(open_time: int, time_frame: str) -> int:
+    """Returns the open time (ms) of the `time_frame` candle that contains `open_time`."""
+    interval = interval_to_ms(time_frame)
+    offset = WEEK_OFFSET_MS if time_frame.endswith("w") else 0
+    return (open_time - offset) // interval * interval + offset
+
+
+def can_resample(base_time_frame: str, time_frame: str) -> bool:
+    """Whether `time_frame` candles can be built from `base_time_frame` candles."""
+    base, target = interval_to_ms(base_time_frame), interval_to_ms(time_frame)
+    return target > base and target % base == 0 and target // base <= MAX_RESAMPLE_RATIO
+
+
+def aggregate_klines(klines: Sequence[List], time_frame: str) -> List:
+    """Combines consecutive base klines of one bucket into a single kline in the REST `/klines` format."""
+    first, last = klines[0], klines[-1]
+    open_time = bucket_open(int(first[0]), time_frame)
+    total = lambda index: sum(float(kline[index]) for kline in klines)
+    return [
+        open_time,
+        float(first[1]),
+        max(float(kline[2]) for kline in klines),
+        min(float(kline[3]) for kline in klines),
+        float(last[4]),
+        total(5),
+        open_time + interval_to_ms(time_frame) - 1,
+        total(7),
+        int(total(8)),
+        total(9),
+        total(10),
+        "0",
+    ]
+
+
+def resample_klines(klines: Sequence[List], base_time_frame: str, time_frame: str) -> List[List]:
+    """Resamples a contiguous list of base klines, dropping a leading bucket that starts before the data."""
+    buckets: Dict[int, List[List]] = {}
+    for kline in klines:
+        buckets.setdefault(bucket_open(int(kline[0]), time_frame), []).append(kline)
+    result = [aggregate_klines(group, time_frame) for group in buckets.values()]
+    if result and int(klines[0][0]) != result[0][0]:
+        result = result[1:]
+    return result
+
+
+class KlineResampler:
+    """Derives the latest two klines of higher time frames of one pair from its base time frame updates.
+
+    Plug `update` into the `on_update` callback of the base `KlineStream`. Base klines of the
+    current bucket are kept so every derived candle is rebuilt exactly from its base candles;
+    the previous derived candle and the first bucket after (re)seeding come from REST. Heikin
+    Ashi values are then computed by `KlineHelper.populate` on the derived klines, i.e. from the
+    higher time frame OHLC, as for klines fetched from Binance.
+    """
+
+    def __init__(
+        self,
+        pair: str,
+        base_time_frame: str,
+        time_frames: Sequence[str],
+        rest_fetch: Callable[[str, str, int], List],
+        on_update: Optional[Callable[[str, str, List[List], bool], None]] = None,
+        stale_after: float = STREAM_STALE_SECONDS,
+    ):
+        self.pair = pair.upper()
+        self.base_time_frame = base_time_frame
+        self.time_frames = [tf for tf in time_frames if can_resample(base_time_frame, tf)]
+        self.rest_fetch = rest_fetch
+        self.on_update = on_update
+        self.stale_after = stale_after
+        self._base: Dict[int, List] = {}
+        self._previous: Dict[str, List] = {}
+        self._latest: Dict[str, List[List]] = {}
+        self._updated_at = 0.0
+        self._lock = threading.Lock()
+
+    def seed(self, time_frame: str, now_ms: int) -> None:
+        """Fetches the previous derived kline and the base klines of the current bucket from REST."""
+        start = bucket_open(now_ms, time_frame)
+        count = (now_ms - start) // interval_to_ms(self.base_time_frame) + 1
+        base_klines = self.rest_fetch(self.pair, self.base_time_frame, int(count))
+        previous = self.rest_fetch(self.pair, time_frame, 2)
+        with self._lock:
+            for kline in base_klines:
+                self._base.setdefault(int(kline[0]), list(kline))
+            if previous and int(previous[0][0]) < start:
+                self._previous[time_frame] = list(previous[0])
+
+    def _bucket(self, start: int, end: int) -> Optional[List[List]]:
+        """Base klines of [start, end] if every one of them is present."""
+        step = interval_to_ms(self.base_time_frame)
+        klines = [self._base.get(open_time) for open_time in range(start, end + 1, step)]
+        return None if any(kline is None for kline in klines) else klines
+
+    def _needs_seed(self, time_frame: str, latest_open: int) -> bool:
+        start = bucket_open(latest_open, time_frame)
+        previous_start = bucket_open(start - 1, time_frame)
+        previous = self._previous.get(time_frame)
+        has_previous = (previous is not None and previous[0] == previous_start) or bool(
+            self._bucket(previous_start, start - 1)
+        )
+        return not has_previous or self._bucket(start, latest_open) is None
+
+    def update(self, pair: str, base_time_frame: str, klines: List[List], new_candle: bool) -> None:
+        """Applies the latest base klines and publishes the derived klines of every time frame."""
+        latest_open = int(klines[-1][0])
+        with self._lock:
+            for kline in klines:
+                self._base[int(kline[0])] = list(kline)
+            self._updated_at = time.time()
+            needs_seed = [tf for tf in self.time_frames if self._needs_seed(tf, latest_open)]
+
+        # First bucket after start-up or a gap in the base stream
+        for time_frame in needs_seed:
+            try:
+                self.seed(time_frame, latest_open)
+            except Exception as e:
+                logger.error(f"Resampler seed failed for {self.pair} {time_frame}: {e}")
+
+        updates = []
+        with self._lock:
+            for time_frame in self.time_frames:
+                start = bucket_open(latest_open, time_frame)
+                previous_start = bucket_open(start - 1, time_frame)
+                closed = self._bucket(previous_start, start - 1)
+                if closed:
+                    self._previous[time_frame] = aggregate_klines(closed, time_frame)
+                previous = self._previous.get(time_frame)
+                current = self._bucket(start, latest_open)
+                if current is None or previous is None or previous[0] != previous_start:
+                    continue
+                latest = self._latest.get(time_frame)
+                rolled = latest is None or latest[-1][0] < start
+                self._latest[time_frame] = [previous, aggregate_klines(current, time_frame)]
+                updates.append((time_frame, [list(k) for k in self._latest[time_frame]], rolled))
+
+            # Keep only the base klines that the longest current bucket still needs
+            oldest = min((bucket_open(latest_open, tf) for tf in self.time_frames), default=latest_open)
+            for open_time in [t for t in self._base if t < oldest]:
+                del self._base[open_time]
+
+        if self.on_update:
+            for time_frame, latest, rolled in updates:
+                self.on_update(self.pair, time_frame, latest, rolled)
+
+    def fetch_klines(self, pair: str, time_frame: str, limit: int) -> Optional[List]:
+        """Same contract as `KlineStream.fetch_klines` for the derived time frames."""
+        if limit > 2:
+            return None
+        with self._lock:
+            latest = self._latest.get(time_frame)
+            if not latest or len(latest) < limit or time.time() - self._updated_at > self.stale_after:
+                return None
+            return [list(k) for k in latest[-limit:]]
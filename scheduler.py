@@ -0,0 +1,64 @@
+import time
+from typing import Optional
+
+from kline_stream import interval_to_ms
+
+# --- Constants ---
+
+# Seconds after a candle closes before waking, so REST and the stream have rolled to the new candle
+CLOSE_GRACE_SECONDS = 1.0
+
+# Seconds added to computed instants so a wake-up never lands just before the instant it targets
+WAKE_SLACK_SECONDS = 0.05
+
+# Seconds between polls once a candle has closed but the new one is not published yet
+LATE_CANDLE_BACKOFF_SECONDS = 1.0
+
+
+class CandleScheduler:
+    """Computes when a strategy loop needs to wake instead of polling on a fixed sleep.
+
+    The decision points of a candle are the pre-send threshold (`pre_send_factor` of the candle,
+    only for time frames that pre-send) and the candle close. Time frames that pre-send are also
+    woken every `cadence` seconds in between, since a flip on the forming candle or an invalidated
+    pre-sent signal can happen at any time. Time frames that only act on closed candles sleep
+    straight to the next close.
+    """
+
+    def __init__(
+        self,
+        time_frame: str,
+        cadence: float,
+        pre_send_factor: Optional[float] = None,
+        close_grace: float = CLOSE_GRACE_SECONDS,
+    ):
+        self.time_frame = time_frame
+        self.duration = interval_to_ms(time_frame) / 1000
+        self.cadence = cadence
+        self.pre_send_factor = pre_send_factor
+        self.close_grace = close_grace
+
+    def next_wake(self, candle_open: float, now: Optional[float] = None) -> float:
+        """Returns the next instant (epoch seconds) the loop should run for the candle opened at `candle_open`."""
+        now = time.time() if now is None else now
+        close = candle_open + self.duration + self.close_grace
+        if now >= close:
+            # The candle closed but the exchange or stream has not rolled over yet, poll again shortly
+            return now + LATE_CANDLE_BACKOFF_SECONDS
+        if self.pre_send_factor is None:
+            return close
+
+        wake = min(close, now + self.cadence)
+        threshold = candle_open + self.duration * self.pre_send_factor + WAKE_SLACK_SECONDS
+        if now < threshold:
+            wake = min(wake, threshold)
+        return wake
+
+    def wait(self, candle_open: float, source=None, pair: Optional[str] = None) -> float:
+        """Sleeps until the next wake-up, or until `source` reports a new candle. Returns the seconds waited."""
+        delay = max(self.next_wake(candle_open) - time.time(), 0.0)
+        if source is not None:
+            source.wait_for_update(pair, self.time_frame, delay)
+        else:
+            time.sleep(delay)
+        return delay
@@ -0,0 +1,175 @@
+import json
+import random
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs, urlparse
+
+from kline_stream import interval_to_ms
+from rate_limit import WEIGHT_LIMIT_1M, kline_request_weight
+
+# --- Constants ---
+
+# Seconds of IP ban when requests keep coming while rate limited, as Binance answers 418
+SIM_BAN_SECONDS = 120
+
+# Seconds a 429 asks the client to wait
+SIM_RETRY_AFTER_SECONDS = 10
+
+# Relative size of the intra-candle wander of the forming candle around its path to the close
+SIM_FORMING_NOISE = 0.002
+
+
+def sim_klines(
+    symbol: str,
+    interval: str,
+    limit: int,
+    now_ms: int,
+    start_ms: Optional[int] = None,
+    end_ms: Optional[int] = None,
+) -> List[List]:
+    """Returns `limit` klines ending with the candle forming at `now_ms`, or the first `limit` klines
+    opened in [start_ms, end_ms] when a start is given.
+
+    Klines follow a deterministic random walk per symbol. The forming candle moves towards its close
+    as time passes, wandering around that path (a bridge that is pinned at the open and the close)
+    so its direction can flip back and forth before it closes.
+    """
+    step = interval_to_ms(interval)
+    forming_open = last_open = now_ms // step * step
+    if end_ms is not None:
+        last_open = min(last_open, end_ms // step * step)
+    first_open = last_open - (limit - 1) * step
+    if start_ms is not None:
+        first_open = -(-start_ms // step) * step
+        last_open = min(last_open, first_open + (limit - 1) * step)
+    result = []
+    for open_time in range(first_open, last_open + 1, step):
+        rng = random.Random(f"{symbol}:{interval}:{open_time}")
+        open_p = 100.0 + rng.uniform(-5, 5)
+        close_p = open_p * (1 + rng.gauss(0, 0.003))
+        high_noise, low_noise = rng.uniform(0, 0.002), rng.uniform(0, 0.002)
+        if open_time == forming_open:
+            progress = (now_ms - open_time) / step
+            wander = random.Random(f"{symbol}:{interval}:{open_time}:{now_ms // 1000}").gauss(0, 1)
+            close_p = open_p + (close_p - open_p) * progress
+            close_p += open_p * SIM_FORMING_NOISE * wander * (progress * (1 - progress)) ** 0.5
+        high_p = max(open_p, close_p) * (1 + high_noise)
+        low_p = min(open_p, close_p) * (1 - low_noise)
+        prices = [f"{price:.6f}" for price in (open_p, high_p, low_p, close_p)]
+        result.append([open_time, *prices, "1000.0", open_time + step - 1, "100000.0", 100, "500.0", "50000.0", "0"])
+    return result
+
+
+class SimulatedExchange:
+    """Local stand-in for the Binance Futures `/fapi/v1/klines` endpoint, for tests without network access.
+
+    Klines come from `sim_klines` aligned to the real clock, so the latest candle is always forming.
+    Request weight is counted per rolling minute and reported in `x-mbx-used-weight-1m`; going over
+    `weight_limit` answers 429 with `Retry-After`, and requests sent while rate limited get the IP
+    banned with 418.
+
+    Point the bot at it with `BINANCE_FUTURE_API_URL=<exchange.url>`.
+    """
+
+    def __init__(
+        self, host: str = "127.0.0.1", port: int = 0, weight_limit: int = WEIGHT_LIMIT_1M, latency: float = 0.0
+    ):
+        self.weight_limit = weight_limit
+        self.latency = latency
+        self.requests: List[Dict] = []
+        self._weights = deque()
+        self._blocked_until = 0.0
+        self._banned = False
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/fapi/v1/klines"
+
+    def start(self) -> "SimulatedExchange":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="sim-exchange", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    # --- Exchange behaviour ---
+
+    def used_weight(self, now: float) -> int:
+        while self._weights and self._weights[0][0] <= now - 60:
+            self._weights.popleft()
+        return sum(weight for _, weight in self._weights)
+
+    def handle(self, path: str) -> tuple:
+        """Returns (status, headers, body) for one request."""
+        if self.latency:
+            time.sleep(self.latency)
+        url = urlparse(path)
+        if url.path != "/fapi/v1/klines":
+            return 404, {}, {"code": -1, "msg": "Not found"}
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        limit = int(query.get("limit", 500))
+        now = time.time()
+
+        with self._lock:
+            if now < self._blocked_until:
+                if not self._banned:
+                    self._banned = True
+                    self._blocked_until = now + SIM_BAN_SECONDS
+                retry_after = int(self._blocked_until - now) + 1
+                self.requests.append({"time": now, "status": 418, "limit": limit})
+                return 418, {"Retry-After": str(retry_after)}, {"code": -1003, "msg": "IP banned"}
+
+            self._banned = False
+            weight = kline_request_weight(limit)
+            if self.used_weight(now) + weight > self.weight_limit:
+                self._blocked_until = now + SIM_RETRY_AFTER_SECONDS
+                headers = {
+                    "Retry-After": str(SIM_RETRY_AFTER_SECONDS),
+                    "x-mbx-used-weight-1m": str(self.used_weight(now)),
+                }
+                self.requests.append({"time": now, "status": 429, "limit": limit})
+                return 429, headers, {"code": -1003, "msg": "Too many requests"}
+
+            self._weights.append((now, weight))
+            used = self.used_weight(now)
+            self.requests.append({"time": now, "status": 200, "limit": limit})
+
+        start_ms, end_ms = query.get("startTime"), query.get("endTime")
+        body = sim_klines(
+            query["symbol"],
+            query["interval"],
+            limit,
+            int(now * 1000),
+            None if start_ms is None else int(start_ms),
+            None if end_ms is None else int(end_ms),
+        )
+        return 200, {"x-mbx-used-weight-1m": str(used)}, body
+
+    def _handler_class(self):
+        exchange = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                status, headers, body = exchange.handle(self.path)
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
@@ -0,0 +1,124 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional
+
+from logger import logger
+
+# --- Constants ---
+
+# SQLite database of the last signal sent per symbol
+SIGNAL_STATE_DB = os.environ.get("SIGNAL_STATE_DB", "signal_state.db")
+
+# JSON state file of earlier versions, imported into an empty database
+LEGACY_STATE_FILE = "signal_state.json"
+
+# Seconds a write waits for another process holding the database write lock
+BUSY_TIMEOUT_SECONDS = 5
+
+
+class SignalStateStore:
+    """Last signal key sent per symbol, in memory and in an SQLite database in WAL mode.
+
+    Duplicate checks read the in-memory dict under a lock of their own symbol, so signals of
+    different symbols never wait for each other or for disk. A key is reserved while its signal
+    is being delivered and written through to the database once it was sent; every write is its
+    own transaction, synced before `release` returns, so the state survives a crash of the server.
+    """
+
+    def __init__(self, path: str = SIGNAL_STATE_DB, legacy_path: Optional[str] = LEGACY_STATE_FILE):
+        self.path = path
+        self.conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT_SECONDS, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=FULL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS signal_state (symbol TEXT PRIMARY KEY, key TEXT NOT NULL, updated_at REAL)"
+        )
+        # Serializes statements on the shared connection; held only for one write
+        self.write_lock = threading.Lock()
+        self.sent: Dict[str, str] = dict(self.conn.execute("SELECT symbol, key FROM signal_state"))
+        self.pending: Dict[str, str] = {}
+        self.locks: Dict[str, threading.Lock] = {}
+        self.locks_guard = threading.Lock()
+        if not self.sent and legacy_path:
+            self._import_legacy(legacy_path)
+
+    def _lock(self, symbol: str) -> threading.Lock:
+        lock = self.locks.get(symbol)
+        if lock is None:
+            with self.locks_guard:
+                lock = self.locks.setdefault(symbol, threading.Lock())
+        return lock
+
+    def _import_legacy(self, legacy_path: str) -> None:
+        try:
+            with open(legacy_path, "r") as f:
+                content = f.read()
+            state = json.loads(content) if content else {}
+        except FileNotFoundError:
+            return
+        except (json.JSONDecodeError, IOError) as e:
+            logger.error(f"Could not read or parse state file {legacy_path}: {e}. Not imported.")
+            return
+        now = time.time()
+        with self.write_lock:
+            self.conn.execute("BEGIN")
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO signal_state (symbol, key, updated_at) VALUES (?, ?, ?)",
+                [(symbol, key, now) for symbol, key in state.items()],
+            )
+            self.conn.execute("COMMIT")
+        self.sent.update(state)
+        logger.info(f"Imported {len(state)} symbols from {legacy_path} into {self.path}")
+
+    def get(self, symbol: str) -> Optional[str]:
+        """Key of the last signal sent for `symbol`."""
+        return self.sent.get(symbol)
+
+    def reserve(self, symbol: str, key: str) -> bool:
+        """Marks `key` as being delivered for `symbol`; False when it was sent or is being delivered already."""
+        with self._lock(symbol):
+            if key in (self.sent.get(symbol), self.pending.get(symbol)):
+                return False
+            self.pending[symbol] = key
+            return True
+
+    def release(self, symbol: str, key: str, sent: bool) -> None:
+        """Ends the delivery of `key`; a sent key is recorded, a failed one may be reserved again."""
+        with self._lock(symbol):
+            if self.pending.get(symbol) == key:
+                del self.pending[symbol]
+            if sent:
+                self._record(symbol, key)
+
+    def _record(self, symbol: str, key: str) -> None:
+        self.sent[symbol] = key
+        try:
+            with self.write_lock:
+                self.conn.execute(
+                    "INSERT INTO signal_state (symbol, key, updated_at) VALUES (?, ?, ?) "
+                    "ON CONFLICT(symbol) DO UPDATE SET key = excluded.key, updated_at = excluded.updated_at",
+                    (symbol, key, time.time()),
+                )
+        except sqlite3.Error as e:
+            # Still deduplicated in memory until the server restarts
+            logger.error(f"Could not write state of {symbol} to {self.path}: {e}")
+
+    def close(self) -> None:
+        with self.write_lock:
+            self.conn.close()
+
+
+_store: Optional[SignalStateStore] = None
+_store_lock = threading.Lock()
+
+
+def get_state_store() -> SignalStateStore:
+    """Returns the signal state store under `SIGNAL_STATE_DB`, opening it on first use."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = SignalStateStore(SIGNAL_STATE_DB)
+        return _store
@@ -0,0 +1,237 @@
+import argparse
+import itertools
+import multiprocessing
+import time
+from datetime import datetime
+from multiprocessing import shared_memory
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from tabulate import tabulate
+
+import backtest
+import kline_store
+from backfill import backfill, date_to_ms
+from indicators import EPSILON, batch_chandelier_exit, heikin_ashi
+from lib.trend import ema_indicator
+from logger import logger
+
+# --- Constants ---
+
+# Default grid
+SWEEP_MULTS = (1.5, 1.8, 2.0, 2.5)
+SWEEP_LENGTHS = (1, 2, 3)
+SWEEP_USE_CLOSE = (True,)
+SWEEP_MODES = ("HA", "KLINE")
+SWEEP_EMA_FILTER = (False, True)
+
+# EMA windows of the cross filter (EMA_35 and EMA_21 of test_fetch_data.EMA)
+EMA_FILTER_WINDOWS = (34, 21)
+
+# Time frames whose EMA cross is checked on the candle body, the others use the wick
+BODY_CROSS_TIME_FRAMES = ("5m", "15m")
+
+# Rows of the shared block of one series
+FIELDS = ("time", "open", "high", "low", "close", "ha_open", "ha_high", "ha_low", "ha_close")
+FIELD_INDEX = {field: i for i, field in enumerate(FIELDS)}
+
+# Summary columns averaged over tokens in the ranked table
+RANK_KEYS = ("percentage_gain", "win_rate", "max_loss_streak")
+
+
+# --- Shared series ---
+
+
+class SharedSeries:
+    """Candles of one (token, time frame) in a shared memory block of `len(FIELDS)` x bars floats.
+
+    Worker processes attach to the block by name, so the arrays are never pickled to them.
+    """
+
+    def __init__(self, klines: List[List]):
+        values = np.array([[float(v) for v in kline[:5]] for kline in klines]).T
+        ha = heikin_ashi(values[1], values[2], values[3], values[4])
+        block = np.vstack([values[0] / 1000, values[1:], ha["Open"], ha["High"], ha["Low"], ha["Close"]])
+        self.shape = block.shape
+        self.shm = shared_memory.SharedMemory(create=True, size=block.nbytes)
+        np.ndarray(self.shape, dtype=np.float64, buffer=self.shm.buf)[:] = block
+
+    @property
+    def spec(self) -> Tuple[str, Tuple[int, int]]:
+        return self.shm.name, self.shape
+
+    def release(self) -> None:
+        self.shm.close()
+        self.shm.unlink()
+
+
+_series: Dict[Tuple[str, str], np.ndarray] = {}
+_handles: List[shared_memory.SharedMemory] = []
+
+
+def _attach(specs: Dict[Tuple[str, str], Tuple[str, Tuple[int, int]]]) -> None:
+    """Pool initializer: maps every shared series into this worker."""
+    for key, (name, shape) in specs.items():
+        shm = shared_memory.SharedMemory(name=name)
+        _handles.append(shm)
+        _series[key] = np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+
+
+# --- Evaluation ---
+
+
+def ema_cross_signal(time_frame: str, open_p, high, low, close, direction: np.ndarray) -> np.ndarray:
+    """1 on the direction flips whose candle crosses the EMA 34 or 21 like `EMA.check_cross`, 0 elsewhere."""
+    flips = np.r_[False, direction[1:] != direction[:-1]]
+    buy, sell = flips & (direction == 1), flips & (direction == -1)
+    crossed = np.zeros(len(direction), dtype=bool)
+    body = time_frame in BODY_CROSS_TIME_FRAMES
+    for window in EMA_FILTER_WINDOWS:
+        ema = ema_indicator(pd.Series(close), window).to_numpy()
+        with np.errstate(invalid="ignore"):
+            below_open, above_open = ema - open_p > EPSILON, open_p - ema > EPSILON
+            buy_cross = below_open & ((close if body else high) - ema > EPSILON)
+            sell_cross = above_open & (ema - (close if body else low) > EPSILON)
+        crossed |= (buy & buy_cross) | (sell & sell_cross)
+    return crossed.astype(int)
+
+
+def evaluate(task: Tuple) -> List[Dict]:
+    """Backtests one (token, time frame, mode, mult, length, use_close) for every EMA filter setting."""
+    token, time_frame, mode, mult, length, use_close, ema_filters = task
+    block = _series[(token, time_frame)]
+    column = lambda field: block[FIELD_INDEX[field]]
+    prefix = "ha_" if mode == "HA" else ""
+    open_p, high, low, close = (column(prefix + field) for field in ("open", "high", "low", "close"))
+
+    result = batch_chandelier_exit(high, low, close, multiplier=mult, length=length, use_close=use_close)
+    direction = result["Direction"].astype(int)
+    real_close = column("close")
+    times = pd.to_datetime(column("time") + datetime.now().astimezone().utcoffset().total_seconds(), unit="s")
+    data = pd.DataFrame(
+        {
+            "Time1": times.strftime("%Y-%m-%d %H:%M"),
+            "direction": direction,
+            "High": high,
+            "Low": low,
+            "real_price_open": column("open"),
+            "real_price_close": real_close,
+            "real_price_change": np.r_[np.nan, np.diff(real_close) / real_close[:-1] * 100],
+        }
+    )
+
+    rows = []
+    for ema_filter in ema_filters:
+        # Without the filter every flip is a signal, as with the EMA check of test_fetch_data disabled
+        data["signal"] = ema_cross_signal(time_frame, open_p, high, low, close, direction) if ema_filter else 1
+        summary = backtest.run_backtest(data, token)
+        row = {key: summary[key] for key in ("percentage_gain", "win_rate", "total_win", "total_loss")}
+        row.update(max_loss_streak=summary["max_loss_streak"], lowest_capital=summary["lowest_capital"])
+        row.update(token=token, time_frame=time_frame, mode=mode, mult=mult, length=length, use_close=use_close)
+        rows.append({**row, "ema_filter": ema_filter})
+    return rows
+
+
+def rank(results: pd.DataFrame, sort_by: str = "percentage_gain") -> pd.DataFrame:
+    """Averages every parameter set over the tokens and sorts the sets, best first."""
+    params = ["time_frame", "mode", "mult", "length", "use_close", "ema_filter"]
+    results = results.assign(
+        profitable=results["percentage_gain"] > 0, trades=results["total_win"] + results["total_loss"]
+    )
+    table = results.groupby(params).agg(
+        **{key: (key, "mean") for key in RANK_KEYS},
+        trades=("trades", "sum"),
+        profitable=("profitable", "sum"),
+        tokens=("token", "count"),
+    )
+    return table.sort_values(sort_by, ascending=False).reset_index()
+
+
+def sweep(
+    series: Dict[Tuple[str, str], List[List]],
+    mults: Sequence[float] = SWEEP_MULTS,
+    lengths: Sequence[int] = SWEEP_LENGTHS,
+    use_close: Sequence[bool] = SWEEP_USE_CLOSE,
+    modes: Sequence[str] = SWEEP_MODES,
+    ema_filters: Sequence[bool] = SWEEP_EMA_FILTER,
+    workers: Optional[int] = None,
+) -> pd.DataFrame:
+    """Evaluates the grid on every (token, time frame) series over a process pool. Returns one row per run."""
+    shared = {key: SharedSeries(klines) for key, klines in series.items() if len(klines) > 2}
+    tasks = [
+        (token, time_frame, mode, mult, length, close, tuple(ema_filters))
+        for (token, time_frame), mode, mult, length, close in itertools.product(
+            shared, modes, mults, lengths, use_close
+        )
+    ]
+    logger.info(f"Sweep: {len(tasks) * len(ema_filters)} runs over {len(shared)} series")
+    started = time.time()
+    try:
+        specs = {key: series.spec for key, series in shared.items()}
+        with multiprocessing.Pool(workers, initializer=_attach, initargs=(specs,)) as pool:
+            rows = [row for batch in pool.imap_unordered(evaluate, tasks) for row in batch]
+    finally:
+        for series in shared.values():
+            series.release()
+    logger.info(f"Sweep finished in {time.time() - started:.1f}s")
+    return pd.DataFrame(rows)
+
+
+def load_series(
+    tokens: Sequence[str], time_frames: Sequence[str], exchange: str, start_ms: int, end_ms: int
+) -> Dict[Tuple[str, str], List[List]]:
+    """Backfills the range into the kline store once and reads every series from it."""
+    from chandelier_exit import uses_future_api
+
+    store = kline_store.get_store()
+    source = lambda pair: "future" if uses_future_api(exchange, pair) else "spot"
+    targets = [(source(f"{token}USDT"), f"{token}USDT", tf) for token in tokens for tf in time_frames]
+    backfill(targets, start_ms, end_ms)
+    return {
+        (token, tf): kline_store.to_klines(store.read(source(f"{token}USDT"), f"{token}USDT", tf, start_ms, end_ms))
+        for token in tokens
+        for tf in time_frames
+    }
+
+
+if __name__ == "__main__":
+    parse_list = lambda cast: lambda value: [cast(item) for item in value.split(",") if item]
+    parse_bool = lambda value: value.lower() in ("1", "true", "yes", "on")
+
+    parser = argparse.ArgumentParser(description="Sweep Chandelier Exit parameters over tokens and time frames.")
+    parser.add_argument("--tokens", type=str, help="Comma-separated tokens, e.g. 'BTC,ETH'", default="")
+    parser.add_argument("--tokens-file", type=str, help="File with one token per line", default="")
+    parser.add_argument("--timeframe", type=parse_list(str), help="Comma-separated time frames", default=["5m"])
+    parser.add_argument("--start", type=str, help="First day (UTC), YYYY-MM-DD", required=True)
+    parser.add_argument("--end", type=str, help="Last day (UTC), YYYY-MM-DD; defaults to today", default="")
+    parser.add_argument("--exchange", type=str, help="Exchange: 'future' or 'spot'", default="future")
+    parser.add_argument("--mult", type=parse_list(float), help="Multipliers to try", default=list(SWEEP_MULTS))
+    parser.add_argument("--length", type=parse_list(int), help="ATR lengths to try", default=list(SWEEP_LENGTHS))
+    parser.add_argument(
+        "--use-close", type=parse_list(parse_bool), help="use_close values to try", default=list(SWEEP_USE_CLOSE)
+    )
+    parser.add_argument("--mode", type=parse_list(str), help="Chart modes: HA, KLINE", default=list(SWEEP_MODES))
+    parser.add_argument(
+        "--ema-filter", type=parse_list(parse_bool), help="EMA filter settings to try", default=list(SWEEP_EMA_FILTER)
+    )
+    parser.add_argument("--workers", type=int, help="Worker processes (default: CPU count)", default=None)
+    parser.add_argument("--sort", type=str, help="Ranking column", default="percentage_gain", choices=RANK_KEYS)
+    parser.add_argument("--top", type=int, help="Rows of the ranked table to print", default=30)
+    parser.add_argument("--output", type=str, help="CSV file for every run", default="")
+    args = parser.parse_args()
+
+    tokens = [token.strip() for token in args.tokens.split(",") if token.strip()]
+    if args.tokens_file:
+        with open(args.tokens_file, "r") as file:
+            tokens += [line.strip() for line in file if line.strip()]
+    end_ms = date_to_ms(args.end or datetime.utcnow().strftime("%Y-%m-%d")) + 24 * 60 * 60 * 1000
+
+    series = load_series(tokens, args.timeframe, args.exchange, date_to_ms(args.start), end_ms)
+    results = sweep(series, args.mult, args.length, args.use_close, args.mode, args.ema_filter, args.workers)
+    if args.output:
+        results.to_csv(args.output, index=False)
+
+    ranked = rank(results, args.sort).head(args.top)
+    ranked.insert(0, "rank", range(1, len(ranked) + 1))
+    print(tabulate(ranked, headers="keys", tablefmt="github", showindex=False, floatfmt=".2f"))
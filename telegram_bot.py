@@ -2,6 +2,8 @@ import json
 import time
 from enum import Enum
 import requests
+import http_client
+from delivery import DEFAULT_RETRY_AFTER_SECONDS, RetryAfter
 from logger import logger
 from pydantic import BaseModel, Field 
 from typing import Any, List
@@ -15,6 +17,9 @@ Signals = {
 
 PIN_MESSAGE_PATH = "pinned_messages.txt"
 
+# Most message ids one deleteMessages call accepts
+DELETE_MESSAGES_LIMIT = 100
+
 
 class TimeFrame(str, Enum):
     m1 = "1m"
@@ -53,6 +58,12 @@ class MessageType3(BaseModel):
     message_id: List[int] = Field(..., example=[123456789])
 
 
+class MessageType4(BaseModel):
+    time_frame: TimeFrame
+    message_id: List[int] = Field(..., example=[123456789])
+    image: List[str] = Field(..., example=["DOGE1.png", "DOGE2.png"])
+
+
 def last_pinned_message_to_file(message_id, symbol, time_frame):
     records = []
 
@@ -110,6 +121,17 @@ def remove_file(filename):
         logger.error(f"Error removing file: {filename}")
         pass
 
+def raise_for_retry_after(response: requests.Response) -> None:
+    """Raises RetryAfter when Telegram rate limited the call (429), so the delivery queue repeats it later."""
+    if response.status_code != 429:
+        return
+    try:
+        retry_after = response.json().get("parameters", {}).get("retry_after", DEFAULT_RETRY_AFTER_SECONDS)
+    except ValueError:
+        retry_after = DEFAULT_RETRY_AFTER_SECONDS
+    raise RetryAfter(float(retry_after))
+
+
 def handle_message_type1(url, payload, files, signal, token, chat_id, message: MessageType1):
     # Unpin the last pinned message first if necessary
     last_pinned_message_id = None
@@ -139,11 +161,14 @@ def handle_message_type1(url, payload, files, signal, token, chat_id, message: M
     print("IS PIN", is_pin, message.symbol, message.time_frame)
     # Send the new message
     if files:
-        response = requests.post(url, data=payload, files=files)
+        response = http_client.post(url, data=payload, files=files, timeout=http_client.UPLOAD_TIMEOUT)
+        # The images are kept when the call is rate limited, it is repeated with them
+        raise_for_retry_after(response)
         if message.time_frame in [TimeFrame.m5]:
             remove_file(message.image)
     else:
-        response = requests.post(url, data=payload)
+        response = http_client.post(url, data=payload)
+        raise_for_retry_after(response)
     logger.info(signal)
     logger.info(f"Response type1: {response.json()}")
 
@@ -190,7 +215,8 @@ def handle_message_type2(url, payload, signal, token, chat_id, message: MessageT
         logger.info(f"No previous message to unpin for: {symbol} {signal} {message.time_frame}")
 
     # Send the new message
-    response = requests.post(url, data=payload)
+    response = http_client.post(url, data=payload)
+    raise_for_retry_after(response)
     if response.json().get("ok"):
         logger.info(f"Message Type 2 sent successfully: {symbol} {signal} {message.time_frame} {date}")
         message_id = response.json()["result"]["message_id"]
@@ -222,7 +248,8 @@ def pin_unpin_telegram_message(
     url = f"https://api.telegram.org/bot{token}/{action}"
     payload = {"chat_id": chat_id, "message_id": message_id}
 
-    response = requests.post(url, data=payload)
+    response = http_client.post(url, data=payload)
+    raise_for_retry_after(response)
     response_data = response.json()
     logger.info(response_data)
 
@@ -354,12 +381,50 @@ def send_telegram_message(signal, token, chat_id, message=None):
         }
 
 
+def send_telegram_images(token, chat_id, message: MessageType4):
+    """Sends the chart images of a signal as a reply to its message, once they are rendered."""
+    files = {}
+    for i, image_path in enumerate(message.image):
+        image_data = get_image_data(image_path)
+        if image_data:
+            files[f"photo{i}"] = image_data
+    if not files:
+        return {"status": "failed", "message_id": False}
+
+    # Replying fails when the signal was deleted in the meantime, so no orphan charts are left
+    payload = {"chat_id": chat_id, "reply_to_message_id": message.message_id[0]}
+    if len(files) == 1:
+        url = f"https://api.telegram.org/bot{token}/sendPhoto"
+        files = {"photo": next(iter(files.values()))}
+    else:
+        url = f"https://api.telegram.org/bot{token}/sendMediaGroup"
+        payload["media"] = json.dumps([{"type": "photo", "media": f"attach://{key}"} for key in files])
+    try:
+        response = http_client.post(url, data=payload, files=files, timeout=http_client.UPLOAD_TIMEOUT)
+    finally:
+        for image_data in files.values():
+            image_data.close()
+    raise_for_retry_after(response)
+    if message.time_frame in [TimeFrame.m5]:
+        remove_file(message.image)
+
+    response_data = response.json()
+    if not response_data.get("ok"):
+        logger.info(f"Failed to send images for message {message.message_id}: {response_data}")
+        return {"status": "failed", "message_id": False}
+    result = response_data["result"]
+    messages_ids = [result["message_id"]] if isinstance(result, dict) else [res["message_id"] for res in result]
+    logger.info(f"Images sent for message {message.message_id}, message_id: {messages_ids}")
+    return {"status": "success", "message_id": messages_ids}
+
+
 def del_message(token, chat_id, message_id):
     url = f"https://api.telegram.org/bot{token}/deleteMessage"
     payload = {"chat_id": chat_id, "message_id": str(message_id)}
 
     try:
-        response = requests.post(url, data=payload)
+        response = http_client.post(url, data=payload)
+        raise_for_retry_after(response)
         response.raise_for_status()  # Raises an error for bad HTTP status codes
         response_data = response.json()
 
@@ -388,3 +453,26 @@ def del_message(token, chat_id, message_id):
                 "status": False,
                 "message": "Request failed",
             }
+
+
+def del_messages(token, chat_id, message_ids: List[int]):
+    """Deletes messages of a chat with one deleteMessages call per 100 ids; Telegram skips the ones already gone."""
+    if len(message_ids) == 1:
+        return del_message(token, chat_id, message_ids[0])
+
+    url = f"https://api.telegram.org/bot{token}/deleteMessages"
+    deleted = True
+    for i in range(0, len(message_ids), DELETE_MESSAGES_LIMIT):
+        chunk = message_ids[i : i + DELETE_MESSAGES_LIMIT]
+        response = http_client.post(url, data={"chat_id": chat_id, "message_ids": json.dumps(chunk)})
+        raise_for_retry_after(response)
+        response_data = response.json()
+        if response_data.get("ok"):
+            logger.info(f"Messages {chunk} deleted successfully.")
+        else:
+            logger.info(f"Failed to delete messages {chunk}: {response_data}")
+            deleted = False
+    return {
+        "status": deleted,
+        "message": "Messages deleted successfully" if deleted else "Failed to delete messages",
+    }
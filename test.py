@@ -1,4 +1,4 @@
-import pandas as pd
+import backtest
 from datetime import datetime, timedelta
 
 leverage = 1
@@ -40,356 +40,44 @@ def check_time(time1):
 
 def run_trading_strategy(token, time_frame):
     if mode == "HA":
-        data = pd.read_csv(f"t_{token}_ce_{time_frame}_{ATR}_HA.csv")
+        data = backtest.load_frame(f"t_{token}_ce_{time_frame}_{ATR}_HA.csv")
     else:
-        data = pd.read_csv(f"t_{token}_ce_{time_frame}_{ATR}.csv")
-
-    initial_capital = 2300
-    capital = initial_capital
-    position_open = False
-    position_type = None
-    entry_price = 0
-    win = 0
-    loss = 0
-    max_loss = 0
-    max_win = 0
-    lowest_capital = capital
-    current_loss_streak = 0
-    max_loss_streak = 0
-    long_opened = 0
-    short_opened = 0
-    daily_results = {}
-
-    daily_win_lost = {}
-    stop_lost_rate = 0
-
-    highest_gain_open = 0  # To track highest gain while position is open
-    gain_1_2_percent = 0
-    gain_2_4_percent = 0
-    gain_more_than_4_percent = 0
-
-    highest_loss_open = 0  # To track highest loss while position is open
-    loss_1_2_percent = 0
-    loss_2_4_percent = 0
-    loss_more_than_4_percent = 0
+        data = backtest.load_frame(f"t_{token}_ce_{time_frame}_{ATR}.csv")
 
     print(f"Processing token: {token}")
 
-    for i in range(2, len(data)):
-        item = data.iloc[i]
-
-        current_direction = item["direction"]
-        current_close = item["real_price_close"]
-        current_high = item["High"]
-        current_low = item["Low"]
-
-        previous_item = data.iloc[i - 1]
-        previous_direction = previous_item["direction"]
-        previous_close = previous_item["real_price_close"]
-
-        pre_previous_item = data.iloc[i - 2]
-        pre_previous_direction = pre_previous_item["direction"]
-        pre_signal = previous_item["signal"]
-
-        current_date = item["Time1"][:10]
-        if current_date not in daily_results:
-            daily_results[current_date] = {"capital_start": capital, "gain_loss": 0}
-
-        # Update highest gain while position is open
-        if position_open:
-            if position_type == "long":
-                current_gain = (current_high - entry_price) / entry_price * leverage
-                current_lost = (current_low - entry_price) / entry_price * leverage
-            elif position_type == "short":
-                current_gain = (entry_price - current_low) / entry_price * leverage
-                current_lost = (entry_price - current_high) / entry_price * leverage
-
-            if current_gain > highest_gain_open:
-                highest_gain_open = current_gain
-
-            if current_lost < highest_loss_open:
-                highest_loss_open = current_gain
-
-        # Close long position
-        if position_open and position_type == "long":
-            exit_price = previous_close
-            gain_per = ((exit_price - entry_price) / entry_price) * leverage
-
-            if gain_per <= stop_lost or gain_per >= tp:
-                if gain_per >= tp:
-                    gain_per = tp
-                else:
-                    gain_per = stop_lost
-                    stop_lost_rate += 1
-
-                gain = gain_per * (capital * position_fraction) - fee_rate * (capital * position_fraction)
-                capital += gain
-                position_open = False
-                daily_results[current_date]["gain_loss"] += gain
-
-                if gain_per > 0:
-                    win += 1
-                    current_loss_streak = 0
-                else:
-                    loss += 1
-                    current_loss_streak += 1
-                    if current_loss_streak > max_loss_streak:
-                        max_loss_streak = current_loss_streak
-
-                if gain_per > max_win:
-                    max_win = gain_per
-                if gain_per < max_loss:
-                    max_loss = gain_per
-                if capital < lowest_capital:
-                    lowest_capital = capital
-
-                # Classification of highest loss
-                if -1 >= highest_loss_open * 100 > -2:
-                    print("loss1", pre_previous_item["Time1"])
-                    loss_1_2_percent += 1
-                elif -2 >= highest_loss_open * 100 > -4:
-                    print("loss2", pre_previous_item["Time1"])
-                    loss_2_4_percent += 1
-                elif highest_loss_open * 100 <= -4:
-                    print("loss4", pre_previous_item["Time1"])
-                    loss_more_than_4_percent += 1
-
-                # Classification of highest gain
-                if 1 <= highest_gain_open * 100 < 2:
-                    print("gain1", pre_previous_item["Time1"])
-                    gain_1_2_percent += 1
-                elif 2 <= highest_gain_open * 100 < 4:
-                    print("gain2", pre_previous_item["Time1"])
-                    gain_2_4_percent += 1
-                elif highest_gain_open * 100 >= 4:
-                    print("gain4", pre_previous_item["Time1"])
-                    gain_more_than_4_percent += 1
-                highest_gain_open = 0  # Reset for the next position
-
-                if enable_log:
-                    print(
-                        f"{token} Close {position_type} at {i} | {previous_item['Time1']} Gain %: {gain_per*100:.2f}%. Cap: {capital:.2f}",
-                        "\n",
-                    )
-                continue
-
-            if current_direction == -1 and previous_direction == 1:
-                gain = gain_per * (capital * position_fraction) - fee_rate * (capital * position_fraction)
-                capital += gain
-                position_open = False
-                daily_results[current_date]["gain_loss"] += gain
-                if gain_per > 0:
-                    win += 1
-                    current_loss_streak = 0
-                else:
-                    loss += 1
-                    current_loss_streak += 1
-                    if current_loss_streak > max_loss_streak:
-                        max_loss_streak = current_loss_streak
-
-                if gain_per > max_win:
-                    max_win = gain_per
-                if gain_per < max_loss:
-                    max_loss = gain_per
-                if capital < lowest_capital:
-                    lowest_capital = capital
-
-                # Classification of highest loss
-                if -1 >= highest_loss_open * 100 > -2:
-                    print("loss1", pre_previous_item["Time1"])
-                    loss_1_2_percent += 1
-                elif -2 >= highest_loss_open * 100 > -4:
-                    print("loss2", pre_previous_item["Time1"])
-                    loss_2_4_percent += 1
-                elif highest_loss_open * 100 <= -4:
-                    print("loss4", pre_previous_item["Time1"])
-                    loss_more_than_4_percent += 1
-
-                # Classification of highest gain
-                if 1 <= highest_gain_open * 100 < 2:
-                    print("gain1", pre_previous_item["Time1"])
-                    gain_1_2_percent += 1
-                elif 2 <= highest_gain_open * 100 < 4:
-                    print("gain2", pre_previous_item["Time1"])
-                    gain_2_4_percent += 1
-                elif highest_gain_open * 100 >= 4:
-                    print("gain4", pre_previous_item["Time1"])
-                    gain_more_than_4_percent += 1
-                highest_gain_open = 0  # Reset for the next position
-
-                if enable_log:
-                    print(
-                        f"{token} Close {position_type} at {i} | {previous_item['Time1']} Gain %: {gain_per*100:.2f}%. Cap: {capital:.2f}",
-                        "\n",
-                    )
-
-        # Close short position
-        elif position_open and position_type == "short":
-            exit_price = previous_close
-            gain_per = (entry_price - exit_price) / entry_price * leverage
-
-            if gain_per <= stop_lost or gain_per >= tp:
-                if gain_per >= tp:
-                    gain_per = tp
-                else:
-                    gain_per = stop_lost
-                    stop_lost_rate += 1
-
-                gain = gain_per * (capital * position_fraction) - fee_rate * (capital * position_fraction)
-                capital += gain
-                position_open = False
-                daily_results[current_date]["gain_loss"] += gain
-                if gain_per > 0:
-                    win += 1
-                    current_loss_streak = 0
-                else:
-                    loss += 1
-                    current_loss_streak += 1
-                    if current_loss_streak > max_loss_streak:
-                        max_loss_streak = current_loss_streak
-
-                if gain_per > max_win:
-                    max_win = gain_per
-                if gain_per < max_loss:
-                    max_loss = gain_per
-                if capital < lowest_capital:
-                    lowest_capital = capital
-
-                # Classification of highest loss
-                if -1 >= highest_loss_open * 100 > -2:
-                    print("loss1", pre_previous_item["Time1"])
-                    loss_1_2_percent += 1
-                elif -2 >= highest_loss_open * 100 > -4:
-                    print("loss2", pre_previous_item["Time1"])
-                    loss_2_4_percent += 1
-                elif highest_loss_open * 100 <= -4:
-                    print("loss4", pre_previous_item["Time1"])
-                    loss_more_than_4_percent += 1
-
-                # Classification of highest gain
-                if 1 <= highest_gain_open * 100 < 2:
-                    print("gain1", pre_previous_item["Time1"])
-                    gain_1_2_percent += 1
-                elif 2 <= highest_gain_open * 100 < 4:
-                    print("gain2", pre_previous_item["Time1"])
-                    gain_2_4_percent += 1
-                elif highest_gain_open * 100 >= 4:
-                    print("gain4", pre_previous_item["Time1"])
-                    gain_more_than_4_percent += 1
-                highest_gain_open = 0  # Reset for the next position
-
-                if enable_log:
-                    print(
-                        f"{token} Close {position_type} at {i} | {previous_item['Time1']} Gain %: {gain_per*100:.2f}%. Cap: {capital:.2f}",
-                        "\n",
-                    )
-                continue
-
-            if current_direction == 1 and previous_direction == -1:
-                gain = gain_per * (capital * position_fraction) - fee_rate * (capital * position_fraction)
-                capital += gain
-                position_open = False
-                daily_results[current_date]["gain_loss"] += gain
-                if gain_per > 0:
-                    win += 1
-                    current_loss_streak = 0
-                else:
-                    loss += 1
-                    current_loss_streak += 1
-                    if current_loss_streak > max_loss_streak:
-                        max_loss_streak = current_loss_streak
-
-                if gain_per > max_win:
-                    max_win = gain_per
-                if gain_per < max_loss:
-                    max_loss = gain_per
-                if capital < lowest_capital:
-                    lowest_capital = capital
-
-                # Classification of highest loss
-                if -1 >= highest_loss_open * 100 > -2:
-                    print("loss1", pre_previous_item["Time1"])
-                    loss_1_2_percent += 1
-                elif -2 >= highest_loss_open * 100 > -4:
-                    print("loss2", pre_previous_item["Time1"])
-                    loss_2_4_percent += 1
-                elif highest_loss_open * 100 <= -4:
-                    print("loss4", pre_previous_item["Time1"])
-                    loss_more_than_4_percent += 1
-
-                # Classification of highest gain
-                if 1 <= highest_gain_open * 100 < 2:
-                    print("gain1", pre_previous_item["Time1"])
-                    gain_1_2_percent += 1
-                elif 2 <= highest_gain_open * 100 < 4:
-                    print("gain2", pre_previous_item["Time1"])
-                    gain_2_4_percent += 1
-                elif highest_gain_open * 100 >= 4:
-                    print("gain4", pre_previous_item["Time1"])
-                    gain_more_than_4_percent += 1
-                highest_gain_open = 0  # Reset for the next position
-
-                if enable_log:
-                    print(
-                        f"{token} Close {position_type} at {i}  | {previous_item['Time1']} Gain %: {gain_per*100:.2f}% Cap: {capital:.2f}",
-                        "\n",
-                    )
-
-        # Open position
-        if not position_open:
-            if pre_previous_direction == -1 and previous_direction == 1 and pre_signal != 0:
-                if not check_time(item["Time1"]):
-                    continue
-
-                if not previous_item["real_price_change"] > 0:
-                    continue
-
-
-                entry_price = item["real_price_open"]
-                position_open = True
-                position_type = "long"
-                long_opened += 1
-                highest_gain_open = 0  # Reset for new position
-                if enable_log:
-                    print(f"{token} Open long at {i} {item['Time1']} {pre_signal}")
-            elif pre_previous_direction == 1 and previous_direction == -1  and pre_signal != 0:
-                if not check_time(item["Time1"]):
-                    continue
-
-                if not previous_item["real_price_change"] < 0:
-                    continue
-
-                entry_price = item["real_price_open"]
-                position_open = True
-                position_type = "short"
-                short_opened += 1
-                highest_gain_open = 0  # Reset for new position
-                if enable_log:
-                    print(f"{token} Open short at {i} {item['Time1']} {pre_signal}")
+    entry_mask = data["Time1"].map(check_time).to_numpy(dtype=bool)
+    result = backtest.run_backtest(
+        data,
+        token,
+        initial_capital=2300,
+        leverage=leverage,
+        fee_rate=fee_rate,
+        position_fraction=position_fraction,
+        stop_loss=stop_lost,
+        take_profit=tp,
+        entry_mask=entry_mask,
+    )
 
-    final_capital = capital
-    percentage_gain = ((final_capital - initial_capital) / initial_capital) * 100
+    if enable_log:
+        side_name = {1: "long", -1: "short"}
+        for trade in result["trades"].itertuples():
+            print(f"{token} Open {side_name[trade.side]} at {trade.entry_row} {data['Time1'][trade.entry_row]}")
+            print(
+                f"{token} Close {side_name[trade.side]} at {trade.exit_row} | {data['Time1'][trade.exit_row - 1]} Gain %: {trade.gain_per*100:.2f}%",
+                "\n",
+            )
 
+    win, loss = result["total_win"], result["total_loss"]
     print("Win: ", win)
     print("Loss: ", loss)
-    print("Win Rate: ", win / (win + loss) * 100)
-    print("1% - 2%: ", gain_1_2_percent)
-    print("2% - 4%: ", gain_2_4_percent)
-    print("More than 4%: ", gain_more_than_4_percent)
-
-    daily_results_list = []
-    for date, results in daily_results.items():
-        daily_results_list.append(
-            {
-                "date": date,
-                "capital_start": results["capital_start"],
-                "capital_end": results["capital_start"] + results["gain_loss"],
-                "gain_loss": results["gain_loss"],
-            }
-        )
+    print("Win Rate: ", result["win_rate"])
+    print("1% - 2%: ", result["1-2%"])
+    print("2% - 4%: ", result["2-4%"])
+    print("More than 4%: ", result["more_than_4%"])
 
     tables = []
-    for daily_result in daily_results_list:
+    for daily_result in result["daily"]:
         tables.append(
             [
                 daily_result["date"],
@@ -410,36 +98,8 @@ def run_trading_strategy(token, time_frame):
                 ],
             )
         )
-    daily_win_rate = 0
-
-    for daily_result in daily_results_list:
-        if daily_result["gain_loss"] > 0:
-            daily_win_rate += 1
-
-    daily_win_rate = f"{(daily_win_rate / len(daily_results_list) * 100):.2f}% ({daily_win_rate}/{len(daily_results_list)}) days"
 
-    return {
-        "token": token,
-        "initial_capital": initial_capital,
-        "final_capital": final_capital,
-        "percentage_gain": percentage_gain,
-        "win_rate": win / (win + loss) * 100,
-        "total_win": win,
-        "total_loss": loss,
-        "stop_lost_rate": f"{(stop_lost_rate / (win + loss)) * 100:.2f}% ({stop_lost_rate}/{win+loss})",
-        "daily_win_rate": daily_win_rate,
-        "max_win": max_win * 100,
-        "max_loss": max_loss * 100,
-        "lowest_capital": lowest_capital,
-        "max_loss_streak": max_loss_streak,
-        "1-2%": f"{gain_1_2_percent/(win+loss)*100:.2f}% ({gain_1_2_percent}/{win+loss})",
-        "2-4%": f"{gain_2_4_percent/(win+loss)*100:.2f}% ({gain_2_4_percent}/{win+loss})",
-        "more than 2%": f"{(gain_more_than_4_percent + gain_2_4_percent)/(win+loss)*100:.2f}% ({gain_more_than_4_percent + gain_2_4_percent}/{win+loss})",
-        "more_than_4%": f"{gain_more_than_4_percent/(win+loss)*100:.2f}% ({gain_more_than_4_percent}/{win+loss})",
-        "-1-2%": f"{loss_1_2_percent/(win+loss)*100:.2f}% ({loss_1_2_percent}/{win+loss})",
-        "-2-4%": f"{loss_2_4_percent/(win+loss)*100:.2f}% ({loss_2_4_percent}/{win+loss})",
-        "more_than-4%": f"{loss_more_than_4_percent/(win+loss)*100:.2f}% ({loss_more_than_4_percent}/{win+loss})",
-    }
+    return result
 
 
 with open("tokens.15m.txt", "r") as file:
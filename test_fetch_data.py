@@ -9,6 +9,9 @@ from datetime import datetime, timedelta
 import requests
 import json
 from lib.trend import ema_indicator
+from indicators import batch_chandelier_exit
+import kline_store
+import backfill
 import argparse
 from logger import logger
 from typing import Literal
@@ -412,7 +415,11 @@ def fetch_klines(binance_spot: Spot, PAIR, TIME_FRAME, startTimeMs, endTimeMs, l
     return binance_spot.klines(PAIR, TIME_FRAME, limit=limit, startTime=startTimeMs, endTime=endTimeMs)
 
 
-def fetch_klines_by_date_range(binance_spot: Spot, PAIR, TIME_FRAME, start_date_str=None, end_date_str=None):
+def kline_source(PAIR):
+    return "future" if EXCHANGE == "future" or PAIR in NON_SPOT_PAIRS else "spot"
+
+
+def date_range_ms(start_date_str=None, end_date_str=None):
     if end_date_str:
         end_date = datetime.strptime(end_date_str, "%Y-%m-%d")
     else:
@@ -425,7 +432,32 @@ def fetch_klines_by_date_range(binance_spot: Spot, PAIR, TIME_FRAME, start_date_
 
     startTimeMs = int(start_date.timestamp() * 1000)
     endTimeMs = int((end_date + timedelta(days=1)).timestamp() * 1000)  # Include the end day fully
+    return startTimeMs, endTimeMs
+
+
+def fetch_klines_by_date_range(binance_spot: Spot, PAIR, TIME_FRAME, start_date_str=None, end_date_str=None):
+    startTimeMs, endTimeMs = date_range_ms(start_date_str, end_date_str)
+
+    store = kline_store.get_store()
+    if store is None or not kline_store.supports(TIME_FRAME):
+        return fetch_klines_from_api(binance_spot, PAIR, TIME_FRAME, startTimeMs, endTimeMs)
+
+    # Closed candles are read from the local store, which only downloads the ones it does not have yet
+    interval_ms = get_milliseconds(TIME_FRAME)
+    forming_open = int(time.time() * 1000) // interval_ms * interval_ms
+    closed_end = min(endTimeMs, forming_open)
+    source = kline_source(PAIR)
+    fetch = lambda pair, tf, start, end, limit: fetch_klines(binance_spot, pair, tf, start, end, limit)
+    store.sync(source, PAIR, TIME_FRAME, startTimeMs, closed_end, fetch)
+    klines = kline_store.to_klines(store.read(source, PAIR, TIME_FRAME, startTimeMs, closed_end))
+
+    # The forming candle is never stored
+    if endTimeMs > forming_open:
+        klines.extend(fetch_klines_from_api(binance_spot, PAIR, TIME_FRAME, forming_open, endTimeMs))
+    return klines
+
 
+def fetch_klines_from_api(binance_spot: Spot, PAIR, TIME_FRAME, startTimeMs, endTimeMs):
     klines = []
     current_start_time = startTimeMs
 
@@ -445,6 +477,8 @@ def fetch_klines_by_date_range(binance_spot: Spot, PAIR, TIME_FRAME, start_date_
             next_end_time,
             MAX_KLINES,
         )
+        if not data:
+            break
 
         # Append to the klines list
         klines.extend(data)
@@ -495,16 +529,13 @@ def main(data, TOKEN, TIME_FRAME, PAIR, MONTH, YEAR):
     kline_helper.get_kline_data(data, klines)
     df_data = pd.DataFrame(data)
 
-    SIZE = len(df_data)
-    chandelier_exit = ChandlierExit(size=SIZE, length=LENGTH, multiplier=MULT, use_close=USE_CLOSE)
-    # Calculate ATR
-    df_result = chandelier_exit.calculate_atr(df=df_data)
-
-    # Update ATR to data
-    data["ATR"] = df_result["ATR"].values.tolist()
-
-    # Calculate Chandelier Exit
-    chandelier_exit.calculate_chandelier_exit(data=data)
+    # Calculate ATR and Chandelier Exit for the whole range in one vectorized pass
+    result = batch_chandelier_exit(
+        df_data["High"], df_data["Low"], df_data["Close"], multiplier=MULT, length=LENGTH, use_close=USE_CLOSE
+    )
+    for key in ["ATR", "LongStop", "ShortStop", "LongStopPrev", "ShortStopPrev"]:
+        data[key] = result[key].tolist()
+    data["direction"] = result["Direction"].astype(int).tolist()
 
     print("Exporting CSV")
 
@@ -621,6 +652,12 @@ if __name__ == "__main__":
 
     strategies = [(token, TIME_FRAME, f"{token}USDT") for token in tokens]
 
+    # Download the range of every token first within the weight budget, the processes then read it from the store
+    if kline_store.get_store() is not None and kline_store.supports(TIME_FRAME):
+        start_ms, end_ms = date_range_ms(START_DATE, END_DATE)
+        targets = [(kline_source(pair), pair, TIME_FRAME) for _, _, pair in strategies]
+        backfill.backfill(targets, start_ms, end_ms)
+
     processes = []
     for token, time_frame, pair in strategies:
         process = multiprocessing.Process(target=run_strategy, args=(token, time_frame, pair, MONTH, YEAR))
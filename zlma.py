@@ -1,8 +1,32 @@
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Callable, List, Optional
+
 import numpy as np
 import pandas as pd
-import requests
 from datetime import datetime
+import http_client
+import kline_store
+from candle_buffer import CandleBuffer, append_row
+from kline_stream import interval_to_ms
 from lib.trend import ema_indicator
+from rate_limit import PRIORITY_SIGNAL, get_budget, kline_request_weight
+
+BINANCE_FUTURE_API_URL = os.environ.get("BINANCE_FUTURE_API_URL", "https://fapi.binance.com/fapi/v1/klines")
+
+# Klines behind one chart, enough to warm its indicators up
+CHART_KLINES = 800
+
+# (pair, time frame) series a chart kline cache keeps in memory, least recently charted evicted first
+CHART_CACHE_SERIES = 256
+
+# Most candles a cached series is topped up with (the lowest request weight), larger gaps refetch it whole
+CHART_TOP_UP_LIMIT = 99
+
+# provider(pair, time_frame, limit): the latest `limit` klines, forming candle included
+CandleProvider = Callable[[str, str, int], List]
 
 
 # Helper class to append kline data
@@ -19,20 +43,17 @@ class KlineHelper:
         time1 = datetime.fromtimestamp(int(kline[0]) / 1000).strftime("%Y-%m-%d %H:%M")
         time = int(kline[0]) / 1000
 
-        data["Open"].append(open_p)
-        data["High"].append(high_p)
-        data["Low"].append(low_p)
-        data["Close"].append(close_p)
-        data["Time1"].append(time1)
-        data["Time"].append(time)
-        data["ATR"].append(None)
-        data["LongStop"].append(None)
-        data["ShortStop"].append(None)
-        data["LongStopPrev"].append(None)
-        data["ShortStopPrev"].append(None)
-        data["Direction"].append(None)
-        data["Open_p"].append(open_p)
-        data["Close_p"].append(close_p)
+        row = {
+            "Open": open_p,
+            "High": high_p,
+            "Low": low_p,
+            "Close": close_p,
+            "Time1": time1,
+            "Time": time,
+            "Open_p": open_p,
+            "Close_p": close_p,
+        }
+        append_row(data, row)
 
     def _append_heikin_ashi(self, data, kline, prev_item=None):
         open_p = float(kline[1])
@@ -59,20 +80,17 @@ class KlineHelper:
                 heikin_ashi_high = high_p
                 heikin_ashi_low = low_p
 
-        data["Open"].append(heikin_ashi_open)
-        data["High"].append(heikin_ashi_high)
-        data["Low"].append(heikin_ashi_low)
-        data["Close"].append(heikin_ashi_close)
-        data["Time1"].append(time1)
-        data["Time"].append(time)
-        data["ATR"].append(None)
-        data["LongStop"].append(None)
-        data["ShortStop"].append(None)
-        data["LongStopPrev"].append(None)
-        data["ShortStopPrev"].append(None)
-        data["Direction"].append(None)
-        data["Open_p"].append(open_p)
-        data["Close_p"].append(close_p)
+        row = {
+            "Open": heikin_ashi_open,
+            "High": heikin_ashi_high,
+            "Low": heikin_ashi_low,
+            "Close": heikin_ashi_close,
+            "Time1": time1,
+            "Time": time,
+            "Open_p": open_p,
+            "Close_p": close_p,
+        }
+        append_row(data, row)
 
     def populate(self, data, klines, prev_item=None):
         for kline in klines:
@@ -82,7 +100,7 @@ class KlineHelper:
                 self._append_kline(data, kline)
 
     def export_csv(self, data, filename="atr2.csv"):
-        dfdata = pd.DataFrame(data)
+        dfdata = data.to_frame() if isinstance(data, CandleBuffer) else pd.DataFrame(data)
         # dfdata[["Time1", "ZLSMA_34", "ZLSMA_50"]].to_csv(filename)
         dfdata.to_csv(filename)
 
@@ -102,28 +120,30 @@ def np_shift(array: np.ndarray, offset: int = 1, fill_value=np.nan):
 
 
 def Linreg(source: np.ndarray, length: int, offset: int = 0):
+    """Linear regression value (Pine `linreg`) of the last `length` values; the first `length` rows stay 0."""
+    source = np.asarray(source, dtype=float)
     size = len(source)
     linear = np.zeros(size)
 
-    for i in range(length, size):
-        sumX = 0.0
-        sumY = 0.0
-        sumXSqr = 0.0
-        sumXY = 0.0
-
-        for z in range(length):
-            val = source[i - z]
-            per = z + 1.0
-            sumX += per
-            sumY += val
-            sumXSqr += per * per
-            sumXY += val * per
+    if size > length:
+        # Rolling sums of y and x*y from prefix sums, with x = 1 for the newest value of each window.
+        # The series is de-meaned first to keep the prefix sums small; the slope does not change and
+        # the mean is added back to the intercept.
+        mean = source.mean()
+        y = source - mean
+        index = np.arange(size)
+        csum_y = np.concatenate(([0.0], np.cumsum(y)))
+        csum_iy = np.concatenate(([0.0], np.cumsum(index * y)))
+
+        i = np.arange(length, size)
+        sumY = csum_y[i + 1] - csum_y[i + 1 - length]
+        sumXY = (i + 1) * sumY - (csum_iy[i + 1] - csum_iy[i + 1 - length])
+        sumX = length * (length + 1) / 2.0
+        sumXSqr = length * (length + 1) * (2 * length + 1) / 6.0
 
         slope = (length * sumXY - sumX * sumY) / (length * sumXSqr - sumX * sumX)
         average = sumY / length
-        intercept = average - slope * sumX / length + slope
-
-        linear[i] = intercept
+        linear[length:] = average - slope * sumX / length + slope + mean
 
     if offset != 0:
         linear = np_shift(linear, offset)
@@ -139,6 +159,72 @@ def ZLSMA(source: np.ndarray, length: int, offset: int = 0):
     return zlsma
 
 
+# Sums of the rolling regressions are recomputed from the window after this many appends to stop drift
+LINREG_RESYNC_INTERVAL = 1000
+
+
+class RollingLinreg:
+    """Incremental `Linreg` (offset 0) for streaming candles: O(1) per appended or revised value.
+
+    Returns the same values as `Linreg` at the same row, including 0 for the first `length` rows.
+    """
+
+    def __init__(self, length: int):
+        self.length = length
+        self.window = deque(maxlen=length)
+        self.count = 0
+        self.sumY = 0.0
+        self.sumXY = 0.0
+        self.sumX = length * (length + 1) / 2.0
+        self.sumXSqr = length * (length + 1) * (2 * length + 1) / 6.0
+
+    def _value(self) -> float:
+        if self.count <= self.length:
+            return 0.0
+        slope = (self.length * self.sumXY - self.sumX * self.sumY) / (self.length * self.sumXSqr - self.sumX**2)
+        return self.sumY / self.length - slope * self.sumX / self.length + slope
+
+    def _resync(self) -> None:
+        values = list(self.window)
+        self.sumY = sum(values)
+        self.sumXY = sum(value * (len(values) - z) for z, value in enumerate(values))
+
+    def append(self, value: float) -> float:
+        """Adds a new (forming) value; every older value moves one step further from x = 1."""
+        evicted = self.window[0] if len(self.window) == self.length else 0.0
+        self.sumXY += self.sumY + value - evicted * (self.length + 1)
+        self.sumY += value - evicted
+        self.window.append(value)
+        self.count += 1
+        if self.count % LINREG_RESYNC_INTERVAL == 0:
+            self._resync()
+        return self._value()
+
+    def replace_last(self, value: float) -> float:
+        """Revises the newest value, e.g. on a forming-candle update."""
+        delta = value - self.window[-1]
+        self.window[-1] = value
+        self.sumY += delta
+        self.sumXY += delta
+        return self._value()
+
+
+class RollingZLSMA:
+    """Incremental `ZLSMA` (offset 0), fed one close at a time."""
+
+    def __init__(self, length: int):
+        self.lsma = RollingLinreg(length)
+        self.lsma2 = RollingLinreg(length)
+
+    def append(self, close: float) -> float:
+        lsma = self.lsma.append(close)
+        return 2 * lsma - self.lsma2.append(lsma)
+
+    def replace_last(self, close: float) -> float:
+        lsma = self.lsma.replace_last(close)
+        return 2 * lsma - self.lsma2.replace_last(lsma)
+
+
 def init_data():
     keys = [
         "Open",
@@ -163,14 +249,91 @@ def init_data():
 
 # Fetch historical Kline data from Binance and convert to the data structure
 def fetch_binance_klines(PAIR="BTCUSDT", TIME_FRAME="1h", limit=320):
-    URL = f"https://fapi.binance.com/fapi/v1/klines?symbol={PAIR}&interval={TIME_FRAME}&limit={limit}"
+    # Chart data is only fetched for a signal that is about to be sent
+    budget = get_budget()
+    budget.acquire(kline_request_weight(limit), PRIORITY_SIGNAL)
+    URL = f"{BINANCE_FUTURE_API_URL}?symbol={PAIR}&interval={TIME_FRAME}&limit={limit}"
     headers = {"Content-Type": "application/json"}
-    res = requests.get(URL, headers=headers, timeout=None)
+    res = http_client.get(URL, headers=headers)
+    budget.record_response(res.status_code, res.headers)
     klines = res.json()
 
     return klines
 
 
+def fetch_chart_klines(PAIR, TIME_FRAME, limit=CHART_KLINES):
+    # Closed candles come from the local store, only the missing ones and the forming candle are fetched
+    klines = kline_store.fetch_history(PAIR, TIME_FRAME, limit, True, fetch_binance_klines, PRIORITY_SIGNAL)
+    return klines or fetch_binance_klines(PAIR, TIME_FRAME, limit)
+
+
+class ChartKlineCache:
+    """Latest klines of the charted series, kept in memory so that charting a pair again only fetches the
+    candles opened since the last chart, its forming candle included. Signals of one token keep charting
+    the same higher time frames, so a warm series costs one weight-1 request instead of an 800-candle read.
+
+    Rows are kept as arrays of (open time, open, high, low, close, volume).
+    """
+
+    def __init__(self, fetch_full: CandleProvider = fetch_chart_klines, fetch_latest: CandleProvider = None):
+        self.fetch_full = fetch_full
+        self.fetch_latest = fetch_latest or fetch_binance_klines
+        self._series: "OrderedDict[tuple, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _rows(klines: List) -> np.ndarray:
+        return np.array([[float(value) for value in kline[:6]] for kline in klines]).reshape(-1, 6)
+
+    @staticmethod
+    def _klines(rows: np.ndarray) -> List:
+        return [[int(row[0]), *row[1:]] for row in rows.tolist()]
+
+    def _put(self, key: tuple, rows: np.ndarray) -> None:
+        with self._lock:
+            self._series[key] = rows
+            self._series.move_to_end(key)
+            while len(self._series) > CHART_CACHE_SERIES:
+                self._series.popitem(last=False)
+
+    def _top_up(self, pair: str, time_frame: str, rows: np.ndarray) -> Optional[np.ndarray]:
+        """Refreshes the cached forming candle and appends the newer ones, or None when the gap is too large."""
+        step = interval_to_ms(time_frame)
+        forming_open = int(time.time() * 1000) // step * step
+        missing = (forming_open - int(rows[-1, 0])) // step + 1
+        if missing > CHART_TOP_UP_LIMIT:
+            return None
+        fresh = self._rows(self.fetch_latest(pair, time_frame, max(missing, 1)))
+        if not len(fresh) or fresh[0, 0] > rows[-1, 0]:
+            return None  # The fresh candles do not line up with the cached ones
+        return np.concatenate([rows[rows[:, 0] < fresh[0, 0]], fresh])[-len(rows) :]
+
+    def klines(self, pair: str, time_frame: str, limit: int) -> List:
+        """The latest `limit` klines of the pair, forming candle included (a `CandleProvider`)."""
+        key = (pair.upper(), time_frame)
+        with self._lock:
+            rows = self._series.get(key)
+        if rows is not None and len(rows) >= limit:
+            rows = self._top_up(pair, time_frame, rows)
+        else:
+            rows = None
+        if rows is None:
+            rows = self._rows(self.fetch_full(pair, time_frame, limit))
+        self._put(key, rows)
+        return self._klines(rows[-limit:])
+
+
+_chart_cache: Optional[ChartKlineCache] = None
+
+
+def get_chart_cache() -> ChartKlineCache:
+    """Returns the chart kline cache of this process."""
+    global _chart_cache
+    if _chart_cache is None:
+        _chart_cache = ChartKlineCache()
+    return _chart_cache
+
+
 def calculate_zlsma(data, key="ZLSMA", length=32, offset=0):
     # Extract closing prices from the data structure
     close_prices = np.array(data["Close"], dtype=float)
@@ -206,10 +369,12 @@ def calculate_EMA(data: dict, key="EMA_34", length=34):
     data[key] = ema_values.tolist()
 
 
-def fetch_zlsma(PAIR, TIME_FRAME, view, mode):
-    klines = fetch_binance_klines(PAIR, TIME_FRAME, 800)
+def fetch_zlsma(PAIR, TIME_FRAME, view, mode, provider: CandleProvider = None):
+    # Candles come from `provider`, by default this process's chart kline cache
+    provider = provider or get_chart_cache().klines
+    klines = provider(PAIR, TIME_FRAME, CHART_KLINES)
 
-    data = init_data()
+    data = CandleBuffer(len(klines))
     helper = KlineHelper(mode=mode, exchange="future")
     helper.populate(data, klines)
 
@@ -221,7 +386,7 @@ def fetch_zlsma(PAIR, TIME_FRAME, view, mode):
     calculate_EMA(data, "EMA_34", 34)
     calculate_EMA(data, "EMA_50", 200)
 
-    data_pdf = pd.DataFrame(data)
+    data_pdf = data.to_frame()
 
     # Remove first rows to account for indicator warm-up
     data_pdf = data_pdf.iloc[-view:]